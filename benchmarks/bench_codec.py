@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Throughput of streaming decompression + line splitting per codec.
+#
+#   $ python benchmarks/bench_codec.py [-s SIZE_MB]
+
+import argparse
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.codec
+import slips.parser
+
+
+def sample_data(size):
+    rec = {
+        '@timestamp': '2018-06-01T10:00:00.000Z', 'type': 'dns',
+        'client_ip': '10.0.0.1', 'query': 'www.example.com',
+        'resource': 'www.example.com', 'bytes_in': 33, 'bytes_out': 120,
+    }
+    lines, total, seq = [], 0, 0
+    while total < size:
+        rec['bytes_out'] = seq % 1500
+        rec['client_ip'] = '10.0.{}.{}'.format(seq // 256 % 256, seq % 256)
+        line = (json.dumps(rec) + '\n').encode('utf8')
+        lines.append(line)
+        total += len(line)
+        seq += 1
+
+    return b''.join(lines)
+
+
+def chunked(data, size=1024 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def measure(func):
+    begin = time.perf_counter()
+    lines = func()
+    return time.perf_counter() - begin, lines
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-s', '--size', type=int, default=32, help='MB')
+    args = psr.parse_args()
+
+    data = sample_data(args.size * 1024 * 1024)
+    codecs = [
+        ('gzip', gzip.compress),
+        ('bz2',  bz2.compress),
+        ('xz',   lzma.compress),
+    ]
+    if slips.codec.zstandard:
+        codecs.append(('zstd', slips.codec.zstandard.ZstdCompressor().compress))
+
+    print('{:8s} {:>10s} {:>10s} {:>12s}'.format('codec', 'ratio', 'sec', 'MB/s'))
+    for name, compress in [('plain', lambda x: x)] + codecs:
+        comp = compress(data)
+
+        def run():
+            chunks = slips.codec.decompress(chunked(comp))
+            return sum(1 for _ in slips.parser.split_lines(chunks))
+
+        sec, lines = measure(run)
+        print('{:8s} {:10.2f} {:10.3f} {:12.1f}'.format(
+            name, len(data) / len(comp), sec, len(data) / sec / 1024 / 1024))
+
+    # Baseline: per-line iteration over gzip.open as S3Lines used to do.
+    comp = gzip.compress(data)
+    sec, lines = measure(lambda: sum(1 for _ in gzip.open(io.BytesIO(comp), 'rb')))
+    print('{:8s} {:>10s} {:10.3f} {:12.1f}'.format(
+        'gzip.open', '-', sec, len(data) / sec / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Cost per record of delivering an object to N handlers: parsing it for each
+# handler (as before FanOut), copying events with deepcopy(), copying them
+# with pickle (FanOut) and sharing them with READ_ONLY handlers.
+#
+#   $ python benchmarks/bench_fanout.py [-n LINES] [-H HANDLERS] [-r REPEAT]
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.main
+import slips.parser
+
+import bench_parallel
+import bench_stream
+
+
+CASES = bench_stream.CASES + [
+    ('paloalto', ['s3-stream-lines', 'paloalto'], {},
+     bench_parallel.paloalto_lines),
+    ('paloalto:compact', ['s3-stream-lines', 'paloalto:compact'], {},
+     bench_parallel.paloalto_lines),
+]
+
+
+class Handler:
+    def recv(self, meta, event):
+        pass
+
+
+class Reader(Handler):
+    READ_ONLY = True
+
+
+class DeepCopy(slips.main.FanOut):
+    def recv(self, meta, event):
+        for hdlr, dst, copied in self._targets:
+            if copied:
+                dst.recv(*copy.deepcopy((meta, event)))
+            else:
+                dst.recv(meta, event)
+
+
+def run(read, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        read()
+        sec = time.perf_counter() - begin
+        best = sec if best is None else min(best, sec)
+    return best / lines
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-n', '--lines', type=int, default=50000)
+    psr.add_argument('-H', '--handlers', type=int, default=4)
+    psr.add_argument('-r', '--repeat', type=int, default=3)
+    args = psr.parse_args()
+
+    count = args.handlers
+    print('{:22s} {:>12s} {:>12s} {:>12s} {:>12s}'.format(
+        '', 'reparse us/r', 'deepcopy', 'pickle', 'read-only'))
+    for name, fmt, config, gen in CASES:
+        data = '\n'.join(gen(args.lines)).encode('utf8')
+        stream = slips.parser.Stream(fmt, config)
+
+        def reparse():
+            for _ in range(count):
+                stream.read('bench', 'bench.log', Handler().recv, [data])
+
+        def fanout(cls, hdlr):
+            return lambda: stream.read('bench', 'bench.log',
+                                       cls([hdlr() for _ in range(count)]).recv,
+                                       [data])
+
+        costs = [run(reparse, args.lines, args.repeat),
+                 run(fanout(DeepCopy, Handler), args.lines, args.repeat),
+                 run(fanout(slips.main.FanOut, Handler), args.lines, args.repeat),
+                 run(fanout(slips.main.FanOut, Reader), args.lines, args.repeat)]
+        print('{:22s} {:12.2f} {:12.2f} {:12.2f} {:12.2f}'.format(
+            name, *[x * 1e6 for x in costs]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Throughput of Json parser backends on NDJSON formats, decoding lines and
+# then running the format parser.
+#
+#   $ python benchmarks/bench_json.py [-n LINES] [-b BATCH_SIZE]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.parser
+
+
+class Sink(slips.parser.Parser):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def recv(self, meta, data):
+        self.count += 1
+
+    def recv_batch(self, metas, records):
+        self.count += len(records)
+
+
+def packetbeat(i):
+    return {'@timestamp': '2018-06-01T10:{:02d}:{:02d}.000Z'.format(i // 60 % 60, i % 60),
+            'type': 'dns', 'client_ip': '10.0.0.{}'.format(i % 256),
+            'query': 'class IN, type A, example{}.com'.format(i),
+            'dns': {'id': i, 'op_code': 'QUERY', 'response_code': 'NOERROR',
+                    'answers': [{'class': 'IN', 'data': '93.184.216.34',
+                                 'name': 'example.com', 'ttl': 300, 'type': 'A'}]},
+            'beat': {'hostname': 'ip-10-0-0-1', 'name': 'packetbeat',
+                     'version': '6.2.4'},
+            'bytes_in': 29, 'bytes_out': 45, 'responsetime': 12}
+
+
+def auditbeat(i):
+    return {'@timestamp': '2018-06-01T10:{:02d}:{:02d}.000Z'.format(i // 60 % 60, i % 60),
+            'event': {'action': 'executed', 'category': 'user-login',
+                      'module': 'auditd'},
+            'process': {'pid': str(i), 'ppid': '1', 'title': 'sshd: user [priv]',
+                        'exe': '/usr/sbin/sshd', 'name': 'sshd'},
+            'auditd': {'sequence': i, 'result': 'success', 'session': '3',
+                       'summary': {'actor': {'primary': 'user', 'secondary': 'root'},
+                                   'object': {'primary': '/usr/bin/id',
+                                              'type': 'file'},
+                                   'how': '/usr/bin/id'}},
+            'user': {'auid': '1000', 'uid': '0', 'name_map': {'uid': 'root'}}}
+
+
+def falcon(i):
+    return {'name': 'DnsRequestV4', 'aip': '203.0.113.{}'.format(i % 256),
+            'aid': 'a1b2c3d4e5f6', 'event_platform': 'Win',
+            'timestamp': str(1527847200000 + i), 'DomainName': 'example.com',
+            'RequestType': '1', 'ContextProcessId': str(i * 7),
+            'id': '4b7c3f2a-{:08x}'.format(i), 'cid': 'ffffffffffffffff'}
+
+
+FORMATS = [
+    ('packetbeat', packetbeat, slips.parser.PacketBeat),
+    ('auditbeat', auditbeat, slips.parser.AuditBeat),
+    ('falcon', falcon, slips.parser.FalconEventLog),
+]
+
+
+def run(backend, builder, lines, batch_size):
+    js = slips.parser.Json()
+    js.set_arg(backend)
+    psr = builder()
+    sink = Sink()
+    js.pipe(psr)
+    psr.pipe(sink)
+
+    begin = time.perf_counter()
+    for i in range(0, len(lines), batch_size):
+        block = lines[i:i + batch_size]
+        js.recv_batch([slips.parser.MetaData(timestamp=0) for _ in block],
+                      [{'message': x} for x in block])
+    sec = time.perf_counter() - begin
+
+    assert sink.count == len(lines)
+    return len(lines) / sec
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-n', '--lines', type=int, default=100000)
+    psr.add_argument('-b', '--batch-size', type=int, default=1000)
+    args = psr.parse_args()
+
+    backends = [k for k, v in slips.parser.Json.BACKENDS.items() if v]
+    for name, gen, builder in FORMATS:
+        lines = [json.dumps(gen(i)).encode('utf8') for i in range(args.lines)]
+        for backend in backends:
+            print('{:12s} {:8s} {:10.0f} lines/sec'.format(
+                name, backend, run(backend, builder, lines, args.batch_size)))
+
+
+if __name__ == '__main__':
+    main()
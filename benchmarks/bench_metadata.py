@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# Time and allocation per record of MetaData creation and copy.
+#
+#   $ python benchmarks/bench_metadata.py [-n RECORDS]
+
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.parser
+
+
+class LegacyMetaData:
+    # MetaData before __slots__, kept for comparison.
+    def __init__(self, orig=None):
+        attrs = [
+            ('tag', None),
+            ('timestamp', int(datetime.datetime.now().timestamp())),
+            ('source', {}),
+            ('message', None),
+        ]
+
+        for attr_name, default in attrs:
+            if orig:
+                value = getattr(orig, attr_name)
+                if isinstance(value, set):
+                    value = value.copy()
+            else:
+                value = default
+
+            setattr(self, attr_name, value)
+
+    def copy(self):
+        return LegacyMetaData(self)
+
+
+def measure(label, create, n):
+    begin = time.perf_counter()
+    for _ in range(n):
+        create()
+    sec = time.perf_counter() - begin
+
+    tracemalloc.start()
+    keep = [create() for _ in range(n)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+
+    print('{:28s} {:10.1f} ns/rec {:8.1f} byte/rec'.format(
+        label, sec / n * 1e9, size / n))
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-n', '--records', type=int, default=200000)
+    args = psr.parse_args()
+
+    now = int(time.time())
+    legacy = LegacyMetaData()
+    meta = slips.parser.MetaData(timestamp=now)
+
+    measure('legacy MetaData()', LegacyMetaData, args.records)
+    measure('legacy copy()', legacy.copy, args.records)
+    measure('MetaData()', slips.parser.MetaData, args.records)
+    measure('MetaData(timestamp=now)',
+            lambda: slips.parser.MetaData(timestamp=now), args.records)
+    measure('copy()', meta.copy, args.records)
+
+
+if __name__ == '__main__':
+    main()
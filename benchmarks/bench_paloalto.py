@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Throughput of PaloAlto parser per record, per block, with compact rows and
+# with projection of a few fields.
+#
+#   $ python benchmarks/bench_paloalto.py [-n LINES] [-b BATCH_SIZE]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.parser
+
+
+class Sink(slips.parser.Parser):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def recv(self, meta, data):
+        self.count += 1
+
+    def recv_batch(self, metas, records):
+        self.count += len(records)
+
+
+def sample_lines(n):
+    base = ['1', '2018/06/01 10:00:00', '001801000000', 'TRAFFIC', 'end', '1',
+            '2018/06/01 10:00:00', '10.0.0.1', '192.168.0.1', '0.0.0.0',
+            '0.0.0.0', 'rule1', '', '', 'ssl', 'vsys1', 'trust', 'untrust',
+            'ethernet1/1', 'ethernet1/2', 'forward', '2018/06/01 10:00:00',
+            '0', '1', '50000', '443', '0', '0', '0x0', 'tcp', 'allow', '1000',
+            '400', '600', '10', '2018/06/01 09:59:00', '1', 'any', '0', '1',
+            '0x0', '10.0.0.0-10.255.255.255', 'JP', '0', '5', '5', 'tcp-fin',
+            '0', '0', '0', '0', '', 'PA-1', 'from-policy']
+    lines = []
+    for i in range(n):
+        base[22] = str(i)
+        base[35] = '2018/06/01 09:{:02d}:{:02d}'.format(i // 60 % 60, i % 60)
+        lines.append(','.join(base))
+    return lines
+
+
+def run(label, parser, lines, batch_size, tail=None):
+    sink = Sink()
+    (tail or parser).pipe(sink)
+
+    begin = time.perf_counter()
+    if batch_size:
+        for i in range(0, len(lines), batch_size):
+            block = lines[i:i + batch_size]
+            parser.recv_batch([slips.parser.MetaData(timestamp=0) for _ in block],
+                              [{'message': x} for x in block])
+    else:
+        for line in lines:
+            parser.recv(slips.parser.MetaData(timestamp=0), {'message': line})
+    sec = time.perf_counter() - begin
+
+    assert sink.count == len(lines)
+    print('{:24s} {:10.0f} lines/sec'.format(label, len(lines) / sec))
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-n', '--lines', type=int, default=100000)
+    psr.add_argument('-b', '--batch-size', type=int, default=1000)
+    args = psr.parse_args()
+
+    lines = sample_lines(args.lines)
+    compact = slips.parser.PaloAlto()
+    compact.set_arg('compact')
+
+    run('per record', slips.parser.PaloAlto(), lines, 0)
+    run('batch', slips.parser.PaloAlto(), lines, args.batch_size)
+    run('batch + compact', compact, lines, args.batch_size)
+
+    lazy = slips.parser.PaloAlto()
+    lazy.set_lazy(True)
+    projection = slips.parser.Projection(
+        ['Source address', 'Destination address', 'Destination Port',
+         'Action', 'message'], slips.parser.PaloAlto.DERIVED)
+    lazy.pipe(projection)
+    run('batch + projection', lazy, lines, args.batch_size, projection)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Records per second of parsing an object in the main process and in worker
+# processes (the "parallel" clause) with 1..N workers.
+#
+#   $ python benchmarks/bench_parallel.py [-n LINES] [-w WORKERS] [-r REPEAT]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.parser
+
+import bench_stream
+
+
+def paloalto_lines(n):
+    row = ('1,2018/06/01 10:00:00,001801000000,TRAFFIC,end,1,'
+           '2018/06/01 10:00:00,10.0.0.{},192.168.0.1,0.0.0.0,0.0.0.0,rule1,,,'
+           'ssl,vsys1,trust,untrust,ethernet1/1,ethernet1/2,forward,'
+           '2018/06/01 10:00:00,{},1,50000,443,0,0,0x0,tcp,allow,1000,400,600,'
+           '10,2018/06/01 09:59:00,1,any,0,1,0x0,10.0.0.0-10.255.255.255,JP,0,'
+           '5,5,tcp-fin,0,0,0,0,,PA-1,from-policy')
+    return [row.format(i % 256, i) for i in range(n)]
+
+
+CASES = [
+    ('paloalto', ['s3-stream-lines', 'paloalto'], {}, paloalto_lines),
+    ('paloalto + projection', ['s3-stream-lines', 'paloalto'],
+     {'projection': ['Source address', 'Destination Port', 'Action']},
+     paloalto_lines),
+    ('kea', ['s3-stream-lines', 'kea'], {}, bench_stream.kea_lines),
+]
+
+
+def run(stream, data, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        count = [0]
+
+        def callback(meta, ev):
+            count[0] += 1
+
+        begin = time.perf_counter()
+        stream.read('bench', 'bench.log', callback, [data])
+        sec = time.perf_counter() - begin
+        assert count[0] == lines
+        best = sec if best is None else min(best, sec)
+    return lines / best
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-n', '--lines', type=int, default=200000)
+    psr.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    psr.add_argument('-r', '--repeat', type=int, default=3)
+    args = psr.parse_args()
+
+    print('CPUs: {}'.format(os.cpu_count()))
+    print('{:22s} {:10s} {:>8s} {:>12s}'.format('', 'order', 'workers', 'records/s'))
+    for name, fmt, base, gen in CASES:
+        data = '\n'.join(gen(args.lines)).encode('utf8')
+        rate = run(slips.parser.Stream(fmt, base), data, args.lines, args.repeat)
+        print('{:22s} {:10s} {:>8s} {:12.0f}'.format(name, 'in-process', '-', rate))
+
+        for order in ['ordered', 'relaxed']:
+            for workers in range(1, args.workers + 1):
+                config = dict(base, parallel= {'workers': workers, 'order': order,
+                                       'min_lines': 0})
+                rate = run(slips.parser.Stream(fmt, config), data, args.lines,
+                           args.repeat)
+                print('{:22s} {:10s} {:8d} {:12.0f}'.format(
+                    name, order, workers, rate))
+
+
+if __name__ == '__main__':
+    main()
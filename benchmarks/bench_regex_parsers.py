@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Throughput of line format parsers (Kea, Syslog and Falcon). Give a parser
+# module of another revision to compare with, e.g.
+#
+#   $ git show <rev>:slips/parser.py > /tmp/old_parser.py
+#   $ python benchmarks/bench_regex_parsers.py --baseline /tmp/old_parser.py
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.parser
+
+
+KEA_EVENTS = [
+    ('DHCP4_LEASE_ALLOC', 'lease 10.0.{}.{} has been allocated for 4000 seconds'),
+    ('DHCP4_INIT_REBOOT', 'client is in INIT-REBOOT state and requests address 10.0.{}.{}'),
+    ('DHCP4_LEASE_ADVERT', 'lease 10.0.{}.{} will be advertised'),
+]
+
+
+def kea_lines(n):
+    lines = []
+    for i in range(n):
+        event, msg = KEA_EVENTS[i % len(KEA_EVENTS)]
+        lines.append('2018-06-01 10:{:02d}:{:02d}.123 INFO  [kea-dhcp4.leases/1234] '
+                     '{} [hwtype=1 00:11:22:33:{:02x}:{:02x}], cid=[no info], '
+                     'tid=0x{:x}: {}'.format(i // 60 % 60, i % 60, event,
+                                             i // 256 % 256, i % 256, i,
+                                             msg.format(i // 256 % 256, i % 256)))
+    return [{'message': x} for x in lines]
+
+
+def syslog_lines(n):
+    # Days 1-9 are padded by space or not, as both are seen in the wild.
+    return [{'message': 'Nov {} 06:{:02d}:{:02d} ip-172-31-7-118 sshd[{}]: '
+             'Accepted publickey for ec2-user from 10.0.0.1 port {} ssh2'
+             ''.format(('{:2d}' if i % 2 else '{}').format(i % 27 + 1),
+                       i // 60 % 60, i % 60, i, i % 65536)}
+            for i in range(n)]
+
+
+def falcon_lines(n):
+    return [{'name': 'DnsRequest', 'aip': '203.0.113.1',
+             'DomainName': 'example.com', 'timestamp': str(1527814800000 + i)}
+            for i in range(n)]
+
+
+def load_module(path):
+    spec = importlib.util.spec_from_file_location('baseline_parser', path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def run(mod, name, records, repeat):
+    return max(run_once(mod, name, records) for _ in range(repeat))
+
+
+def run_once(mod, name, records):
+    count = [0]
+
+    class Sink(mod.Parser):
+        def recv(self, meta, data):
+            count[0] += 1
+
+    psr = getattr(mod, name)()
+    psr.pipe(Sink())
+
+    # Copy records because parsers update them in place.
+    records = [dict(x) for x in records]
+    begin = time.perf_counter()
+    for data in records:
+        psr.recv(mod.MetaData(), data)
+    sec = time.perf_counter() - begin
+
+    assert count[0] == len(records)
+    return len(records) / sec
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-n', '--lines', type=int, default=100000)
+    psr.add_argument('-r', '--repeat', type=int, default=3)
+    psr.add_argument('--baseline', help='path to parser.py to compare with')
+    args = psr.parse_args()
+
+    baseline = load_module(args.baseline) if args.baseline else None
+    cases = [('Kea', kea_lines(args.lines)),
+             ('Syslog', syslog_lines(args.lines)),
+             ('FalconEventLog', falcon_lines(args.lines))]
+
+    for name, records in cases:
+        current = run(slips.parser, name, records, args.repeat)
+        line = '{:16s} {:10.0f} lines/sec'.format(name, current)
+        if baseline:
+            before = run(baseline, name, records, args.repeat)
+            line += '  (baseline {:.0f} lines/sec, x{:.2f})'.format(
+                before, current / before)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Cost of building a Stream and of running records through it with and
+# without fused parsers.
+#
+#   $ python benchmarks/bench_stream.py [-n LINES] [-c COMPILES] [-r REPEAT]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import slips.parser
+
+import bench_json
+import bench_regex_parsers
+
+
+def kea_lines(n):
+    return [x['message'] for x in bench_regex_parsers.kea_lines(n)]
+
+
+def json_lines(gen):
+    return lambda n: [json.dumps(gen(i)) for i in range(n)]
+
+
+CASES = [
+    ('kea', ['s3-stream-lines', 'kea'], {}, kea_lines),
+    ('packetbeat', ['s3-stream-lines', 'json', 'packetbeat'], {},
+     json_lines(bench_json.packetbeat)),
+    ('packetbeat + filter', ['s3-stream-lines', 'json', 'packetbeat'],
+     {'filter': {'fields': {'type': 'dns'}},
+      'projection': ['client_ip', 'message']},
+     json_lines(bench_json.packetbeat)),
+]
+
+
+def compile_cost(fmt, config, count):
+    begin = time.perf_counter()
+    for _ in range(count):
+        slips.parser.Stream(fmt, config)
+    return (time.perf_counter() - begin) / count
+
+
+def record_cost(streams, data, lines, repeat):
+    # Run the streams in turn, so that both see the same noise.
+    best = [None] * len(streams)
+    for _ in range(repeat):
+        for i, stream in enumerate(streams):
+            count = [0]
+
+            def callback(meta, ev):
+                count[0] += 1
+
+            begin = time.perf_counter()
+            stream.read('bench', 'bench.log', callback, [data])
+            sec = time.perf_counter() - begin
+            assert count[0] == lines
+            best[i] = sec if best[i] is None else min(best[i], sec)
+    return [x / lines for x in best]
+
+
+def main():
+    psr = argparse.ArgumentParser()
+    psr.add_argument('-n', '--lines', type=int, default=100000)
+    psr.add_argument('-c', '--compiles', type=int, default=1000)
+    psr.add_argument('-r', '--repeat', type=int, default=5)
+    args = psr.parse_args()
+
+    print('{:22s} {:>10s} {:>12s} {:>12s}'.format(
+        '', 'build us', 'unfused us/r', 'fused us/r'))
+    for name, fmt, config, gen in CASES:
+        data = '\n'.join(gen(args.lines)).encode('utf8')
+        build = compile_cost(fmt, config, args.compiles)
+        unfused, fused = record_cost([slips.parser.Stream(fmt, config, fused=False),
+                                      slips.parser.Stream(fmt, config)],
+                                     data, args.lines, args.repeat)
+        print('{:22s} {:10.1f} {:12.2f} {:12.2f}'.format(
+            name, build * 1e6, unfused * 1e6, fused * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,7 @@ import datetime
 
 from . import sam
 import slips.main
+import slips.utils
 
 
 logger = logging.getLogger()
@@ -260,6 +261,9 @@ class RunLocal(Job):
             'HANDLER_PATH': meta['handler']['path'],
             'HANDLER_ARGS': json.dumps(hdlr_args),
             'BUCKET_MAPPING': json.dumps(meta['bucket_mapping']),
+            'PREFETCH_DEPTH': str(meta['handler'].get('prefetch_depth', 1)),
+            'HANDLER_BATCH': json.dumps(meta['handler'].get('batch', {})),
+            'HANDLER_ASYNC': json.dumps(meta['handler'].get('async', {})),
         }
         slips.main.main(test_args, event)
         return
@@ -403,6 +407,21 @@ class Limit(Job):
 
     
 class Deploy(Job):
+    @staticmethod
+    def validate(meta):
+        # Report prefixes of bucket_mapping and routing that would be
+        # ambiguous or never used at runtime.
+        errors, warnings = slips.utils.check_mapping(meta['bucket_mapping'])
+        errors += slips.utils.check_routing(meta.get('routing', []))
+        errors += slips.parser.Quarantine.check_mapping(meta['bucket_mapping'])
+
+        for msg in warnings:
+            logger.warning(msg)
+        for msg in errors:
+            logger.error(msg)
+        if errors:
+            raise Exception('Invalid config: {}'.format('; '.join(errors)))
+
     @staticmethod
     def configure(yml_file, pkg_file, code_bucket, code_prefix):
         sam_fd, sam_file = tempfile.mkstemp(suffix='.yml')
@@ -464,6 +483,7 @@ class Deploy(Job):
     
     def exec(self, args, meta):
         logger.info('Bulding stack: %s', meta['stack_name'])
+        Deploy.validate(meta)
         
         given_pkg_file = args.package_file
         pkg_file = given_pkg_file if given_pkg_file else Package().exec(args, meta)
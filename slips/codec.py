@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import bz2
+import itertools
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CodecError(Exception):
+    pass
+
+
+def _gzip():
+    return zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+
+def _bz2():
+    return bz2.BZ2Decompressor()
+
+
+def _xz():
+    return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+
+
+def _lzma():
+    return lzma.LZMADecompressor(format=lzma.FORMAT_ALONE)
+
+
+def _zstd():
+    if not zstandard:
+        raise CodecError('zstd requires "zstandard" module')
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+DECOMPRESSORS = {
+    'gzip': _gzip,
+    'bz2':  _bz2,
+    'xz':   _xz,
+    'lzma': _lzma,
+    'zstd': _zstd,
+}
+
+ALIASES = {
+    'gz':    'gzip',
+    'bzip2': 'bz2',
+    'zst':   'zstd',
+}
+
+MAGIC = [
+    (b'\x1f\x8b',             'gzip'),
+    (b'BZh',                  'bz2'),
+    (b'\xfd7zXZ\x00',         'xz'),
+    (b'\x28\xb5\x2f\xfd',     'zstd'),
+]
+MAGIC_LEN = max(len(m) for m, _ in MAGIC)
+
+
+def detect(head):
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+
+    return 'plain'
+
+
+def _decompress(chunks, factory):
+    # Members (gzip), streams (bz2, xz) and frames (zstd) can be
+    # concatenated, so restart the decompressor whenever one is finished.
+    # Zero padding between members is skipped as gzip module does.
+    dec = factory()
+    started = False
+    boundary = False
+
+    for chunk in chunks:
+        while chunk:
+            if boundary:
+                chunk = chunk.lstrip(b'\x00')
+                if not chunk:
+                    break
+                boundary = False
+
+            started = True
+            data = dec.decompress(chunk)
+            if data:
+                yield data
+
+            chunk = b''
+            if getattr(dec, 'eof', False):
+                chunk = dec.unused_data
+                dec = factory()
+                started = False
+                boundary = True
+
+    if hasattr(dec, 'flush'):
+        data = dec.flush()
+        if data:
+            yield data
+
+    if started and getattr(dec, 'eof', True) is False:
+        raise CodecError('Compressed data is truncated')
+
+
+def _closing(chunks, source):
+    # Close the source (e.g. a generator reading S3 body) as soon as the
+    # consumer closes the decompressed chunks, not when it is collected.
+    try:
+        yield from chunks
+    finally:
+        if hasattr(source, 'close'):
+            source.close()
+
+
+def decompress(chunks, codec=None):
+    # Return a generator of decompressed chunks. codec is a name in
+    # DECOMPRESSORS (or ALIASES), 'plain', or None/'auto' to detect it by
+    # magic bytes of the data.
+    source = chunks
+    chunks = iter(chunks)
+    codec = ALIASES.get(codec, codec)
+
+    if codec in (None, '', 'auto'):
+        head = b''
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= MAGIC_LEN:
+                break
+
+        codec = detect(head)
+        chunks = itertools.chain([head], chunks)
+
+    if codec == 'plain':
+        return _closing(chunks, source)
+
+    factory = DECOMPRESSORS.get(codec)
+    if not factory:
+        raise CodecError('Unsupported codec "{}"'.format(codec))
+
+    return _closing(_decompress(chunks, factory), source)
+
+
+def read_file(fpath, size=1024 * 1024):
+    with open(fpath, 'rb') as fd:
+        while True:
+            chunk = fd.read(size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import logging
+import os
+import re
+import threading
+
+import slips.codec
+import slips.fetcher
+import slips.parser
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_LINES = 20
+
+# Decisions per (bucket, prefix) kept in a warm container.
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+_LOADED = set()
+
+
+class DetectError(Exception):
+    pass
+
+
+def _has(*keys):
+    return lambda rec: all(k in rec for k in keys)
+
+
+def _gsuite_login(rec):
+    return rec.get('id', {}).get('applicationName') == 'login'
+
+
+# Parsers for JSON records, checked in order. All sampled records must match.
+JSON_RULES = [
+    ('falcon-detection',    _has('behaviors', 'created_timestamp')),
+    ('falcon',              _has('aip', 'name', 'timestamp')),
+    ('aws-waf',             _has('terminatingRuleId', 'httpRequest')),
+    ('auditbeat',           _has('@timestamp', 'auditd')),
+    ('packetbeat',          _has('@timestamp', 'type')),
+    ('azure-ad-audit',      _has('activityDate')),
+    ('azure-ad-event',      _has('signinDateTime')),
+    ('azure-ad-risk-event', _has('riskEventDateTime')),
+    ('g-suite-login',       _gsuite_login),
+    ('guardduty',           _has('schemaVersion', 'accountId', 'service', 'severity')),
+]
+
+
+def _paloalto(line):
+    row = next(csv.reader([line]), [])
+    layout = slips.parser.PaloAlto.LAYOUTS.get(row[3] if len(row) > 3 else None)
+    return layout is not None and len(row) == layout.size
+
+
+def _regex(builder):
+    def match(line):
+        try:
+            return builder.match(line) is not None
+        except slips.parser.ParseError:
+            return False
+    return match
+
+
+def _fluentd(line):
+    row = line.split('\t')
+    return len(row) == 3 and row[2].startswith('{')
+
+
+# Parsers for text lines, checked in order.
+LINE_RULES = [
+    ('paloalto',     _paloalto),
+    ('kea',          _regex(slips.parser.Kea)),
+    ('syslog',       _regex(slips.parser.Syslog)),
+    ('fluentd-json', _fluentd),
+]
+
+CLOUDTRAIL_DOC = re.compile(r'\s*\{\s*"Records"\s*:\s*\[')
+
+
+def sample(s3_bucket, s3_key, size=SAMPLE_SIZE):
+    # Return decompressed head of the object and True if it is the whole.
+    s3 = slips.fetcher.s3_client()
+    length = s3.head_object(Bucket=s3_bucket, Key=s3_key)['ContentLength']
+    if length == 0:
+        raise DetectError('Empty object {}/{}'.format(s3_bucket, s3_key))
+
+    res = s3.get_object(Bucket=s3_bucket, Key=s3_key,
+                        Range='bytes=0-{}'.format(min(length, size) - 1))
+    raw = res['Body'].read()
+
+    chunks, whole = [], length <= size
+    try:
+        for chunk in slips.codec.decompress([raw]):
+            chunks.append(chunk)
+    except (slips.codec.CodecError, EOFError):
+        whole = False  # cut in the middle of compressed data
+    return b''.join(chunks), whole
+
+
+class _Sink(slips.parser.Parser):
+    def recv(self, meta, data):
+        pass
+
+    def recv_batch(self, metas, records):
+        pass
+
+
+def _verify(name, metas, records):
+    # Run the parser over the sample to make sure that it accepts them.
+    task = slips.parser.Stream.FUCTORY_MAP[name]()
+    task.pipe(_Sink())
+    try:
+        task.recv_batch(metas, records)
+    except Exception as e:
+        logger.info('%s does not accept sample: %s', name, e)
+        return False
+    return True
+
+
+def guess(head: bytes, whole: bool):
+    # Return format list for the decompressed head of an object.
+    text = head.decode('utf8', errors='replace')
+    if CLOUDTRAIL_DOC.match(text):
+        return ['s3-json-array', 'cloudtrail']
+
+    lines = text.split('\n')
+    if not whole and len(lines) > 1:
+        lines.pop()  # may be cut in the middle
+    lines = [x.rstrip() for x in lines if x.strip()][:SAMPLE_LINES]
+    if not lines:
+        raise DetectError('No line in sample')
+
+    try:
+        records = [json.loads(x) for x in lines]
+    except ValueError:
+        records = None
+
+    if records is not None and all(isinstance(x, dict) for x in records):
+        for name, match in JSON_RULES:
+            if all(match(x) for x in records) and _verify(
+                    name, [slips.parser.MetaData() for _ in records],
+                    [dict(x) for x in records]):
+                return ['s3-stream-lines', 'json', name]
+        return ['s3-stream-lines', 'json']
+
+    for name, match in LINE_RULES:
+        if all(match(x) for x in lines) and _verify(
+                name, [slips.parser.MetaData() for _ in lines],
+                [{'message': x} for x in lines]):
+            return ['s3-stream-lines', name]
+
+    raise DetectError('Unknown format: {}'.format(lines[0][:256]))
+
+
+def _load(path):
+    if path.startswith('s3://'):
+        bucket, _, key = path[len('s3://'):].partition('/')
+        s3 = slips.fetcher.s3_client()
+        try:
+            body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        except s3.exceptions.NoSuchKey:
+            return {}
+    elif os.path.exists(path):
+        with open(path, 'rb') as fd:
+            body = fd.read()
+    else:
+        return {}
+
+    return json.loads(body.decode('utf8'))
+
+
+def _save(path, decisions):
+    body = json.dumps(decisions, indent=2, sort_keys=True).encode('utf8')
+    if path.startswith('s3://'):
+        bucket, _, key = path[len('s3://'):].partition('/')
+        slips.fetcher.s3_client().put_object(Bucket=bucket, Key=key, Body=body)
+    else:
+        with open(path, 'wb') as fd:
+            fd.write(body)
+
+
+def detect_format(s3_bucket, s3_key, config: dict):
+    # Format list for an object of bucket_mapping entry that has "auto"
+    # format. A decision is cached per (bucket, prefix of the entry) and
+    # saved to "detect_cache" (local path or s3://bucket/key) if given.
+    prefix = config.get('prefix', '')
+    path = config.get('detect_cache')
+    name = '{}/{}'.format(s3_bucket, prefix)
+
+    with _CACHE_LOCK:
+        if path and path not in _LOADED:
+            for k, fmt in _load(path).items():
+                _CACHE.setdefault(tuple(k.split('/', 1)), fmt)
+            _LOADED.add(path)
+
+        fmt = _CACHE.get((s3_bucket, prefix))
+    if fmt:
+        return fmt
+
+    head, whole = sample(s3_bucket, s3_key)
+    fmt = guess(head, whole)
+    logger.info('Detected format of %s: %s (by %s)', name, fmt, s3_key)
+
+    with _CACHE_LOCK:
+        _CACHE[(s3_bucket, prefix)] = fmt
+        if path:
+            decisions = _load(path)
+            decisions[name] = fmt
+            _save(path, decisions)
+    return fmt
+
+
+def forget(s3_bucket, prefix=None, path=None):
+    # Drop decisions of the bucket (or the prefix of it), also from the
+    # detect_cache file at path, so that the format is detected again.
+    def match(bucket, pfx):
+        return bucket == s3_bucket and (prefix is None or pfx == prefix)
+
+    with _CACHE_LOCK:
+        for key in [k for k in _CACHE if match(*k)]:
+            del _CACHE[key]
+
+        if path:
+            decisions = _load(path)
+            names = [k for k in decisions if match(*k.split('/', 1))]
+            if names:
+                for name in names:
+                    del decisions[name]
+                _save(path, decisions)
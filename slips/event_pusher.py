@@ -12,22 +12,29 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def routing(ev, policies, routes):
-    for policy in policies:
-        if 'bucket' in policy and policy['bucket'] != ev['bucket_name']:
-            continue
-        if 'prefix' in policy and not ev['object_key'].startswith(policy['prefix']):
-            continue
+# Routing policy compiled once per container, as (JSON, utils.Router).
+_ROUTER = None
+
+
+def get_router(policy_json):
+    global _ROUTER
+    if _ROUTER is None or _ROUTER[0] != policy_json:
+        _ROUTER = (policy_json, utils.Router(json.loads(policy_json)))
+    return _ROUTER[1]
+
 
-        if policy['dest'] not in routes:
-            logger.error('No destination {} of {}'.format(policy['dest'], policy))
-            logger.error('RouteMap: {}'.format(routes))
-            raise Exception('No destination {}'.format(policy['dest']))
+def routing(ev, router, routes):
+    policy = router.route(ev['bucket_name'], ev['object_key'])
+    if policy is None:
+        raise Exception('No route for {}'.format(ev))
 
-        logger.info('matched %s and %s', policy, ev)
-        return routes[policy['dest']]
+    if policy['dest'] not in routes:
+        logger.error('No destination {} of {}'.format(policy['dest'], policy))
+        logger.error('RouteMap: {}'.format(routes))
+        raise Exception('No destination {}'.format(policy['dest']))
 
-    raise Exception('No route for {}'.format(ev))
+    logger.info('matched %s and %s', policy, ev)
+    return routes[policy['dest']]
 
 
 def main(args, event):
@@ -39,13 +46,13 @@ def main(args, event):
         'slow': args['DST_KINESIS_STREAM_SLOW'],
         'drop': None,
     }
-    policies = json.loads(args['ROUTING_POLICY'])
-    logger.debug('Routing policy: %s', policies)
+    router = get_router(args['ROUTING_POLICY'])
+    logger.debug('Routing policy: %s', args['ROUTING_POLICY'])
     
     event_queue = collections.defaultdict(list)
     results = collections.defaultdict(int)
     for ev in utils.extract_s3_event(event):
-        dest = routing(ev, policies, routes)
+        dest = routing(ev, router, routes)
         if not dest:
             logger.debug('Drop route, ignore')
             continue
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import concurrent.futures
+import itertools
+import logging
+import queue
+import threading
+
+import boto3
+import boto3.s3.transfer
+import botocore.exceptions
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Creating clients from the default session is not thread safe.
+_CLIENT_LOCK = threading.Lock()
+
+
+class ObjectChangedError(Exception):
+    pass
+
+
+def s3_client():
+    with _CLIENT_LOCK:
+        return boto3.client('s3')
+
+
+class Fetcher:
+    DEFAULT_CONFIG = {
+        'threshold':   64 * 1024 * 1024,
+        'chunk_size':  8 * 1024 * 1024,
+        'parallelism': 1,
+        'read_size':   1024 * 1024,
+    }
+
+    def __init__(self, config=None):
+        conf = dict(Fetcher.DEFAULT_CONFIG)
+        conf.update(config or {})
+
+        self._threshold =   int(conf['threshold'])
+        self._chunk_size =  int(conf['chunk_size'])
+        self._parallelism = int(conf['parallelism'])
+        self._read_size =   int(conf['read_size'])
+
+        if self._chunk_size <= 0 or self._parallelism <= 0:
+            raise ValueError('chunk_size and parallelism must be positive: '
+                             '{}'.format(conf))
+
+    @property
+    def ranged(self):
+        return self._parallelism > 1
+
+    def transfer_config(self):
+        return boto3.s3.transfer.TransferConfig(
+            multipart_threshold=self._threshold,
+            multipart_chunksize=self._chunk_size,
+            max_concurrency=self._parallelism)
+
+    def chunks(self, s3_bucket, s3_key):
+        s3 = s3_client()
+
+        if self.ranged:
+            head = s3.head_object(Bucket=s3_bucket, Key=s3_key)
+            size = head['ContentLength']
+            if size >= self._threshold:
+                logger.info('Fetching %s/%s (%d byte) by %d parallel ranges',
+                            s3_bucket, s3_key, size, self._parallelism)
+                return self._ranged_chunks(s3, s3_bucket, s3_key, size,
+                                           head.get('ETag'))
+
+        logger.info('Streaming %s/%s', s3_bucket, s3_key)
+        return self._stream_chunks(s3, s3_bucket, s3_key)
+
+    def _stream_chunks(self, s3, s3_bucket, s3_key):
+        body = s3.get_object(Bucket=s3_bucket, Key=s3_key)['Body']
+        try:
+            while True:
+                chunk = body.read(self._read_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def _ranged_chunks(self, s3, s3_bucket, s3_key, size, etag=None):
+        # Ranges are pinned to the version of HEAD by ETag, not to stitch
+        # bytes of two versions if the key is overwritten meanwhile.
+        pin = {'IfMatch': etag} if etag else {}
+
+        def fetch(begin, end):
+            rng = 'bytes={}-{}'.format(begin, end)
+            try:
+                res = s3.get_object(Bucket=s3_bucket, Key=s3_key, Range=rng,
+                                    **pin)
+            except botocore.exceptions.ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'PreconditionFailed':
+                    raise
+                raise ObjectChangedError(
+                    '{}/{} was modified while it was fetched (ETag {})'
+                    ''.format(s3_bucket, s3_key, etag)) from e
+
+            body = res['Body']
+            try:
+                return body.read()
+            finally:
+                body.close()
+
+        ranges = iter([(b, min(b + self._chunk_size, size) - 1)
+                       for b in range(0, size, self._chunk_size)])
+
+        # Keep at most `parallelism` ranges in flight and hand them out in
+        # order, so that memory is bounded by parallelism * chunk_size.
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._parallelism)
+        pending = collections.deque()
+        try:
+            for begin, end in ranges:
+                pending.append(pool.submit(fetch, begin, end))
+                if len(pending) >= self._parallelism:
+                    break
+
+            while pending:
+                data = pending.popleft().result()
+                nxt = next(ranges, None)
+                if nxt:
+                    pending.append(pool.submit(fetch, *nxt))
+                yield data
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+class Prefetcher:
+    # Run jobs that open objects (functions returning an iterable of chunks,
+    # or None if the object can not be prefetched) on a thread pool. Up to
+    # `depth` objects ahead of the current one are read into bounded queues
+    # while the caller consumes the current one, and sources are handed out
+    # in the original order.
+    _END =  object()
+    _NONE = object()
+
+    def __init__(self, depth, queue_size=16):
+        self._depth = depth
+        self._queue_size = queue_size
+        self._stopped = threading.Event()
+
+    def _put(self, q, item):
+        while not self._stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _pump(self, job, q):
+        src = None
+        try:
+            src = job()
+            if src is None:
+                self._put(q, Prefetcher._NONE)
+                return
+
+            for chunk in src:
+                if not self._put(q, chunk):
+                    return
+            self._put(q, Prefetcher._END)
+        except Exception as e:
+            self._put(q, e)
+        finally:
+            if hasattr(src, 'close'):
+                src.close()
+
+    @staticmethod
+    def _drain(first, q):
+        item = first
+        while item is not Prefetcher._END:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            item = q.get()
+
+    def run(self, jobs):
+        if self._depth <= 0:
+            for job in jobs:
+                yield job()
+            return
+
+        jobs = iter(jobs)
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._depth + 1)
+        pending = collections.deque()
+
+        def submit(job):
+            q = queue.Queue(maxsize=self._queue_size)
+            pool.submit(self._pump, job, q)
+            pending.append(q)
+
+        self._stopped.clear()
+        try:
+            for job in itertools.islice(jobs, self._depth + 1):
+                submit(job)
+
+            while pending:
+                q = pending.popleft()
+                first = q.get()
+
+                nxt = next(jobs, None)
+                if nxt:
+                    submit(nxt)
+
+                if first is Prefetcher._NONE:
+                    yield None
+                else:
+                    yield Prefetcher._drain(first, q)
+        finally:
+            self._stopped.set()
+            pool.shutdown(wait=True)
@@ -1,13 +1,25 @@
 # -*- coding: utf-8 -*-
 
 import abc
+import json
 
 
 class Handler(abc.ABC):
+    # setup() is called once per container if the handler implements
+    # begin(), and the instance is reused by warm invocations. begin() is
+    # called at the start of every invocation to reset per-invocation
+    # state. Handlers without begin() are set up for every invocation.
+    # READ_ONLY handlers promise not to modify events, and share them with
+    # other handlers instead of receiving copies.
+    READ_ONLY = False
+
     @abc.abstractmethod
     def setup(self, args):
         pass
-    
+
+    def begin(self):
+        pass
+
     @abc.abstractmethod
     def recv(self, meta, event):
         pass
@@ -15,4 +27,51 @@ class Handler(abc.ABC):
     @abc.abstractmethod
     def result(self):
         pass
-    
+
+
+class BatchHandler(Handler):
+    # Receive events as a list of (meta, event) by recv_batch(). Events are
+    # buffered and flushed when BATCH_SIZE events, MAX_BYTES of size() or
+    # MAX_LATENCY seconds since the first buffered event is reached, and
+    # always before result(). Defaults can be overwritten by "batch" of
+    # handler config.
+    BATCH_SIZE = 500
+    MAX_LATENCY = 5.0
+    MAX_BYTES = None
+
+    def recv(self, meta, event):
+        self.recv_batch([(meta, event)])
+
+    @abc.abstractmethod
+    def recv_batch(self, records):
+        pass
+
+    def size(self, meta, event):
+        # Estimated bytes of an event, used only if MAX_BYTES is set.
+        return len(json.dumps(event, default=str))
+
+
+class AsyncHandler(Handler):
+    # recv() is a coroutine run on an event loop in another thread, so that
+    # parsing goes on while events wait for network I/O. Up to CONCURRENCY
+    # events are awaited at once, and parsing is paused while QUEUE_SIZE
+    # events are not finished. Events of the same key() are processed in
+    # order. Defaults can be overwritten by "async" of handler config.
+    CONCURRENCY = 16
+    QUEUE_SIZE = 1000
+
+    async def start(self):
+        # Called on the event loop before events, e.g. to open a session.
+        pass
+
+    @abc.abstractmethod
+    async def recv(self, meta, event):
+        pass
+
+    def key(self, meta, event):
+        # Events of the same key are processed in order, None for no order.
+        return None
+
+    async def stop(self):
+        # Called on the event loop after all events.
+        pass
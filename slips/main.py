@@ -2,12 +2,21 @@ import os
 import logging
 import sys
 import json
+import time
+import asyncio
+import threading
 import traceback
 import inspect
+import contextlib
+import pickle
+import functools
 import importlib.machinery as imm
 
 import slips.interface
 import slips.parser
+import slips.fetcher
+import slips.detect
+import slips.utils
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -17,7 +26,245 @@ class FormatError(Exception):
     pass
 
 
-def load_handlers(fpath):
+class HandlerError(Exception):
+    pass
+
+
+def handler_name(hdlr):
+    return '.'.join([hdlr.__module__, hdlr.__class__.__name__])
+
+
+class Batch:
+    # Buffer of events for a BatchHandler. Limits are checked when an event
+    # arrives, so latency is bounded only while events keep coming; the
+    # rest is flushed by FanOut.flush() before result().
+    def __init__(self, hdlr, config=None):
+        conf = config or {}
+        self._hdlr = hdlr
+        self._size = int(conf.get('size') or hdlr.BATCH_SIZE)
+        self._latency = float(conf.get('latency') or hdlr.MAX_LATENCY)
+        self._max_bytes = conf.get('bytes') or hdlr.MAX_BYTES
+        self._records = []
+        self._bytes = 0
+        self._since = 0
+
+    def recv(self, meta, event):
+        records = self._records
+        if not records:
+            self._since = time.monotonic()
+        records.append((meta, event))
+
+        if self._max_bytes:
+            self._bytes += self._hdlr.size(meta, event)
+            if self._bytes >= self._max_bytes:
+                return self.flush()
+
+        if (len(records) >= self._size or
+                time.monotonic() - self._since >= self._latency):
+            self.flush()
+
+    def flush(self):
+        if self._records:
+            records = self._records
+            self._records, self._bytes = [], 0
+            self._hdlr.recv_batch(records)
+
+
+class AsyncRunner:
+    # Run an AsyncHandler on an event loop in a thread. recv() hands an
+    # event to the loop and blocks only while queue_size events are not
+    # finished. The first error of the handler is raised by the next recv()
+    # or flush(), and pending events are dropped.
+    def __init__(self, hdlr, config=None):
+        conf = config or {}
+        self._hdlr = hdlr
+        self._concurrency = int(conf.get('concurrency') or hdlr.CONCURRENCY)
+        self._slots = threading.BoundedSemaphore(
+            int(conf.get('queue_size') or hdlr.QUEUE_SIZE))
+        self._error = None
+        self._tasks = set()
+        self._tails = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        daemon=True)
+        self._thread.start()
+        try:
+            self._call(self._start())
+        except Exception:
+            self.close()
+            raise
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _start(self):
+        self._running = asyncio.Semaphore(self._concurrency)
+        await self._hdlr.start()
+
+    def recv(self, meta, event):
+        while not self._slots.acquire(timeout=0.1):
+            if self._error is not None:
+                break
+        if self._error is not None:
+            raise self._error
+
+        self._loop.call_soon_threadsafe(self._submit, meta, event)
+
+    def _submit(self, meta, event):
+        try:
+            key = self._hdlr.key(meta, event)
+        except Exception as e:
+            self._fail(e)
+            self._slots.release()
+            return
+
+        # An event of a key waits for the previous one of the key, without
+        # taking a slot of concurrency.
+        prev = self._tails.get(key) if key is not None else None
+        task = self._loop.create_task(self._run(meta, event, prev))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if key is not None:
+            self._tails[key] = task
+            task.add_done_callback(lambda t: self._release_tail(key, t))
+
+    def _release_tail(self, key, task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    def _fail(self, e):
+        if self._error is None:
+            logger.error('Error of %s: %s', self._hdlr, e)
+            self._error = e
+
+    async def _run(self, meta, event, prev):
+        try:
+            if prev is not None:
+                await asyncio.wait([prev])
+            if self._error is None:
+                async with self._running:
+                    await self._hdlr.recv(meta, event)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._slots.release()
+
+    async def _drain(self):
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def flush(self):
+        # Wait for all events handed to the loop.
+        self._call(self._drain())
+        if self._error is not None:
+            raise self._error
+
+    async def _stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._hdlr.stop()
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        try:
+            if self._thread.is_alive():
+                self._call(self._stop())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+
+class FanOut:
+    # Deliver every (meta, event) to all handlers. An object is parsed once,
+    # so handlers that may modify events get their own deep copies as they
+    # did by parsing the object for each of them, and READ_ONLY handlers
+    # share the parsed objects. A handler that raises an exception is
+    # detached and does not receive any more events, but the others keep
+    # going. BatchHandlers receive events through Batch, and AsyncHandlers
+    # through AsyncRunner.
+    def __init__(self, handlers, batch_config=None, async_config=None):
+        self._active = []
+        self._runners = []
+        self._errors = {}
+        try:
+            for hdlr in handlers:
+                if isinstance(hdlr, slips.interface.BatchHandler):
+                    self._active.append((hdlr, Batch(hdlr, batch_config)))
+                elif isinstance(hdlr, slips.interface.AsyncHandler):
+                    runner = AsyncRunner(hdlr, async_config)
+                    self._runners.append(runner)
+                    self._active.append((hdlr, runner))
+                else:
+                    self._active.append((hdlr, hdlr))
+        except Exception:
+            self.close()
+            raise
+        self._plan()
+
+    def _plan(self):
+        # (handler, destination, True if it gets a copy). The parsed objects
+        # go to READ_ONLY handlers, or to the first one if there is none.
+        shared = [getattr(hdlr, 'READ_ONLY', False) for hdlr, dst in self._active]
+        if not any(shared) and shared:
+            shared[0] = True
+        self._targets = [(hdlr, dst, not own) for (hdlr, dst), own
+                         in zip(self._active, shared)]
+        self._copies = shared.count(False)
+
+    @property
+    def errors(self):
+        return self._errors
+
+    def _detach(self, hdlr, e):
+        logger.error(traceback.format_exc())
+        logger.error('Detached %s because of error: %s', hdlr, e)
+        self._errors[handler_name(hdlr)] = e
+        self._active = [x for x in self._active if x[0] is not hdlr]
+        self._plan()
+
+    @staticmethod
+    def _load(meta, data):
+        source, event = pickle.loads(data)
+        if meta is not None:
+            meta = meta.copy()
+            meta.source = source
+        return meta, event
+
+    def recv(self, meta, event):
+        # The event is pickled once before any handler can modify it, and
+        # each copy is loaded from it, which takes about half the time of
+        # deepcopy(). Other fields of meta are immutable.
+        if self._copies:
+            data = pickle.dumps((meta.source if meta is not None else None,
+                                 event), pickle.HIGHEST_PROTOCOL)
+        for hdlr, dst, copied in self._targets:
+            try:
+                if copied:
+                    dst.recv(*FanOut._load(meta, data))
+                else:
+                    dst.recv(meta, event)
+            except Exception as e:
+                self._detach(hdlr, e)
+
+    def flush(self):
+        for hdlr, dst in self._active:
+            if dst is not hdlr:
+                try:
+                    dst.flush()
+                except Exception as e:
+                    self._detach(hdlr, e)
+
+    def close(self):
+        # Stop event loops of AsyncHandlers.
+        for runner in self._runners:
+            runner.close()
+
+
+def load_handler_classes(fpath):
     full_path = os.path.abspath(fpath)
     mod_name = os.path.splitext(fpath)[0].replace('/', '.').lstrip('.')
 
@@ -25,61 +272,178 @@ def load_handlers(fpath):
     sys.path.append(os.path.dirname(full_path))
     src_file = imm.SourceFileLoader(mod_name, full_path)
     mod = src_file.load_module()
-    handlers = [m[1]() for m in inspect.getmembers(mod)
-                if inspect.isclass(m[1]) and slips.interface.Handler in m[1].__bases__]
-    logger.info('Loaded handlers: %s', handlers)
-    return handlers
+    bases = {slips.interface.Handler, slips.interface.BatchHandler,
+             slips.interface.AsyncHandler}
+    # Base classes imported by "from slips.interface import ..." are not
+    # handlers of the module.
+    return [m[1] for m in inspect.getmembers(mod)
+            if inspect.isclass(m[1]) and bases & set(m[1].__bases__) and
+            m[1].__module__ == mod.__name__ and not inspect.isabstract(m[1])]
 
 
-def create_parser(bucket_mapping, s3_bucket, s3_key):
-    bucket_config = bucket_mapping.get(s3_bucket)
-    logger.debug(bucket_mapping)
+def persistent(hdlr):
+    # A handler that implements begin() can be kept across invocations.
+    return type(hdlr).begin is not slips.interface.Handler.begin
 
-    if not bucket_config:
-        raise FormatError('No format config for bucket "{}"'.format(s3_bucket))
 
-    configs = sorted([x for x in bucket_config if s3_key.startswith(x['prefix'])],
-                     key=lambda x: len(x['prefix']), reverse=True)
+class Runtime:
+    # State built from environment once per container: parsed config,
+    # handler code and handlers that are set up. Warm invocations with the
+    # same environment reuse it (see get_runtime).
+    def __init__(self, args):
+        self.args = dict(args)
+        self.bucket_mapping = json.loads(args['BUCKET_MAPPING'])
+        self.mapping = slips.utils.compile_mapping(self.bucket_mapping)
+        errors = slips.parser.Quarantine.check_mapping(self.bucket_mapping)
+        if errors:
+            raise Exception('Invalid config: {}'.format('; '.join(errors)))
+        self.handler_args = json.loads(args.get('HANDLER_ARGS') or '{}')
+        self.prefetch_depth = int(args.get('PREFETCH_DEPTH') or '1')
+        self.batch_config = json.loads(args.get('HANDLER_BATCH') or '{}')
+        self.async_config = json.loads(args.get('HANDLER_ASYNC') or '{}')
+        self._classes = load_handler_classes(args['HANDLER_PATH'])
+        self._kept = {}
+
+    def handlers(self):
+        handlers = []
+        for cls in self._classes:
+            hdlr = self._kept.get(cls)
+            if hdlr is None:
+                hdlr = cls()
+                hdlr.setup(self.handler_args)
+                if persistent(hdlr):
+                    self._kept[cls] = hdlr
+            handlers.append(hdlr)
+
+        logger.info('Handlers: %s', handlers)
+        return handlers
+
+    def discard(self, hdlr):
+        # Set up the handler again in the next invocation because its state
+        # may be broken by an error.
+        if self._kept.get(type(hdlr)) is hdlr:
+            del self._kept[type(hdlr)]
+
 
-    if len(configs) == 0:
+_RUNTIME = None
+
+
+def get_runtime(args):
+    global _RUNTIME
+    if _RUNTIME is None or _RUNTIME.args != args:
+        logger.info('Env: \n%s', '\n'.join(["export {}='{}'".format(k, json.dumps(v))
+                                            for k, v in args.items() if v]))
+        _RUNTIME = None
+        _RUNTIME = Runtime(args)
+    return _RUNTIME
+
+
+def create_parser(mapping, s3_bucket, s3_key):
+    # mapping is bucket_mapping compiled by slips.utils.compile_mapping().
+    # Overlapping prefixes are reported by deploy, and the longest is used.
+    trie = mapping.get(s3_bucket)
+    if not trie:
+        raise FormatError('No format config for bucket "{}"'.format(s3_bucket))
+
+    config = trie.longest(s3_key)
+    if config is None:
         raise FormatError('No format config for '
                           '{}/{}'.format(s3_bucket, s3_key))
+    logger.debug('Use config for %s/%s', s3_bucket, config['prefix'])
 
-    if len(configs) > 1:
-        logger.warning('multiple configs (%d entries) for %s/%s'
-                       ''.format(len(configs), s3_bucket, s3_key))
-    logger.debug('Use config for %s/%s'.format(s3_bucket, configs[0]['prefix']))
+    fmt = config['format']
+    if fmt in ('auto', ['auto']):
+        fmt = slips.detect.detect_format(s3_bucket, s3_key, config)
 
-    stream = slips.parser.Stream(configs[0]['format'])
+    stream = slips.parser.Stream(fmt, config)
 
     return stream
 
 
+def forget_format(mapping, s3_bucket, s3_key):
+    # A record that fails to parse may come of a wrong detection. The
+    # decision is dropped to detect again on retry.
+    config = mapping[s3_bucket].longest(s3_key)
+    if config['format'] in ('auto', ['auto']):
+        logger.warning('Forget detected format of %s/%s', s3_bucket,
+                       config.get('prefix', ''))
+        slips.detect.forget(s3_bucket, config.get('prefix', ''),
+                            config.get('detect_cache'))
+
+
 def main(args, events):
     logger.info('Event: %s', json.dumps(events, indent=4))
-    logger.info('Env: \n%s', '\n'.join(["export {}='{}'".format(k, json.dumps(v))
-                                        for k, v in args.items() if v]))
+    runtime = get_runtime(args)
+    handlers = runtime.handlers()
+    for hdlr in handlers:
+        try:
+            hdlr.begin()
+        except Exception:
+            runtime.discard(hdlr)
+            raise
+
+    targets = [(ev['bucket_name'], ev['object_key']) for ev in events]
+    streams = [create_parser(runtime.mapping, s3_bucket, s3_key)
+               for s3_bucket, s3_key in targets]
+
+    # Fetch and parse each object only once for all handlers. Next objects
+    # are downloaded in background while parsing the current one, but
+    # handlers receive events in order of objects.
+    fanout = FanOut(handlers, runtime.batch_config, runtime.async_config)
+    prefetcher = slips.fetcher.Prefetcher(runtime.prefetch_depth)
+    jobs = [functools.partial(stream.open, s3_bucket, s3_key)
+            for (s3_bucket, s3_key), stream in zip(targets, streams)]
 
-    bucket_mapping = json.loads(args['BUCKET_MAPPING'])
-    handler_path =   args['HANDLER_PATH']
-    handler_args =   args.get('HANDLER_ARGS') or '{}'
+    # Counters of filter and quarantine clauses per object, reported as
+    # "filter" and "quarantine" that can not be handler names.
+    filter_stats = {}
+    quarantine_stats = {}
+    with contextlib.closing(fanout), \
+            contextlib.closing(prefetcher.run(jobs)) as sources:
+        for (s3_bucket, s3_key), stream, source in zip(targets, streams, sources):
+            try:
+                stream.read(s3_bucket, s3_key, fanout.recv, source)
+            except slips.parser.BAD_RECORD + (slips.parser.QuarantineError,):
+                forget_format(runtime.mapping, s3_bucket, s3_key)
+                raise
+            name = '{}/{}'.format(s3_bucket, s3_key)
+            stats = getattr(stream, 'stats', None)
+            if stats is not None:
+                filter_stats[name] = stats
+            stats = getattr(stream, 'quarantine', None)
+            if stats is not None:
+                quarantine_stats[name] = stats
 
-    handlers = load_handlers(handler_path)
+        # Rest of buffered events are delivered before result().
+        fanout.flush()
 
     results = {}
-    for hdlr in handlers:
-        handler_args = json.loads(handler_args)
-        hdlr.setup(handler_args)
+    if filter_stats:
+        logger.info('Filter: %s', filter_stats)
+        results['filter'] = filter_stats
+    if quarantine_stats:
+        logger.info('Quarantine: %s', quarantine_stats)
+        results['quarantine'] = quarantine_stats
 
-        for ev in events:
-            s3_bucket = ev['bucket_name']
-            s3_key =    ev['object_key']
-            stream = create_parser(bucket_mapping, s3_bucket, s3_key)
-            stream.read(s3_bucket, s3_key, hdlr.recv)
+    for hdlr in handlers:
+        name = handler_name(hdlr)
+        if name in fanout.errors:
+            runtime.discard(hdlr)
+            results[name] = {'error': str(fanout.errors[name])}
+            continue
 
-        res = hdlr.result()
+        try:
+            res = hdlr.result()
+        except Exception:
+            runtime.discard(hdlr)
+            raise
         logger.info('A result of %s -> %s', str(hdlr), res)
-        results['.'.join([hdlr.__module__, hdlr.__class__.__name__])] = res
+        results[name] = res
+
+    if fanout.errors:
+        logger.error('Results: %s', results)
+        raise HandlerError('Handler(s) failed: {}'.format(
+            ', '.join(sorted(fanout.errors.keys()))))
 
     return results
 
@@ -90,6 +454,9 @@ def lambda_handler(event, context):
         'HANDLER_PATH',
         'HANDLER_ARGS',
         'BUCKET_MAPPING',
+        'PREFETCH_DEPTH',
+        'HANDLER_BATCH',
+        'HANDLER_ASYNC',
     ]
     args = dict([(k, os.environ.get(k)) for k in arg_keys])
 
@@ -1,43 +1,71 @@
 # -*- coding: utf-8 -*-
 
 import abc
+import codecs
 import datetime
-import dateutil
+import time
+import dateutil.parser
 import logging
 import json
 import tempfile
 import os
-import boto3
-import gzip
+import mmap
 import re
 import csv
-import io
+import string
+import itertools
+import operator
+import copy
+import pickle
+import multiprocessing
+import multiprocessing.connection
+import collections.abc
+
+import slips.codec
+import slips.fetcher
+import slips.timestamp
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
 class MetaData:
-    def __init__(self, orig=None):
-        attrs = [
-            ('tag', None),
-            ('timestamp', int(datetime.datetime.now().timestamp())),
-            ('source', {}),
-            ('message', None),
-        ]
-
-        for attr_name, default in attrs:
-            if orig:
-                value = getattr(orig, attr_name)
-                if isinstance(value, set):
-                    value = value.copy()
-            else:
-                value = default
-
-            setattr(self, attr_name, value)
+    __slots__ = ('tag', 'timestamp', 'source', 'message', 'line')
+
+    def __init__(self, orig=None, timestamp=None, line=None):
+        # timestamp is the ingest time by default. Spouts take it once per
+        # object and pass it to avoid reading the clock for every record.
+        # line is the position of the record in the object (1 origin).
+        if orig is not None:
+            self.tag =       orig.tag
+            self.timestamp = orig.timestamp
+            self.source =    orig.source
+            self.message =   orig.message
+            self.line =      orig.line
+        else:
+            self.tag =       None
+            self.timestamp = int(time.time()) if timestamp is None else timestamp
+            self.source =    {}
+            self.message =   None
+            self.line =      line
 
     def copy(self):
-        meta = MetaData(self)
+        meta = MetaData.__new__(MetaData)
+        meta.tag =       self.tag
+        meta.timestamp = self.timestamp
+        meta.source =    self.source
+        meta.message =   self.message
+        meta.line =      self.line
         return meta
 
     def __repr__(self):
@@ -48,23 +76,52 @@ class MetaData:
 
 
 class Task(object):
+    # True if recv() accepts raw bytes as data['message'] from line spouts.
+    ACCEPT_BYTES = False
+    # Sink of bad records (see Quarantine). Errors are raised if None.
+    _quarantine = None
+
     def __init__(self):
         self._dst = None
         self._closed = False
+        self._config = {}
+        self._arg = None
 
     def set_params(self, s3_bucket, s3_key):
         self._s3_bucket = s3_bucket
         self._s3_key =    s3_key
 
+    def set_config(self, config):
+        self._config = config or {}
+
+    def set_arg(self, arg):
+        # Argument given in format list with colon, e.g. "s3-lines:zstd"
+        self._arg = arg or None
+
     def pipe(self, dst):
         self._dst = dst
 
+    def set_quarantine(self, quarantine):
+        self._quarantine = quarantine
+
     def emit(self, meta: MetaData, data: dict):
         if self._dst:
             self._dst.recv(meta, data)
         else:
             logger.warning('No destination')
 
+    def recv_batch(self, metas: list, records: list):
+        # Adapter for tasks that only implement per-record recv().
+        recv = self.recv
+        for meta, data in zip(metas, records):
+            recv(meta, data)
+
+    def emit_batch(self, metas: list, records: list):
+        if self._dst:
+            self._dst.recv_batch(metas, records)
+        else:
+            logger.warning('No destination')
+
     def close(self):
         self._closed = True
         if self._dst:
@@ -80,62 +137,356 @@ class Task(object):
 # --------------------------------------------------------
 
 class Spout(Task, abc.ABC):
+    BATCH_SIZE = 1000
+    # True if the spout emits decoded objects instead of lines.
+    DECODED = False
+    # True if the spout checks raw lines by RecordFilter.match_line().
+    LINE_FILTER = False
+
+    def __init__(self):
+        super().__init__()
+        self._filter = None
+
     @abc.abstractmethod
-    def run(self, s3_bucket, s3_key):
+    def batches(self, s3_bucket, s3_key, source=None):
+        # Generator of (metas, records) blocks of the object. The object is
+        # read only as far as blocks are taken, and closing the generator
+        # stops the download.
         pass
 
+    def run(self, s3_bucket, s3_key, source=None):
+        for metas, records in self.batches(s3_bucket, s3_key, source):
+            self.emit_batch(metas, records)
+
+    def set_filter(self, record_filter):
+        self._filter = record_filter
+
+    def line_batches(self, raw_lines):
+        # Split lines into blocks for the next task. Lines are decoded only
+        # if the next task can not take bytes.
+        batch_size = int(self._config.get('batch_size') or Spout.BATCH_SIZE)
+        as_bytes = getattr(self._dst, 'ACCEPT_BYTES', False)
+        match_line = self._filter.match_line if self._filter else None
+        now = int(time.time())
+        metas, records = [], []
+        lineno = 0
+
+        for lineno, raw in enumerate(raw_lines, 1):
+            if match_line is not None and not match_line(raw):
+                continue
+
+            if as_bytes:
+                line = raw.rstrip()
+            else:
+                try:
+                    line = raw.decode('utf8').rstrip()
+                except UnicodeDecodeError as e:
+                    if self._quarantine is not None:
+                        self._quarantine.put(MetaData(timestamp=now, line=lineno),
+                                             {'message': raw}, e)
+                        continue
+                    logger.error(e)
+                    logger.error('Decoding error: %s', raw)
+                    continue
+
+            metas.append(MetaData(timestamp=now, line=lineno))
+            records.append({'message': line})
+            if len(metas) >= batch_size:
+                yield metas, records
+                metas, records = [], []
+
+        if metas:
+            yield metas, records
+
+        if self._quarantine is not None:
+            self._quarantine.count(lineno)
+
+    def fetcher(self):
+        return slips.fetcher.Fetcher(self._config.get('download'))
+
+    def open(self, s3_bucket, s3_key):
+        # Return an iterable of decompressed chunks if the object can be read
+        # ahead (see slips.fetcher.Prefetcher), otherwise None.
+        return None
+
+    @property
+    def codec(self):
+        # Detect by magic bytes unless a codec is given as argument.
+        return self._arg or 'auto'
+
 
-def download_s3_object(s3_bucket, s3_key):
+def _close(chunks):
+    if hasattr(chunks, 'close'):
+        chunks.close()
+
+
+def download_s3_object(s3_bucket, s3_key, fetcher=None):
     # Prepare a temporary file.
     fname = s3_key.split('/')[-1]
     tfd, tpath = tempfile.mkstemp(suffix=fname)
     os.close(tfd)
 
     # Downloading s3 object.
-    s3 = boto3.client('s3')
+    s3 = slips.fetcher.s3_client()
     logger.info('Downloading %s/%s to %s', s3_bucket, s3_key, tpath)
-    res = s3.download_file(s3_bucket, s3_key, tpath)
+    if fetcher and fetcher.ranged:
+        res = s3.download_file(s3_bucket, s3_key, tpath,
+                               Config=fetcher.transfer_config())
+    else:
+        res = s3.download_file(s3_bucket, s3_key, tpath)
     logger.info('Download completed > %s', res)
 
     return tpath
 
 
-class S3Lines(Spout):
-    def run(self, s3_bucket, s3_key):
-        fpath = download_s3_object(s3_bucket, s3_key)
-        if s3_key.endswith('.gz'):
-            fd = gzip.open(fpath, 'rb')
-        else:
-            fd = open(fpath, 'rb')
+def _split_blocks(chunks):
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        yield lines
+
+    if rest:
+        yield [rest]
+
+
+def split_lines(chunks):
+    return itertools.chain.from_iterable(_split_blocks(chunks))
+
+
+def _mmap_blocks(fpath, window):
+    with open(fpath, 'rb') as fd:
+        if os.fstat(fd.fileno()).st_size == 0:
+            return
 
-        for raw in fd:
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm)
+            pos = 0
+            while pos < end:
+                # Cut a window at the last line boundary in it and split the
+                # window at once rather than finding each line separately.
+                eol = mm.rfind(b'\n', pos, pos + window)
+                if eol < 0:
+                    eol = mm.find(b'\n', pos + window)
+                if eol < 0:
+                    eol = end
+
+                yield mm[pos:eol].split(b'\n')
+                pos = eol + 1
+
+
+def mmap_lines(fpath, window=1024 * 1024):
+    return itertools.chain.from_iterable(_mmap_blocks(fpath, window))
+
+
+class _JsonReader:
+    # Read JSON values one by one from an iterator of text chunks. Consumed
+    # text is dropped so that memory is bounded by the largest value.
+    WHITESPACE = ' \t\n\r'
+    # A value that is still invalid with this many characters after the
+    # error is malformed, not cut at the end of the buffer.
+    MAX_LOOKAHEAD = 8 * 1024 * 1024
+
+    def __init__(self, texts):
+        self._texts = texts
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self._eof:
+            return False
+
+        for text in self._texts:
+            if text:
+                if self._pos > len(self._buf) // 2:
+                    self._buf = self._buf[self._pos:]
+                    self._pos = 0
+                self._buf += text
+                return True
+
+        self._eof = True
+        return False
+
+    def peek(self):
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _JsonReader.WHITESPACE:
+                pos += 1
+            self._pos = pos
+
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return None
+
+    def expect(self, chars):
+        ch = self.peek()
+        if ch is None or ch not in chars:
+            raise ParseError('Expected "{}" but got "{}" in JSON'
+                             ''.format(chars, ch))
+        self._pos += 1
+        return ch
+
+    def value(self):
+        self.peek()
+        while True:
             try:
-                line = raw.decode('utf8').rstrip()
-                meta = MetaData()
-                self.emit(meta, {'message': line})
-            except UnicodeDecodeError as e:
-                logger.error(e)
-                logger.error('Decoding error: %s', raw)
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A value at the end of buffer (e.g. number) may continue.
+                if end < len(self._buf) or not self._fill():
+                    self._pos = end
+                    return obj
+            except json.JSONDecodeError as e:
+                if (len(self._buf) - e.pos > _JsonReader.MAX_LOOKAHEAD or
+                        not self._fill()):
+                    raise ParseError('Invalid JSON: {}'.format(e))
+
+
+def iter_json_array(texts, path):
+    # Yield elements of the array at `path` (list of keys from the top-level
+    # object, or empty list for a top-level array) without loading the
+    # whole document. Remaining text after the array is not read.
+    reader = _JsonReader(texts)
+
+    for key in path:
+        reader.expect('{')
+        while True:
+            if reader.peek() == '}':
+                raise ParseError('No "{}" in JSON'.format('.'.join(path)))
+            name = reader.value()
+            reader.expect(':')
+            if name == key:
+                break
+            reader.value()
+            reader.expect(',}')
+
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+
+    while True:
+        yield reader.value()
+        if reader.expect(',]') == ']':
+            return
 
-        os.remove(fpath)
 
+class S3Lines(Spout):
+    LINE_FILTER = True
+
+    def batches(self, s3_bucket, s3_key, source=None):
+        fpath = download_s3_object(s3_bucket, s3_key, self.fetcher())
+        lines = None
+        try:
+            codec = self.codec
+            if codec == 'auto':
+                with open(fpath, 'rb') as fd:
+                    codec = slips.codec.detect(fd.read(slips.codec.MAGIC_LEN))
+
+            # Plain text is split on the mapped file without reading it into
+            # Python file objects.
+            if codec == 'plain':
+                lines = mmap_lines(fpath)
+            else:
+                chunks = slips.codec.decompress(slips.codec.read_file(fpath),
+                                                codec)
+                lines = split_lines(chunks)
+            yield from self.line_batches(lines)
+        finally:
+            _close(lines)
+            os.remove(fpath)
 
-class S3TextFile(Spout):
-    def run(self, s3_bucket, s3_key):
-        fpath = download_s3_object(s3_bucket, s3_key)
-        if s3_key.endswith('.gz'):
-            data = gzip.open(fpath, 'rt').read()
-        else:
-            data = open(fpath, 'rt').read()
 
-        meta = MetaData()
-        self.emit(meta, {'message': data})
-        os.remove(fpath)
+class S3TextFile(Spout):
+    def batches(self, s3_bucket, s3_key, source=None):
+        fpath = download_s3_object(s3_bucket, s3_key, self.fetcher())
+        try:
+            chunks = slips.codec.decompress(slips.codec.read_file(fpath),
+                                            self.codec)
+            data = b''.join(chunks).decode('utf8')
+        finally:
+            os.remove(fpath)
+
+        if self._quarantine is not None:
+            self._quarantine.count(1)
+        yield [MetaData(line=1)], [{'message': data}]
+
+
+class S3StreamLines(Spout):
+    LINE_FILTER = True
+
+    def open(self, s3_bucket, s3_key):
+        chunks = self.fetcher().chunks(s3_bucket, s3_key)
+        return slips.codec.decompress(chunks, self.codec)
+
+    def batches(self, s3_bucket, s3_key, source=None):
+        chunks = self.open(s3_bucket, s3_key) if source is None else source
+        try:
+            yield from self.line_batches(split_lines(chunks))
+        finally:
+            _close(chunks)
+
+
+class S3StreamText(Spout):
+    def open(self, s3_bucket, s3_key):
+        chunks = self.fetcher().chunks(s3_bucket, s3_key)
+        return slips.codec.decompress(chunks, self.codec)
+
+    def batches(self, s3_bucket, s3_key, source=None):
+        chunks = self.open(s3_bucket, s3_key) if source is None else source
+        try:
+            data = b''.join(chunks).decode('utf8')
+        finally:
+            _close(chunks)
+
+        if self._quarantine is not None:
+            self._quarantine.count(1)
+        yield [MetaData(line=1)], [{'message': data}]
+
+
+class S3JsonArray(Spout):
+    # Emit elements of a JSON array in the object one by one. The argument
+    # is dot separated path to the array, "Records" by default.
+    DECODED = True
+
+    def open(self, s3_bucket, s3_key):
+        chunks = self.fetcher().chunks(s3_bucket, s3_key)
+        return slips.codec.decompress(chunks)
+
+    def batches(self, s3_bucket, s3_key, source=None):
+        chunks = self.open(s3_bucket, s3_key) if source is None else source
+        try:
+            yield from self._elements(chunks)
+        finally:
+            _close(chunks)
+
+    def _elements(self, chunks):
+        decoder = codecs.getincrementaldecoder('utf8')()
+        texts = (decoder.decode(chunk) for chunk in chunks)
+        path = [x for x in (self._arg or 'Records').split('.') if x]
+
+        batch_size = int(self._config.get('batch_size') or Spout.BATCH_SIZE)
+        now = int(time.time())
+        metas, records = [], []
+        index = 0
+        for index, rec in enumerate(iter_json_array(texts, path), 1):
+            metas.append(MetaData(timestamp=now, line=index))
+            records.append(rec)
+            if len(metas) >= batch_size:
+                yield metas, records
+                metas, records = [], []
+
+        if metas:
+            yield metas, records
+
+        if self._quarantine is not None:
+            self._quarantine.count(index)
 
 
 class Ignore(Spout):
-    def run(self, s3_bucket, s3_key):
-        return # Nothing to do
+    def batches(self, s3_bucket, s3_key, source=None):
+        return iter(()) # Nothing to do
 
 
 # --------------------------------------------------------
@@ -146,139 +497,459 @@ class Ignore(Spout):
 # Base classes
 #
 class Parser(Task, abc.ABC):
+    # Fields that the parser derives from others, as name -> function of the
+    # record. In lazy mode (a "projection" is configured) the parser skips
+    # them, and they are computed only if a handler reads them.
+    DERIVED = {}
+
+    def __init__(self):
+        super().__init__()
+        self._lazy = False
+
+    def set_lazy(self, lazy):
+        self._lazy = lazy
+
     @abc.abstractmethod
     def recv(self, meta: MetaData, data: dict):
         pass
 
 
+class RecordParser(Parser):
+    # Base class of parsers that convert one record at once. transform()
+    # returns (meta, data) to be emitted or None to drop the record, and
+    # recv_batch() runs it over a block without per-record emit() calls.
+    # Consecutive parsers are fused into one (see Fused) if FUSIBLE, i.e.
+    # recv_batch() does nothing but transform() for each record.
+    FUSIBLE = True
+
+    @abc.abstractmethod
+    def transform(self, meta: MetaData, data: dict):
+        pass
+
+    def recv(self, meta: MetaData, data: dict):
+        try:
+            res = self.transform(meta, data)
+        except BAD_RECORD as e:
+            if self._quarantine is None:
+                raise
+            self._quarantine.put(meta, data, e)
+            return
+
+        if res is not None:
+            self.emit(*res)
+
+    def recv_batch(self, metas: list, records: list):
+        transform = self.transform
+        quarantine = self._quarantine
+        out_metas, out_records = [], []
+
+        for meta, data in zip(metas, records):
+            try:
+                res = transform(meta, data)
+            except BAD_RECORD as e:
+                if quarantine is None:
+                    raise
+                quarantine.put(meta, data, e)
+                continue
+
+            if res is not None:
+                out_metas.append(res[0])
+                out_records.append(res[1])
+
+        if out_metas:
+            self.emit_batch(out_metas, out_records)
+
+
 class ParseError(Exception):
     pass
 
 
+# Errors of a malformed record, that are sent to Quarantine if configured.
+BAD_RECORD = (ParseError, ValueError, KeyError, IndexError, TypeError,
+              AssertionError, csv.Error)
+
+
+class RegexParser(RecordParser):
+    # Base class of parsers for line formats. A format is one pattern with
+    # named groups that is compiled once per class and matched against the
+    # whole line by fullmatch().
+    #
+    # A pattern may have "{events}" as the body of EVENT_GROUP and
+    # "{sub_events}" for the rest of the line. Each EVENTS entry maps an
+    # event name to its own sub-pattern, and they are combined into
+    # conditional groups, so the fields of sub-events are also picked in
+    # one pass. Unknown events take DEFAULT_EVENT and DEFAULT_SUB_EVENT.
+    PATTERN = None
+    FIELD = 'message'
+    EVENT_GROUP = 'event'
+    EVENTS = {}
+    DEFAULT_EVENT = r'\S+'
+    DEFAULT_SUB_EVENT = r'.*'
+
+    GROUP_REGEX = re.compile(r'\(\?P<(\w+)>')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.PATTERN is None:
+            return
+
+        # Groups of sub-events get a suffix to be unique in the pattern.
+        events, sub_events, event_fields = [], cls.DEFAULT_SUB_EVENT, {}
+        for idx, (name, sub) in reversed(list(enumerate(cls.EVENTS.items()))):
+            cond = '_{}__{}'.format(cls.EVENT_GROUP, idx)
+            event_fields[name] = (cond, [
+                (field, '{}__{}'.format(field, idx))
+                for field in RegexParser.GROUP_REGEX.findall(sub)])
+            sub = RegexParser.GROUP_REGEX.sub(r'(?P<\1__{}>'.format(idx), sub)
+            events.insert(0, '(?P<{}>{})'.format(cond, re.escape(name)))
+            sub_events = '(?({}){}|{})'.format(cond, sub, sub_events)
+
+        events.append(cls.DEFAULT_EVENT)
+        pattern = (cls.PATTERN.replace('{events}', '|'.join(events))
+                   .replace('{sub_events}', sub_events))
+        cls._regex = re.compile(pattern)
+
+        # Positions of output fields in groups() are resolved here so that
+        # the fields are picked by one itemgetter call for each line.
+        def layout(keys, groups):
+            pos = [cls._regex.groupindex[g] - 1 for g in groups]
+            if len(pos) == 1:
+                return keys, lambda values: (values[pos[0]],)
+            return keys, operator.itemgetter(*pos)
+
+        fields = RegexParser.GROUP_REGEX.findall(cls.PATTERN)
+        cls._layout = layout(fields, fields)
+        cls._event_pos = cls._regex.groupindex.get(cls.EVENT_GROUP, 0) - 1
+        cls._event_layouts = {}
+        for name, (cond, sub_fields) in event_fields.items():
+            cls._event_layouts[name] = (cls._regex.groupindex[cond] - 1,) + layout(
+                fields + [k for k, g in sub_fields],
+                fields + [g for k, g in sub_fields])
+
+    @classmethod
+    def match(cls, line):
+        # Returns a dict of named groups of PATTERN, or None when the line
+        # does not match. Fields of the sub-event are added for a known
+        # event, and ParseError is raised if its sub-pattern does not match.
+        mo = cls._regex.fullmatch(line)
+        return dict(cls._fields(mo)) if mo is not None else None
+
+    @classmethod
+    def _fields(cls, mo):
+        # Returns (key, value) pairs of a match object.
+        values = mo.groups()
+        keys, getter = cls._layout
+        if cls._event_layouts:
+            layout = cls._event_layouts.get(values[cls._event_pos])
+            if layout is not None:
+                cond, keys, getter = layout
+                if values[cond] is None:
+                    raise ParseError('sub-event of {} is not matched "{}"'.format(
+                        values[cls._event_pos], mo.string))
+
+        return zip(keys, getter(values))
+
+    def mismatch(self, meta: MetaData, data: dict):
+        raise ParseError('not {} format "{}"'.format(
+            self.__class__.__name__, data.get(self.FIELD)))
+
+    def build(self, meta: MetaData, data: dict, fields):
+        data.update(fields)
+        return meta, data
+
+    def transform(self, meta: MetaData, data: dict):
+        line = data.get(self.FIELD)
+        mo = self._regex.fullmatch(line) if line is not None else None
+        if mo is None:
+            return self.mismatch(meta, data)
+
+        return self.build(meta, data, self._fields(mo))
+
+
+class MappingParser(RecordParser):
+    # Base class of parsers declared by a field mapping (see mapping_parser)
+    # instead of code. The mapping is compiled into transform() once when
+    # the class is created, so no config is looked up for each record.
+    #
+    #   tag:       Tag of records. Fields can be embedded, e.g. "beat.{type}"
+    #   timestamp: field:  Field of event time. Dotted path for nested one.
+    #              format: datetime (default), iso8601, epoch or epoch_ms
+    #              tz:     local (default) or utc, for datetime and iso8601
+    #   message:   Template of "message" field, e.g. "{user.name} logged in"
+    SPEC = {}
+
+    TIMESTAMP_FORMATS = {
+        'datetime': slips.timestamp.parse,
+        'iso8601':  slips.timestamp.parse_iso8601,
+        'epoch':    lambda v, tz: float(v),
+        'epoch_ms': lambda v, tz: float(v) / 1000,
+    }
+    TIMEZONES = {
+        'local': slips.timestamp.LOCAL,
+        'utc':   slips.timestamp.UTC,
+    }
+
+    @staticmethod
+    def getter(path):
+        keys = path.split('.')
+        if len(keys) == 1:
+            return operator.methodcaller('get', path)
+
+        def get(data):
+            for key in keys[:-1]:
+                data = data.get(key, {})
+            return data.get(keys[-1])
+        return get
+
+    @staticmethod
+    def template(text):
+        # Compile "{a.b} and {c}" into a function that formats values of the
+        # fields, with None for missing ones.
+        fmt, getters = [], []
+        for literal, field, spec, conv in string.Formatter().parse(text):
+            fmt.append(literal.replace('{', '{{').replace('}', '}}'))
+            if field is not None:
+                fmt.append('{' + ('!' + conv if conv else '') +
+                           (':' + spec if spec else '') + '}')
+                getters.append(MappingParser.getter(field))
+
+        fmt = ''.join(fmt)
+        if not getters:
+            return lambda data: fmt
+
+        def render(data):
+            return fmt.format(*[get(data) for get in getters])
+        return render
+
+    @staticmethod
+    def compile(spec: dict):
+        unknown = set(spec) - {'tag', 'timestamp', 'message'}
+        if unknown:
+            raise Exception('Unknown keys in parser: {}'.format(sorted(unknown)))
+
+        tag = spec.get('tag')
+        render_tag = MappingParser.template(tag) if tag and '{' in tag else None
+
+        ts_field = to_ts = tz = None
+        if spec.get('timestamp'):
+            ts_spec = spec['timestamp']
+            fmt = ts_spec.get('format', 'datetime')
+            tz_name = ts_spec.get('tz', 'local')
+            if fmt not in MappingParser.TIMESTAMP_FORMATS:
+                raise Exception('Invalid timestamp format "{}"'.format(fmt))
+            if tz_name not in MappingParser.TIMEZONES:
+                raise Exception('Invalid timezone "{}"'.format(tz_name))
+
+            ts_field = ts_spec['field']
+            to_ts = MappingParser.TIMESTAMP_FORMATS[fmt]
+            tz = MappingParser.TIMEZONES[tz_name]
+
+        render_msg = (MappingParser.template(spec['message'])
+                      if spec.get('message') else None)
+
+        # Specialized functions for common mappings that have only a fixed
+        # tag and a top level timestamp field.
+        if render_tag is None and render_msg is None:
+            if ts_field is None:
+                def transform(self, meta: MetaData, data: dict):
+                    meta.tag = tag
+                    return meta, data
+                return transform
+
+            if '.' not in ts_field:
+                def transform(self, meta: MetaData, data: dict):
+                    value = data.get(ts_field)
+                    if value:
+                        meta.timestamp = int(to_ts(value, tz))
+                    meta.tag = tag
+                    return meta, data
+                return transform
+
+        get_ts = MappingParser.getter(ts_field) if ts_field else None
+
+        def transform(self, meta: MetaData, data: dict):
+            if get_ts is not None:
+                value = get_ts(data)
+                if value:
+                    meta.timestamp = int(to_ts(value, tz))
+
+            meta.tag = render_tag(data) if render_tag is not None else tag
+            if render_msg is not None:
+                data['message'] = render_msg(data)
+            return meta, data
+
+        return transform
+
+
+def mapping_parser(name: str, spec: dict):
+    # Create a parser class from a field mapping of MappingParser.
+    return type(name, (MappingParser,), {
+        'SPEC': spec,
+        'transform': MappingParser.compile(spec),
+        '__module__': __name__,
+    })
+
+
 #
 # Parsers
 #
 class Json(Parser):
+    ACCEPT_BYTES = True
+
+    # Decoders for a block of lines. "auto" takes orjson if installed.
+    # ujson is used only if given explicitly because it is less strict.
+    BACKENDS = {
+        'stdlib': json.loads,
+        'orjson': orjson.loads if orjson else None,
+        'ujson':  ujson.loads if ujson else None,
+    }
+
+    def __init__(self):
+        super().__init__()
+        self._loads = Json.BACKENDS['orjson'] or json.loads
+
+    def set_arg(self, arg):
+        # e.g. "json:orjson"
+        super().set_arg(arg)
+        if self._arg and self._arg != 'auto':
+            if self._arg not in Json.BACKENDS:
+                raise Exception('No such JSON backend "{}"'.format(self._arg))
+            if not Json.BACKENDS[self._arg]:
+                raise Exception('JSON backend "{}" requires "{}" module'.format(
+                    self._arg, self._arg))
+            self._loads = Json.BACKENDS[self._arg]
+
     def recv(self, meta: MetaData, data: dict):
         msg = data['message']
-        self.emit(meta, json.loads(msg))
+        try:
+            obj = json.loads(msg)
+        except ValueError as e:
+            if self._quarantine is not None:
+                self._quarantine.put(meta, data, e)
+                return
+            if not isinstance(e, UnicodeDecodeError):
+                raise
+            logger.error(e)
+            logger.error('Decoding error: %s', msg)
+            return
 
+        self.emit(meta, obj)
+
+    def recv_batch(self, metas: list, records: list):
+        loads = self._loads
+        try:
+            objs = [loads(data['message']) for data in records]
+        except ValueError:
+            # Decode the block line by line with stdlib json again, so that
+            # lines that are not UTF-8 are skipped and an error is raised for
+            # the malformed line with the same message as recv().
+            for meta, data in zip(metas, records):
+                self.recv(meta, data)
+            return
 
-class Syslog(Parser):
-    BASE_DAY = datetime.datetime.now()
-    MSG_REGEX = re.compile('^(\S{3} \d{1,2} \d{2}:\d{2}:\d{2}) '
-                              '(\S+) (\S+)\\[(\d+)\]:\s*(.*)$')
-    DATE_FMT = '%b %d %H:%M:%S'
+        self.emit_batch(metas, objs)
+
+
+class Syslog(RegexParser):
+    # Nov 21 06:00:24 ip-172-31-7-118 sshd[23511]:
+    PATTERN = (r'(?P<datetime>\S{3} +\d{1,2} \d{2}:\d{2}:\d{2}) '
+               r'(?P<hostname>\S+) (?P<proc_name>\S+)\[(?P<proc_id>\d+)\]:'
+               r'\s*(?P<message>.*)')
 
     @staticmethod
     def parse(line):
-        # Nov 21 06:00:24 ip-172-31-7-118 sshd[23511]:
-        mo = Syslog.MSG_REGEX.search(line)
-        if not mo:
+        data = Syslog.match(line)
+        if data is None:
             raise ParseError('not syslog format "{}"'.format(line))
-
-        data = {
-            'datetime':  mo.group(1),
-            'hostname':  mo.group(2),
-            'proc_name': mo.group(3),
-            'proc_id':   mo.group(4),
-            'message':   mo.group(5)
-        }
         return data
 
-    def recv(self, meta: MetaData, data: dict):
-        msg = data['message']
-        obj = Syslog.parse(msg)
-        dt = datetime.datetime.strptime(obj['datetime'], Syslog.DATE_FMT)
-
+    def build(self, meta: MetaData, data: dict, fields):
         # Currently, don't inherit previous object message.
         # To be fixed.
+        obj = dict(fields)
         m = meta.copy()
-        m.timestamp = dt.timestamp()
-        self.emit(m, obj)
+        m.timestamp = slips.timestamp.parse_syslog(obj['datetime'])
+        return m, obj
 
 
-class GSuiteLogin(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        dt_fmt = '%Y-%m-%dT%H:%M:%S%z'
-        sdt = data.get('id', {}).get('time', {})
-        if sdt:
-            dt = datetime.datetime.strptime(sdt[:19] + '+0000', dt_fmt)
-            meta.timestamp = int(dt.timestamp())
+GSuiteLogin = mapping_parser('GSuiteLogin', {
+    'tag': 'gsuite.login',
+    'timestamp': {'field': 'id.time', 'tz': 'utc'},
+})
 
-        meta.tag = 'gsuite.login'
-        self.emit(meta, data)
 
-
-class FluentdJson(Parser):
-    def recv(self, meta: MetaData, data: dict):
+class FluentdJson(RecordParser):
+    def transform(self, meta: MetaData, data: dict):
         row = data['message'].split('\t')
         assert len(row) == 3
-        dt = dateutil.parser.parse(row[0])
+        try:
+            ts = slips.timestamp.parse_iso8601(row[0])
+        except ValueError:
+            ts = dateutil.parser.parse(row[0]).timestamp()
         jdata = json.loads(row[2])
 
-        meta.timestamp = dt.timestamp()
+        meta.timestamp = ts
         meta.tag = row[1]
-        self.emit(meta, jdata)
+        return meta, jdata
 
 
-class AzureAdAudit(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        dt_txt = data.get('activityDate')
-        if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt[:19], '%Y-%m-%dT%H:%M:%S')
-            meta.timestamp = dt.timestamp()
+AzureAdAudit = mapping_parser('AzureAdAudit', {
+    'tag': 'azure_ad.audit',
+    'timestamp': {'field': 'activityDate'},
+})
 
-        meta.tag = 'azure_ad.audit'
-        self.emit(meta, data)
+AzureAdEvent = mapping_parser('AzureAdEvent', {
+    'tag': 'azure_ad.signin_event',
+    'timestamp': {'field': 'signinDateTime'},
+})
 
+AzureAdRiskEvent = mapping_parser('AzureAdRiskEvent', {
+    'tag': 'azure_ad.risk_event',
+    'timestamp': {'field': 'riskEventDateTime'},
+})
 
-class AzureAdEvent(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        dt_txt = data.get('signinDateTime')
-        if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt[:19], '%Y-%m-%dT%H:%M:%S')
-            meta.timestamp = dt.timestamp()
+CylanceEvent = mapping_parser('CylanceEvent', {
+    'tag': 'cylance.event',
+    'timestamp': {'field': 'datetime'},
+})
 
-        meta.tag = 'azure_ad.signin_event'
-        self.emit(meta, data)
+CylanceThreat = mapping_parser('CylanceThreat', {
+    'tag': 'cylance.threat',
+    'timestamp': {'field': 'datetime'},
+})
 
 
-class AzureAdRiskEvent(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        dt_txt = data.get('riskEventDateTime')
-        if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt[:19], '%Y-%m-%dT%H:%M:%S')
-            meta.timestamp = dt.timestamp()
-
-        meta.tag = 'azure_ad.risk_event'
-        self.emit(meta, data)
-        
-
-class CylanceEvent(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        dt_txt = data.get('datetime')
-        if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt[:19], '%Y-%m-%dT%H:%M:%S')
-            meta.timestamp = dt.timestamp()
+class AwsCloudtrailEvent(Parser):
+    DERIVED = {'description': lambda rec: AwsCloudtrailEvent.description(rec)}
 
-        meta.tag = 'cylance.event'
-        self.emit(meta, data)
+    @staticmethod
+    def description(rec: dict):
+        return '{} {} by {} on {}'.format(
+            rec.get('eventType'), rec.get('eventName'),
+            rec.get('userIdentity', {}).get('arn'),
+            rec.get('sourceIPAddress')
+        )
 
+    @staticmethod
+    def record(meta: MetaData, rec: dict, lazy=False):
+        if 'eventTime' in rec:
+            meta.timestamp = int(slips.timestamp.parse(rec['eventTime']))
 
-class CylanceThreat(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        dt_txt = data.get('datetime')
-        if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt[:19], '%Y-%m-%dT%H:%M:%S')
-            meta.timestamp = dt.timestamp()
+        if not lazy:
+            rec['description'] = AwsCloudtrailEvent.description(rec)
 
-        meta.tag = 'cylance.threat'
-        self.emit(meta, data)
+        ev_type = 'aws.cloudtrail.{}'.format(rec.get('eventType'))
+        meta.tag = ev_type
+        return meta, rec
 
+    @staticmethod
+    def records(meta: MetaData, data: dict, lazy=False):
+        # A record from s3-json-array spout.
+        if 'eventVersion' in data or 'eventTime' in data:
+            yield AwsCloudtrailEvent.record(meta, data, lazy)
+            return
 
-class AwsCloudtrailEvent(Parser):
-    def recv(self, meta: MetaData, data: dict):
+        # A whole document from s3-text spout.
         msg = data.get('message')
         if not msg:
             raise ParseError('No "message": {}'.format(str(data)))
@@ -289,129 +960,218 @@ class AwsCloudtrailEvent(Parser):
                              '{}'.format(str(jdata)))
 
         for rec in jdata['Records']:
-            rec_meta = meta.copy()
-            if 'eventTime' in rec:
-                dt = datetime.datetime.strptime(rec['eventTime'],
-                                                '%Y-%m-%dT%H:%M:%SZ')
-                rec_meta.timestamp = int(dt.timestamp())
-
-            rec['description'] = '{} {} by {} on {}'.format(
-                rec.get('eventType'), rec.get('eventName'),
-                rec.get('userIdentity', {}).get('arn'),
-                rec.get('sourceIPAddress')
-            )
-
-            ev_type = 'aws.cloudtrail.{}'.format(rec.get('eventType'))
-            rec_meta.tag = ev_type
-            self.emit(rec_meta, rec)
+            yield AwsCloudtrailEvent.record(meta.copy(), rec, lazy)
 
-
-class AwsGuardDuty(Parser):
     def recv(self, meta: MetaData, data: dict):
-        meta.tag = 'aws.guardduty'
-        self.emit(meta, data)
-
-
-class Kea(Parser):
-    PATTERN = re.compile('^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) ([A-Z]+)\s+'
-                         '\[(\S+?)\] (\S+) \[hwtype=(\S+) (\S+)\], cid=\[(.*?)\], '
-                         'tid=(\S+): (.*)')
-    MSG_REGEX = {
-        'DHCP4_INIT_REBOOT':  re.compile('requests address (\S+)'),
-        'DHCP4_LEASE_ADVERT': re.compile('lease (\S+) will be advertised'),
-        'DHCP4_LEASE_ALLOC':  re.compile('lease (\S+) has been allocated'),
+        self.recv_batch([meta], [data])
+
+    def recv_batch(self, metas: list, records: list):
+        out_metas, out_records = [], []
+        for meta, data in zip(metas, records):
+            try:
+                res = list(AwsCloudtrailEvent.records(meta, data, self._lazy))
+            except BAD_RECORD as e:
+                if self._quarantine is None:
+                    raise
+                self._quarantine.put(meta, data, e)
+                continue
+
+            for rec_meta, rec in res:
+                out_metas.append(rec_meta)
+                out_records.append(rec)
+
+        if out_metas:
+            self.emit_batch(out_metas, out_records)
+
+
+AwsGuardDuty = mapping_parser('AwsGuardDuty', {
+    'tag': 'aws.guardduty',
+})
+
+
+class Kea(RegexParser):
+    PATTERN = (r'(?P<event_datetime>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) '
+               r'(?P<msg_level>[A-Z]+)\s+\[(?P<proc>\S+?)\] (?P<event>{events}) '
+               r'\[hwtype=(?P<hwtype>\S+) (?P<hwaddr>\S+)\], cid=\[(?P<client_id>.*?)\], '
+               r'tid=(?P<tx_id>\S+): (?P<msg>{sub_events})')
+    EVENTS = {
+        'DHCP4_INIT_REBOOT':  r'.*?requests address (?P<ipaddr>\S+).*',
+        'DHCP4_LEASE_ADVERT': r'.*?lease (?P<ipaddr>\S+) will be advertised.*',
+        'DHCP4_LEASE_ALLOC':  r'.*?lease (?P<ipaddr>\S+) has been allocated.*',
     }
-    
-    def recv(self, meta: MetaData, data: dict):
-        dt_fmt = '%Y-%m-%d %H:%M:%S'
+
+    def mismatch(self, meta: MetaData, data: dict):
         msg = data.get('message')
         if not msg:
             logger.error('No message of Kea: %s', data)
             raise Exception('No "message" attribute')
-        
-        mo = Kea.PATTERN.search(msg)
-        if not mo:
-            logger.error('Invalid format of kea message: %s', msg)
-            return
 
-        keys = ['event_datetime', 'msg_level', 'proc', 'event', 'hwtype',
-                'hwaddr', 'client_id', 'tx_id', 'msg']
-                
-        data.update(dict(zip(keys, mo.groups())))
+        logger.error('Invalid format of kea message: %s', msg)
+        return None
 
-        regex = Kea.MSG_REGEX.get(data['event'])
-        if not regex:
+    def build(self, meta: MetaData, data: dict, fields):
+        data.update(fields)
+        if data['event'] not in Kea.EVENTS:
             logger.error('Not supported event: %s', data['event'])
             # nothing to do anymore
-            return
-        
-        mo2 = regex.search(data['msg'])
-        if not mo2:
-            logger.error('Regex is not matched: %s', data)
-            raise Exception('Regex is not matched')
+            return None
 
-        data['ipaddr'] = mo2.group(1)
-
-        
         # Setting metadata.
-        dt_s = data['event_datetime'].split('.')[0]
-        dt = datetime.datetime.strptime(dt_s, dt_fmt)        
-        meta.timestamp = int(dt.timestamp())
+        meta.timestamp = int(slips.timestamp.parse(data['event_datetime']))
         meta.tag = 'kea.log'
 
-        self.emit(meta, data)
+        return meta, data
 
 
-class PacketBeat(Parser):
-    def recv(self, meta: MetaData, data: dict):
+class PacketBeat(RecordParser):
+    DERIVED = {'message': lambda data: PacketBeat.message(data)}
+
+    @staticmethod
+    def message(data: dict):
+        if data.get('type') != 'dns':
+            return data.get('message')
+        return '{} from {}'.format(data.get('query'), data.get('client_ip'))
+
+    def transform(self, meta: MetaData, data: dict):
         meta.tag = 'packetbeat.{}'.format(data['type'])
-        dt_fmt = '%Y-%m-%dT%H:%M:%S'
         dt_txt = data.get('@timestamp')
         if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt.split('.')[0], dt_fmt)
-            meta.timestamp = int(dt.timestamp())
+            meta.timestamp = int(slips.timestamp.parse(dt_txt))
 
-        if data['type'] == 'dns':
-            data['message'] = '{} from {}'.format(data.get('query'),
-                                                  data.get('client_ip'))
+        if data['type'] == 'dns' and not self._lazy:
+            data['message'] = PacketBeat.message(data)
             
-        self.emit(meta, data)
+        return meta, data
 
         
-class AuditBeat(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        meta.tag = 'auditbeat.auditd'
-        dt_fmt = '%Y-%m-%dT%H:%M:%S'
-        dt_txt = data.get('@timestamp')
-        if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt.split('.')[0], dt_fmt)
-            meta.timestamp = int(dt.timestamp())
+class AuditBeat(RecordParser):
+    DERIVED = {'message': lambda data: AuditBeat.message(data)}
 
+    @staticmethod
+    def message(data: dict):
         if 'auditd' in data:
-            data['message'] = '{} {} {} by {}'.format(
+            return '{} {} {} by {}'.format(
                 data.get('process', {}).get('title'),
                 data.get('event', {}).get('action'),
                 data.get('auditd', {}).get('summary', {}).get('object', {}).get('primary'),
                 data.get('auditd', {}).get('summary', {}).get('how'))
         else:
-            data['message'] = str(data.get('event'))
-            
-        self.emit(meta, data)
+            return str(data.get('event'))
 
-        
-class EcsHako(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        meta.tag = 'ecs.hako'
-        dt_fmt = '%Y-%m-%dT%H:%M:%SZ'
-        dt_txt = data.get('time')
+    def transform(self, meta: MetaData, data: dict):
+        meta.tag = 'auditbeat.auditd'
+        dt_txt = data.get('@timestamp')
         if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt, dt_fmt)
-            meta.timestamp = int(dt.timestamp())
+            meta.timestamp = int(slips.timestamp.parse(dt_txt))
+
+        if not self._lazy:
+            data['message'] = AuditBeat.message(data)
             
-        self.emit(meta, data)
+        return meta, data
 
         
-class PaloAlto(Parser):
+EcsHako = mapping_parser('EcsHako', {
+    'tag': 'ecs.hako',
+    'timestamp': {'field': 'time'},
+})
+
+
+class PaloAltoLayout:
+    # Column positions of a PaloAlto log type, computed once.
+    MSG_PARAM_KEYS = [
+        'Source address', 'Source Port',
+        'Destination address', 'Destination Port',
+        'IP Protocol',
+        'Bytes Sent', 'Bytes Received',
+    ]
+    MSG_FMT = '{0}:{1} => {2}:{3} ({4}), Sent {5} byte, Recv {6} byte'
+
+    def __init__(self, column, tag, suffix_key=None):
+        self.column = column
+        self.size = len(column)
+        self.tag = tag
+        self.index = dict((name, i) for i, name in enumerate(column))
+        self.start_time = self.index.get('Start Time')
+        self.url = self.index.get('URL')
+
+        # Parameters not in the column are "None" as dict.get() gives.
+        keys = PaloAltoLayout.MSG_PARAM_KEYS + ([suffix_key] if suffix_key else [])
+        params = [x for x in keys if x in self.index]
+        fmt = PaloAltoLayout.MSG_FMT + (' {7}' if suffix_key else '')
+        self.msg_fmt = fmt.format(*['{{{}}}'.format(params.index(x))
+                                    if x in self.index else 'None' for x in keys])
+        self.msg_params = operator.itemgetter(*[self.index[x] for x in params])
+
+
+class PaloAltoRow(collections.abc.MutableMapping):
+    # Compact record of a PaloAlto log that refers to the CSV row by column
+    # position. It turns into a dict when modified or iterated.
+    __slots__ = ('_layout', '_row', '_extra', '_dict')
+
+    def __init__(self, layout, row, extra):
+        self._layout = layout
+        self._row = row
+        self._extra = extra
+        self._dict = None
+
+    def to_dict(self):
+        if self._dict is None:
+            d = {'message': self._extra['message'] if 'message' in self._extra
+                 else self.format_message()}
+            d.update(zip(self._layout.column, self._row))
+            d.update(self._extra)
+            self._dict = d
+        return self._dict
+
+    def __getitem__(self, key):
+        if self._dict is not None:
+            return self._dict[key]
+
+        idx = self._layout.index.get(key)
+        if idx is not None:
+            return self._row[idx]
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        self.to_dict()[key] = value
+
+    def __delitem__(self, key):
+        del self.to_dict()[key]
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __deepcopy__(self, memo):
+        # The layout is shared, and the row has only strings.
+        row = PaloAltoRow(self._layout, self._row, copy.deepcopy(self._extra, memo))
+        if self._dict is not None:
+            row._dict = copy.deepcopy(self._dict, memo)
+        return row
+
+    def __reduce__(self):
+        # The layout is looked up again by the log type instead of pickled.
+        return (PaloAltoRow.restore, (self._row, self._extra, self._dict))
+
+    @staticmethod
+    def restore(row, extra, data):
+        rec = PaloAltoRow(PaloAlto.LAYOUTS[row[3]], row, extra)
+        rec._dict = data
+        return rec
+
+    def format_message(self):
+        return self._layout.msg_fmt.format(*self._layout.msg_params(self._row))
+
+
+class PaloAlto(RecordParser):
+    # recv_batch() parses CSV of a block at once.
+    FUSIBLE = False
+
     TRAFFIC_COLUMN = [
         'Domain', 'Receive Time', 'Serial #', 'Type', 'Threat/Content Type',
         'Config Version', 'Generate Time', 'Source address',
@@ -446,136 +1206,665 @@ class PaloAlto(Parser):
         'file_url'
     ]
 
-    COLUMN_MAP = {
-        'TRAFFIC': TRAFFIC_COLUMN,
-        'THREAT':  THREAT_COLUMN,
+    LAYOUTS = {
+        'TRAFFIC': PaloAltoLayout(TRAFFIC_COLUMN, 'paloalto.traffic'),
+        'THREAT':  PaloAltoLayout(THREAT_COLUMN, 'paloalto.threat',
+                                  'Threat/Content Name'),
     }
-    TAG_MAP = {
-        'TRAFFIC': 'paloalto.traffic',
-        'THREAT':  'paloalto.threat',
-    }
-
-    def recv(self, meta: MetaData, data: dict):
-        msg = data.get('message')
 
-        if not msg:
-            raise ParseError('No "message": {}'.format(str(data)))
+    # In lazy mode, columns are picked from PaloAltoRow by projection and
+    # the message is formatted only if it is projected.
+    DERIVED = {'message': lambda row: row.format_message()}
 
-        ss = io.StringIO()
-        ss.write(msg)
-        ss.seek(0)
-        row = next(csv.reader(ss))
+    # "paloalto:compact" emits PaloAltoRow instead of dict.
+    @property
+    def compact(self):
+        return self._arg == 'compact'
 
+    def convert(self, meta: MetaData, data: dict, msg: str, row: list):
         if len(row) < 4:
             raise ParseError('No enough column: "{}"'.format(row))
 
-        column = PaloAlto.COLUMN_MAP.get(row[3])
-        if not column:
+        layout = PaloAlto.LAYOUTS.get(row[3])
+        if not layout:
             raise ParseError('Unsupported log type "{}": "{}"'
                              ''.format(row[3], str(row)))
 
-        if len(row) != len(column):
+        if len(row) != layout.size:
             logger.error('Column length is not matched, Expected = %s, Actual = %s: %s',
-                         len(column), len(row), str(row))
-            return
+                         layout.size, len(row), str(row))
+            return None
 
-        data.update(dict(zip(column, row)))
+        if layout.url is not None:
+            row[layout.url] = row[layout.url].strip('"')
 
-        if 'URL' in data:
-            data['URL'] = data['URL'].strip('"')
+        if layout.start_time is not None and row[layout.start_time]:
+            meta.timestamp = int(slips.timestamp.parse(row[layout.start_time]))
 
-        dt_txt = data.get('Start Time')
-        if dt_txt:
-            dt = datetime.datetime.strptime(dt_txt, '%Y/%m/%d %H:%M:%S')
-            meta.timestamp = int(dt.timestamp())
-
-        msg_param_keys = [
-            'Source address', 'Source Port',
-            'Destination address', 'Destination Port',
-            'IP Protocol',
-            'Bytes Sent', 'Bytes Received',
-        ]
-
-        msg_fmt = '{0}:{1} => {2}:{3} ({4}), Sent {5} byte, Recv {6} byte'
-        msg_params = [data.get(x) for x in msg_param_keys]
+        meta.tag = layout.tag
+        if self._lazy:
+            return meta, PaloAltoRow(layout, row, {'raw_message': msg})
+
+        message = layout.msg_fmt.format(*layout.msg_params(row))
+        if self.compact:
+            return meta, PaloAltoRow(layout, row, {'raw_message': msg,
+                                                   'message': message})
+
+        data.update(zip(layout.column, row))
         data['raw_message'] = msg
-        data['message'] = msg_fmt.format(*msg_params)
+        data['message'] = message
+        return meta, data
 
-        if row[3] == 'THREAT':
-            data['message'] += ' {}'.format(data.get('Threat/Content Name'))
+    def transform(self, meta: MetaData, data: dict):
+        msg = data.get('message')
+        if not msg:
+            raise ParseError('No "message": {}'.format(str(data)))
 
-        meta.tag = PaloAlto.TAG_MAP.get(row[3]) or meta.tag
-        self.emit(meta, data)
+        return self.convert(meta, data, msg, next(csv.reader([msg])))
+
+    def recv_batch(self, metas: list, records: list):
+        msgs = [data.get('message') for data in records]
+        if not all(msgs):
+            # Report the record in the same way as per-record parsing.
+            return super().recv_batch(metas, records)
+
+        # One reader for the whole block. If a quoted field runs over a line,
+        # rows and lines are misaligned, so parse the block line by line.
+        reader = csv.reader(msgs)
+        try:
+            rows = list(reader)
+        except csv.Error:
+            return super().recv_batch(metas, records)
+
+        if reader.line_num != len(msgs) or len(rows) != len(msgs):
+            return super().recv_batch(metas, records)
+
+        convert = self.convert
+        quarantine = self._quarantine
+        out_metas, out_records = [], []
+        for meta, data, msg, row in zip(metas, records, msgs, rows):
+            try:
+                res = convert(meta, data, msg, row)
+            except BAD_RECORD as e:
+                if quarantine is None:
+                    raise
+                quarantine.put(meta, data, e)
+                continue
 
+            if res is not None:
+                out_metas.append(res[0])
+                out_records.append(res[1])
 
-class FalconEventLog(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        meta.tag = 'falcon.event'
-        dt_fmt = '%Y-%m-%dT%H:%M:%SZ'
-        ts_txt = data.get('timestamp')
-        if re.search('^[0-9]+$', ts_txt):
-            meta.timestamp = int(ts_txt) / 1000
-        else:
-            dt = datetime.datetime.strptime(ts_txt, dt_fmt)
-            meta.timestamp = int(dt.timestamp())
+        if out_metas:
+            self.emit_batch(out_metas, out_records)
+
+
+def falcon_timestamp(data: dict, key: str):
+    # Epoch in milliseconds as digits, or datetime string.
+    ts_txt = data.get(key)
+    if not isinstance(ts_txt, str):
+        raise ParseError('Invalid "{}": {!r}'.format(key, ts_txt))
+
+    if ts_txt.isdigit():
+        return int(ts_txt) / 1000
+    return int(slips.timestamp.parse(ts_txt))
 
+
+class FalconEventLog(RecordParser):
+    DERIVED = {'message': lambda data: FalconEventLog.message(data)}
+
+    @staticmethod
+    def message(data: dict):
         tgt_value = (data.get('RemoteAddressIP4') or
                      data.get('TargetFileName') or
                      data.get('DomainName') or
                      data.get('CommandLine'))
 
-        data['message'] = '{} at {} to {}'.format(data.get('name'),
-                                                  data.get('aip'), tgt_value)
-        self.emit(meta, data)
+        return '{} at {} to {}'.format(data.get('name'), data.get('aip'),
+                                       tgt_value)
 
+    def transform(self, meta: MetaData, data: dict):
+        meta.tag = 'falcon.event'
+        meta.timestamp = falcon_timestamp(data, 'timestamp')
 
-class FalconDetectionLog(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        meta.tag = 'falcon.detection'
-        dt_fmt = '%Y-%m-%dT%H:%M:%SZ'
-        ts_txt = data.get('created_timestamp')
-        if re.search('^[0-9]+$', ts_txt):
-            meta.timestamp = int(ts_txt) / 1000
-        else:
-            dt = datetime.datetime.strptime(ts_txt, dt_fmt)
-            meta.timestamp = int(dt.timestamp())
+        if not self._lazy:
+            data['message'] = FalconEventLog.message(data)
+        return meta, data
+
+
+class FalconDetectionLog(RecordParser):
+    DERIVED = {'message': lambda data: FalconDetectionLog.message(data)}
 
+    @staticmethod
+    def message(data: dict):
         msgs = ['Detected {} ({})'.format(b.get('technique'), b.get('tactic'))
                 for b in data.get('behaviors', [])]
-        data['message'] = ', '.join(msgs)
+        return ', '.join(msgs)
 
-        self.emit(meta, data)
-        
+    def transform(self, meta: MetaData, data: dict):
+        meta.tag = 'falcon.detection'
+        meta.timestamp = falcon_timestamp(data, 'created_timestamp')
 
-class AwsWafLog(Parser):
-    def recv(self, meta: MetaData, data: dict):
-        if data.get('terminatingRuleId') == 'Default_Action':
-            return  # ignore default action
+        if not self._lazy:
+            data['message'] = FalconDetectionLog.message(data)
+
+        return meta, data
         
-        meta.tag = 'aws.waf.log'
-        meta.timestamp = int(data['timestamp'] / 1000)
 
+class AwsWafLog(RecordParser):
+    DERIVED = {
+        'httpRequest': lambda data: AwsWafLog.request(data),
+        'message':     lambda data: AwsWafLog.message(data),
+    }
+
+    @staticmethod
+    def request(data: dict):
+        # Add "header" dict built from "headers" list.
         if 'httpRequest' in data:
             hdrs = dict([(h.get('name'), h.get('value'))
                          for h in data['httpRequest'].get('headers', [])])
             data['httpRequest']['header'] = hdrs
+        return data.get('httpRequest')
 
+    @staticmethod
+    def message(data: dict):
         req = data.get('httpRequest', {})
+        if 'header' not in req:
+            req = AwsWafLog.request(data) or {}
+
         msgfmt = 'WAF {} from {} to {}{} at {}'
-        data['message'] = msgfmt.format(data.get('action'),
-                                        req.get('clientIp'),
-                                        req.get('header', {}).get('Host'),
-                                        req.get('uri'),
-                                        data.get('httpSourceId'))
+        return msgfmt.format(data.get('action'),
+                             req.get('clientIp'),
+                             req.get('header', {}).get('Host'),
+                             req.get('uri'),
+                             data.get('httpSourceId'))
+
+    def transform(self, meta: MetaData, data: dict):
+        if data.get('terminatingRuleId') == 'Default_Action':
+            return None  # ignore default action
+        
+        meta.tag = 'aws.waf.log'
+        meta.timestamp = int(data['timestamp'] / 1000)
+
+        if not self._lazy:
+            AwsWafLog.request(data)
+            data['message'] = AwsWafLog.message(data)
         
-        self.emit(meta, data)
+        return meta, data
 
         
+# --------------------------------------------------------
+# Filter
+# --------------------------------------------------------
+
+class RecordFilter:
+    # "filter" clause of a bucket_mapping entry. Raw lines are checked by
+    # substrings and regex in the spout before decoding, and records are
+    # checked by field predicates right after decoding (see FieldFilter).
+    # Counters are of the last stage, records filtered by both stages are
+    # counted in "filtered".
+    OPERATORS = {
+        'eq':     lambda value, arg: value == arg,
+        'ne':     lambda value, arg: value != arg,
+        'in':     lambda value, arg: value in arg,
+        'not_in': lambda value, arg: value not in arg,
+        'regex':  lambda value, arg: (value is not None and
+                                      arg.search(str(value)) is not None),
+        'exists': lambda value, arg: (value is not None) is bool(arg),
+    }
+
+    def __init__(self, config: dict):
+        unknown = set(config) - {'include', 'exclude', 'regex',
+                                 'exclude_regex', 'fields'}
+        if unknown:
+            raise Exception('Unknown keys in filter: {}'.format(sorted(unknown)))
+
+        # (predicate of a raw line, True to keep or False to drop if matched)
+        self._line_checks = [
+            (compile_pred(config[key]), keep)
+            for key, keep, compile_pred in [
+                ('include',       True,  RecordFilter.contains),
+                ('regex',         True,  RecordFilter.search),
+                ('exclude',       False, RecordFilter.contains),
+                ('exclude_regex', False, RecordFilter.search),
+            ] if config.get(key)]
+
+        self._field_checks = []
+        for path, cond in (config.get('fields') or {}).items():
+            if not isinstance(cond, dict):
+                cond = {'eq': cond}
+            for op, arg in cond.items():
+                if op not in RecordFilter.OPERATORS:
+                    raise Exception('Invalid filter operator "{}"'.format(op))
+                if op == 'regex':
+                    arg = re.compile(arg)
+                self._field_checks.append((MappingParser.getter(path),
+                                           RecordFilter.OPERATORS[op], arg))
+
+        self.reset()
+
+    @staticmethod
+    def contains(texts):
+        subs = [x.encode('utf8') for x in texts]
+        if len(subs) == 1:
+            sub = subs[0]
+            return lambda raw: sub in raw
+        return re.compile(b'|'.join(re.escape(x) for x in subs)).search
+
+    @staticmethod
+    def search(pattern):
+        return re.compile(pattern.encode('utf8')).search
+
+    @property
+    def has_lines(self):
+        return bool(self._line_checks)
+
+    @property
+    def has_fields(self):
+        return bool(self._field_checks)
+
+    @property
+    def stats(self):
+        return {'filtered': self.filtered, 'passed': self.passed}
+
+    def reset(self):
+        self.filtered = 0
+        self.passed = 0
+
+    def match_line(self, raw: bytes):
+        for pred, keep in self._line_checks:
+            if (not pred(raw)) is keep:
+                self.filtered += 1
+                return False
+
+        if not self._field_checks:
+            self.passed += 1
+        return True
+
+    def match_record(self, data: dict):
+        for get, op, arg in self._field_checks:
+            if not op(get(data), arg):
+                self.filtered += 1
+                return False
+
+        self.passed += 1
+        return True
+
+
+class FieldFilter(RecordParser):
+    def __init__(self, record_filter: RecordFilter):
+        super().__init__()
+        self._filter = record_filter
+
+    def transform(self, meta: MetaData, data: dict):
+        if self._filter.match_record(data):
+            return meta, data
+        return None
+
+
+# --------------------------------------------------------
+# Quarantine
+# --------------------------------------------------------
+
+class QuarantineError(Exception):
+    pass
+
+
+class Quarantine:
+    # Side sink of records that parsers can not handle. Bad records of an
+    # object are written to a local file with line number and reason, and
+    # uploaded as "<prefix><key>.jsonl" after the object is read. The object
+    # fails only if the ratio of bad records exceeds max_ratio.
+    DEFAULT_CONFIG = {
+        'max_ratio': 0.01,
+        'bucket':    None,  # Bucket of the object by default.
+        'prefix':    'quarantine/',
+    }
+
+    def __init__(self, config: dict):
+        unknown = set(config or {}) - set(Quarantine.DEFAULT_CONFIG)
+        if unknown:
+            raise Exception('Unknown quarantine option(s): {}'.format(
+                ', '.join(sorted(unknown))))
+
+        self._config = dict(Quarantine.DEFAULT_CONFIG, **(config or {}))
+        self._max_ratio = float(self._config['max_ratio'])
+        if not 0 <= self._max_ratio <= 1:
+            raise Exception('quarantine max_ratio must be in 0..1')
+
+        self._fd = None
+        self._fpath = None
+        self.reset()
+
+    @staticmethod
+    def check_mapping(bucket_mapping: dict):
+        # Errors of quarantine clauses that upload bad records to where an
+        # entry of bucket_mapping reads, which would process them again by
+        # notification of the bucket.
+        errors = []
+        for bucket, entries in sorted(bucket_mapping.items()):
+            for entry in entries:
+                if entry.get('quarantine') is None:
+                    continue
+
+                config = dict(Quarantine.DEFAULT_CONFIG, **entry['quarantine'])
+                dst = config['bucket'] or bucket
+                head = config['prefix'] + entry.get('prefix', '')
+                for other in bucket_mapping.get(dst, []):
+                    prefix = other.get('prefix', '')
+                    if prefix.startswith(head) or head.startswith(prefix):
+                        errors.append(
+                            'quarantine of prefix "{}" of bucket "{}" is '
+                            'uploaded to s3://{}/{}, which is read by prefix '
+                            '"{}"'.format(entry.get('prefix', ''), bucket,
+                                          dst, head, prefix))
+                        break
+        return errors
+
+    def reset(self):
+        self.discard()
+        self._total = 0
+        self._bad = 0
+        self._url = None
+
+    @property
+    def stats(self):
+        return {'total': self._total, 'bad': self._bad, 'path': self._url}
+
+    @property
+    def ratio(self):
+        if not self._bad:
+            return 0.0
+        return self._bad / max(self._total, self._bad)
+
+    def count(self, n):
+        # Number of records read from the object, called by spouts.
+        self._total += n
+
+    @staticmethod
+    def _dump(data):
+        # A raw line of spouts as is, and other records as JSON.
+        if (isinstance(data, collections.abc.Mapping) and len(data) == 1 and
+                isinstance(data.get('message'), (str, bytes))):
+            data = data['message']
+        if isinstance(data, bytes):
+            return data.decode('utf8', errors='replace')
+        if isinstance(data, str):
+            return data
+        return json.dumps(data, default=str)
+
+    @staticmethod
+    def reject(meta: MetaData, data: dict, error: Exception):
+        # (line, record, reason) of a bad record, that can be pickled.
+        return (meta.line, Quarantine._dump(data),
+                '{}: {}'.format(type(error).__name__, error))
+
+    def put(self, meta: MetaData, data: dict, error: Exception):
+        self.write(*Quarantine.reject(meta, data, error))
+
+    def write(self, line, record, reason):
+        self._bad += 1
+        if self._fd is None:
+            tfd, self._fpath = tempfile.mkstemp(suffix='.jsonl')
+            self._fd = os.fdopen(tfd, 'w', encoding='utf8')
+
+        logger.debug('Quarantine line %s: %s', line, reason)
+        self._fd.write(json.dumps({
+            'line': line,
+            'reason': reason,
+            'record': record,
+        }) + '\n')
+
+    def discard(self):
+        if self._fd is not None:
+            self._fd.close()
+            os.remove(self._fpath)
+        self._fd = None
+        self._fpath = None
+
+    def finish(self, s3_bucket, s3_key):
+        # Upload bad records and raise QuarantineError if over the budget.
+        if self._fd is None:
+            return
+
+        self._fd.close()
+        bucket = self._config['bucket'] or s3_bucket
+        key = '{}{}.jsonl'.format(self._config['prefix'], s3_key)
+        try:
+            slips.fetcher.s3_client().upload_file(self._fpath, bucket, key)
+        finally:
+            os.remove(self._fpath)
+            self._fd = None
+            self._fpath = None
+
+        self._url = 's3://{}/{}'.format(bucket, key)
+        logger.warning('%d of %d records in %s/%s are quarantined to %s',
+                       self._bad, self._total, s3_bucket, s3_key, self._url)
+
+        if self.ratio > self._max_ratio:
+            raise QuarantineError(
+                'Too many bad records in {}/{}: {} of {} (max_ratio {}), '
+                'see {}'.format(s3_bucket, s3_key, self._bad, self._total,
+                                self._max_ratio, self._url))
+
+
+# --------------------------------------------------------
+# Projection
+# --------------------------------------------------------
+
+class LazyRecord(dict):
+    # Record that has only projected fields. Derived fields are computed from
+    # the source record on first access, and all of them are computed when
+    # the whole record is read, e.g. iteration, len(), == or json.dumps().
+    __slots__ = ('_source', '_pending')
+
+    NONE = {}
+
+    @staticmethod
+    def project(source, fields, derived):
+        # Not __init__() in order to fill the dict without Python level calls.
+        rec = LazyRecord()
+        for key in fields:
+            if key in source:
+                rec[key] = source[key]
+        rec._source = source
+        rec._pending = derived
+        if not dict.__len__(rec):
+            # json.dumps() takes an empty dict as {} without calling items().
+            rec._materialize()
+        return rec
+
+    def _derive(self, key):
+        value = self._pending[key](self._source)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def _materialize(self):
+        if self._pending:
+            for key in self._pending:
+                if not dict.__contains__(self, key):
+                    self._derive(key)
+            self._pending = LazyRecord.NONE
+
+    def __missing__(self, key):
+        if key in self._pending:
+            return self._derive(key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        if key in self._pending:
+            return self._derive(key)
+        return default
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._pending
+
+    def __delitem__(self, key):
+        self._materialize()
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *args):
+        self._materialize()
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        self._materialize()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def clear(self):
+        self._pending = LazyRecord.NONE
+        dict.clear(self)
+
+    def __iter__(self):
+        self._materialize()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._materialize()
+        return dict.__len__(self)
+
+    def __eq__(self, other):
+        self._materialize()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        self._materialize()
+        return dict.__repr__(self)
+
+    def keys(self):
+        self._materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self._materialize()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize()
+        return dict.items(self)
+
+    def copy(self):
+        self._materialize()
+        return dict(self)
+
+    def __reduce__(self):
+        # Functions of derived fields can not be pickled.
+        return (dict, (self.copy(),))
+
+    def __deepcopy__(self, memo):
+        # Derived fields may be objects of the source, e.g. httpRequest of
+        # aws-waf, then they are computed before copying not to be shared.
+        self._materialize()
+        rec = LazyRecord()
+        for key, value in dict.items(self):
+            rec[key] = copy.deepcopy(value, memo)
+        rec._source = self._source
+        rec._pending = LazyRecord.NONE
+        return rec
+
+
+class Projection(RecordParser):
+    # Emit records that have only the given fields. Fields derived by the
+    # previous parser are put off until a handler reads them.
+    def __init__(self, fields: list, derived: dict):
+        super().__init__()
+        self._fields = [x for x in fields if x not in derived]
+        self._derived = {x: derived[x] for x in fields if x in derived}
+
+    def transform(self, meta: MetaData, data: dict):
+        return meta, LazyRecord.project(data, self._fields, self._derived)
+
+    def recv_batch(self, metas: list, records: list):
+        fields, derived = self._fields, self._derived
+        project = LazyRecord.project
+        self.emit_batch(metas, [project(data, fields, derived)
+                                for data in records])
+
+
 # --------------------------------------------------------
 # Data Stream
 # --------------------------------------------------------
 
 
+class Fused(RecordParser):
+    # Consecutive record parsers run as one function per record, without
+    # emit()/recv_batch() and intermediate lists between them. If the
+    # destination is Callback, its function is called in the same loop.
+    def __init__(self, tasks: list):
+        super().__init__()
+        self._tasks = tasks
+        transform = tasks[-1].transform
+        for task in reversed(tasks[:-1]):
+            transform = Fused.chain(task.transform, transform)
+        self._transform = transform
+
+    @staticmethod
+    def chain(first, second):
+        def transform(meta: MetaData, data: dict):
+            res = first(meta, data)
+            if res is None:
+                return None
+            return second(res[0], res[1])
+        return transform
+
+    def set_quarantine(self, quarantine):
+        super().set_quarantine(quarantine)
+        for task in self._tasks:
+            task.set_quarantine(quarantine)
+
+    def transform(self, meta: MetaData, data: dict):
+        return self._transform(meta, data)
+
+    def recv_batch(self, metas: list, records: list):
+        func = self._dst._func if isinstance(self._dst, Callback) else None
+        if func is None:
+            return super().recv_batch(metas, records)
+
+        transform = self._transform
+        quarantine = self._quarantine
+        for meta, data in zip(metas, records):
+            try:
+                res = transform(meta, data)
+            except BAD_RECORD as e:
+                if quarantine is None:
+                    raise
+                quarantine.put(meta, data, e)
+                continue
+
+            if res is not None:
+                func(res[0], res[1])
+
+
+def fuse(tasks: list):
+    # Replace runs of fusible parsers with Fused. A single parser is also
+    # wrapped if it is the last one, to call Callback in its loop.
+    out, run = [], []
+    for task in tasks + [None]:
+        if isinstance(task, RecordParser) and task.FUSIBLE:
+            run.append(task)
+            continue
+
+        if len(run) > 1 or (run and task is None):
+            out.append(Fused(run))
+        else:
+            out.extend(run)
+        run = []
+        if task is not None:
+            out.append(task)
+    return out
+
+
 class Callback(Parser):
     def set_func(self, func):
         self._func = func
@@ -586,12 +1875,231 @@ class Callback(Parser):
         else:
             logger.warning('No destination')
 
+    def recv_batch(self, metas: list, records: list):
+        func = self._func
+        if not func:
+            logger.warning('No destination')
+            return
+
+        for meta, data in zip(metas, records):
+            func(meta, data)
+
+
+# --------------------------------------------------------
+# Parallel
+# --------------------------------------------------------
+
+class _Rejects:
+    # Quarantine of a worker process. Bad records are sent back to the main
+    # process with the events of the block.
+    def __init__(self):
+        self.items = []
+
+    def put(self, meta: MetaData, data: dict, error: Exception):
+        self.items.append(Quarantine.reject(meta, data, error))
+
+    def count(self, lines):
+        pass
+
+
+def _picklable(error):
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return Exception('{}: {}'.format(type(error).__name__, error))
+
+
+def _parallel_worker(conn, args, config, quarantine):
+    # Parse blocks sent by Parallel.run() until None is received. The spout
+    # of the stream is not used, blocks are emitted to the parsers after it.
+    stream = Stream(args, config)
+    rejects = _Rejects() if quarantine else None
+    task = stream._root
+    while task is not None and rejects is not None:
+        task.set_quarantine(rejects)
+        task = task._dst
+
+    out = []
+    stream._callback.set_func(lambda meta, data: out.append(
+        (meta.tag, meta.timestamp, meta.source, meta.message, meta.line,
+         data if type(data) is dict else dict(data))))
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+
+        seq, timestamp, lines, records = msg
+        if stream._filter:
+            stream._filter.reset()
+        try:
+            stream._root.emit_batch(
+                [MetaData(timestamp=timestamp, line=x) for x in lines], records)
+        except Exception as e:
+            conn.send((seq, None, None, None, _picklable(e)))
+            break
+
+        conn.send((seq, out, rejects.items if rejects else [],
+                   stream.stats, None))
+        out.clear()
+        if rejects:
+            rejects.items = []
+    conn.close()
+
+
+class Parallel:
+    # "parallel" clause of a bucket_mapping entry. Blocks of the spout are
+    # parsed by worker processes connected with Pipe, because Queue and Pool
+    # need semaphores of /dev/shm that Lambda does not have. The spout, line
+    # filters and handlers run in the main process. Objects that have fewer
+    # lines than min_lines are parsed in the main process.
+    ORDERS = ('ordered', 'relaxed')
+    MIN_LINES = 100000
+
+    def __init__(self, args, config: dict, record_filter=None,
+                 quarantine=None):
+        clause = config['parallel'] or {}
+        unknown = set(clause) - {'workers', 'order', 'min_lines'}
+        if unknown:
+            raise Exception('Unknown keys in parallel: {}'.format(sorted(unknown)))
+
+        self._workers = int(clause.get('workers') or os.cpu_count() or 1)
+        self._order = clause.get('order', 'ordered')
+        if self._order not in Parallel.ORDERS:
+            raise Exception('Invalid order of parallel "{}"'.format(self._order))
+        self._min_lines = int(clause.get('min_lines', Parallel.MIN_LINES))
+
+        self._args = list(args)
+        self._config = {k: v for k, v in config.items()
+                        if k not in ('parallel', 'quarantine')}
+        self._filter = record_filter
+        self._quarantine = quarantine
+
+    def run(self, blocks, emit_batch, func):
+        # Deliver events of blocks to func, and yield after each block.
+        head, lines = [], 0
+        for metas, records in blocks:
+            head.append((metas, records))
+            lines += len(metas)
+            if lines >= self._min_lines:
+                break
+        else:
+            for metas, records in head:
+                emit_batch(metas, records)
+                yield
+            return
+
+        yield from self._dispatch(itertools.chain(head, blocks), func)
+
+    @staticmethod
+    def context():
+        # Workers are not forked from the main process, which has threads of
+        # Prefetcher and AsyncRunner that may hold locks (e.g. of logging).
+        # They get only their end of Pipe, not ones of other workers.
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('forkserver')
+            ctx.set_forkserver_preload([__name__])
+            return ctx
+        return multiprocessing.get_context('spawn')
+
+    def _dispatch(self, blocks, func):
+        ctx = Parallel.context()
+
+        procs, conns = [], []
+        try:
+            for _ in range(self._workers):
+                conn, child = ctx.Pipe()
+                proc = ctx.Process(target=_parallel_worker, daemon=True,
+                                   args=(child, self._args, self._config,
+                                         self._quarantine is not None))
+                proc.start()
+                child.close()
+                procs.append(proc)
+                conns.append(conn)
+
+            # One block at a time per worker, so that neither side is blocked
+            # by a full pipe while the other one is sending.
+            idle, busy, done = list(conns), {}, {}
+            sent, expect = 0, 0
+            while True:
+                while idle and blocks is not None:
+                    block = next(blocks, None)
+                    if block is None:
+                        blocks = None
+                        break
+                    # Spouts set only timestamp and line of metadata, and
+                    # MetaData is slow to pickle.
+                    metas, records = block
+                    conn = idle.pop()
+                    try:
+                        conn.send((sent, metas[0].timestamp,
+                                   [x.line for x in metas], records))
+                    except OSError as e:
+                        raise Exception('Parser worker exited unexpectedly') from e
+                    busy[conn] = sent
+                    sent += 1
+
+                if not busy:
+                    break
+
+                for conn in multiprocessing.connection.wait(list(busy)):
+                    try:
+                        seq, events, rejects, stats, error = conn.recv()
+                    except (EOFError, OSError) as e:
+                        raise Exception('Parser worker exited unexpectedly') from e
+                    del busy[conn]
+                    idle.append(conn)
+                    if error is not None:
+                        raise error
+
+                    if self._order == 'relaxed':
+                        self._deliver(events, rejects, stats, func)
+                        yield
+                        continue
+
+                    done[seq] = (events, rejects, stats)
+                    while expect in done:
+                        self._deliver(*done.pop(expect), func)
+                        expect += 1
+                        yield
+        finally:
+            for conn in conns:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+                conn.close()
+            for proc in procs:
+                proc.join(1)
+                if proc.is_alive():
+                    proc.terminate()
+                    proc.join()
+
+    def _deliver(self, events, rejects, stats, func):
+        for reject in rejects:
+            self._quarantine.write(*reject)
+        if stats and self._filter:
+            self._filter.filtered += stats['filtered']
+            self._filter.passed += stats['passed']
+
+        for tag, timestamp, source, message, line, data in events:
+            meta = MetaData.__new__(MetaData)
+            meta.tag = tag
+            meta.timestamp = timestamp
+            meta.source = source
+            meta.message = message
+            meta.line = line
+            func(meta, data)
+
 
 class Stream:
     FUCTORY_MAP = {
         # fetchers
         's3-lines':         S3Lines,
         's3-text':          S3TextFile,
+        's3-stream-lines':  S3StreamLines,
+        's3-stream-text':   S3StreamText,
+        's3-json-array':    S3JsonArray,
         # general parsers
         'json':             Json,
         'syslog':           Syslog,
@@ -617,30 +2125,154 @@ class Stream:
         'ignore':           Ignore,
     }
 
-    def __init__(self, args):
+    def __init__(self, args, config=None, fused=True):
         self._root = None
-        self._head = None
         self._callback = Callback()
         self._callback.set_func(None)
 
+        tasks = []
+        for builder, task_arg in Stream.builders(args, config):
+            task = builder()
+            task.set_config(config)
+            task.set_arg(task_arg)
+            tasks.append(task)
+
+        # Handlers get only projected fields, and the last parser leaves
+        # derived fields to be computed on access.
+        if tasks and (config or {}).get('projection'):
+            last = tasks[-1]
+            if isinstance(last, Parser):
+                last.set_lazy(True)
+            tasks.append(Projection(config['projection'],
+                                    getattr(last, 'DERIVED', {})))
+
+        self._filter = None
+        if tasks and (config or {}).get('filter'):
+            self._filter = RecordFilter(config['filter'])
+            if self._filter.has_lines and not getattr(tasks[0], 'LINE_FILTER', False):
+                raise Exception('"{}" does not support include, exclude, regex '
+                                'and exclude_regex of filter'.format(args[0]))
+            tasks[0].set_filter(self._filter)
+            if self._filter.has_fields:
+                # Check fields right after records are decoded.
+                pos = 1 if getattr(tasks[0], 'DECODED', False) else 2
+                tasks.insert(min(pos, len(tasks)), FieldFilter(self._filter))
+
+        if fused:
+            tasks = fuse(tasks)
+
+        self._quarantine = None
+        if tasks and (config or {}).get('quarantine') is not None:
+            self._quarantine = Quarantine(config['quarantine'])
+            for task in tasks:
+                task.set_quarantine(self._quarantine)
+
+        self._parallel = None
+        if len(tasks) > 1 and (config or {}).get('parallel') is not None:
+            self._parallel = Parallel(args, config, self._filter,
+                                      self._quarantine)
+
+        for task in tasks:
+            if self._root:
+                head.pipe(task)
+            else:
+                self._root = task
+            head = task
+
+        head.pipe(self._callback)
+
+    @staticmethod
+    def builders(args, config=None):
+        # (task class, argument) of format list.
+        # Parsers declared in config by field mapping (see MappingParser).
+        declared = {name: mapping_parser(name, spec) for name, spec
+                    in (config or {}).get('parsers', {}).items()}
+
+        builders = []
         for arg in args:
-            builder = Stream.FUCTORY_MAP.get(arg)
+            name, _, task_arg = arg.partition(':')
+            builder = Stream.FUCTORY_MAP.get(name) or declared.get(name)
             if not builder:
                 raise Exception('No such parser "{}"'.format(arg))
+            builders.append((builder, task_arg))
+        return builders
 
-            task = builder()
-            if self._head:
-                self._head.pipe(task)
-                self._head = task
-            else:
-                self._root = self._head = task
+    @property
+    def stats(self):
+        # Counters of the filter clause for the last read(), or None.
+        return self._filter.stats if self._filter else None
+
+    @property
+    def quarantine(self):
+        # Counters of bad records for the last read(), or None.
+        return self._quarantine.stats if self._quarantine else None
 
-        self._head.pipe(self._callback)
+    def open(self, s3_bucket, s3_key):
+        if not self._root:
+            raise Exception('No task is configured')
 
-    def read(self, s3_bucket, s3_key, callback):
+        return self._root.open(s3_bucket, s3_key)
+
+    def _pump(self, s3_bucket, s3_key, func, source=None):
+        # Push blocks of the spout through the parsers to func, and yield
+        # after each block. Closing it stops reading the object.
+        if self._filter:
+            self._filter.reset()
+        if self._quarantine:
+            self._quarantine.reset()
+
+        blocks = self._root.batches(s3_bucket, s3_key, source)
+        self._callback.set_func(func)
+        try:
+            if self._parallel:
+                yield from self._parallel.run(blocks, self._root.emit_batch,
+                                              func)
+            else:
+                for metas, records in blocks:
+                    self._root.emit_batch(metas, records)
+                    yield
+        except BaseException:
+            if self._quarantine:
+                self._quarantine.discard()
+            raise
+        finally:
+            _close(blocks)
+            self._callback.set_func(None)
+
+        if self._quarantine:
+            self._quarantine.finish(s3_bucket, s3_key)
+
+    def iter(self, s3_bucket, s3_key, source=None, batches=False):
+        # Generator of (meta, event) of the object, or lists of them per
+        # block if batches. Blocks are read and parsed as the caller pulls
+        # events, and breaking the loop stops the download.
         if not self._root:
             raise Exception('No task is configured')
 
-        self._callback.set_func(callback)
-        self._root.run(s3_bucket, s3_key)
-        self._callback.set_func(None)
+        return self._iter(s3_bucket, s3_key, source, batches)
+
+    def _iter(self, s3_bucket, s3_key, source, batches):
+        out = []
+        pump = self._pump(s3_bucket, s3_key,
+                          lambda meta, data: out.append((meta, data)), source)
+        try:
+            for _ in pump:
+                if not out:
+                    continue
+
+                events = out[:]
+                out.clear()
+                if batches:
+                    yield events
+                else:
+                    yield from events
+        finally:
+            pump.close()
+
+    def read(self, s3_bucket, s3_key, callback, source=None):
+        if not self._root:
+            raise Exception('No task is configured')
+
+        for _ in self._pump(s3_bucket, s3_key, callback, source):
+            pass
+
@@ -114,6 +114,11 @@ def build_main_func(bucket_mapping, handler, sns_topic_arn, role_arn):
                 'HANDLER_PATH': handler['path'],
                 'HANDLER_ARGS': args_jdata,
                 'BUCKET_MAPPING': bmap_jdata,
+                'PREFETCH_DEPTH': str(handler.get('prefetch_depth', 1)),
+                'HANDLER_BATCH': json.dumps(handler.get('batch', {}),
+                                            separators=(',', ':')),
+                'HANDLER_ASYNC': json.dumps(handler.get('async', {}),
+                                            separators=(',', ':')),
             },
         },
         'DeadLetterQueue': {
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+import datetime
+import functools
+import time
+
+# Timezone of a timestamp without offset. LOCAL follows the TZ of the
+# process as datetime.strptime(...).timestamp() does (UTC on Lambda).
+LOCAL = None
+UTC = datetime.timezone.utc
+
+CACHE_SIZE = 4096
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+
+def _epoch(year, month, day, hour, minute, second, tz):
+    if tz is LOCAL:
+        return time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+
+    dt = datetime.datetime(year, month, day, hour, minute, second)
+    offset = tz.utcoffset(dt).total_seconds()
+    return float(calendar.timegm((year, month, day, hour, minute, second)) - offset)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _datetime(prefix, tz):
+    # 'YYYY-MM-DDTHH:MM:SS', 'YYYY-MM-DD HH:MM:SS' or 'YYYY/MM/DD HH:MM:SS'
+    if (len(prefix) != 19 or prefix[4] not in '-/' or prefix[7] != prefix[4] or
+            prefix[10] not in 'T ' or prefix[13] != ':' or prefix[16] != ':'):
+        raise ValueError('Unsupported datetime format: "{}"'.format(prefix))
+
+    return _epoch(int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+                  int(prefix[11:13]), int(prefix[14:16]), int(prefix[17:19]),
+                  tz)
+
+
+def parse(text, tz=LOCAL):
+    # Convert a datetime string with fixed layout to UNIX time. Fraction of
+    # second and any suffix (e.g. 'Z') are ignored and the time is regarded
+    # as in `tz`. Results are cached by second-resolution prefix because
+    # logs have heavy timestamp repetition.
+    return _datetime(text[:19], tz)
+
+
+@functools.lru_cache(maxsize=256)
+def _offset(suffix):
+    if suffix == 'Z':
+        return UTC
+
+    if len(suffix) in (5, 6) and suffix[0] in '+-':
+        hhmm = suffix[1:].replace(':', '')
+        if len(hhmm) == 4 and hhmm.isdigit():
+            delta = datetime.timedelta(hours=int(hhmm[:2]), minutes=int(hhmm[2:]))
+            return datetime.timezone(-delta if suffix[0] == '-' else delta)
+
+    raise ValueError('Unsupported UTC offset: "{}"'.format(suffix))
+
+
+def parse_iso8601(text, tz=LOCAL):
+    # Same as parse() but honors 'Z' or '+HH:MM' offset after seconds.
+    # `tz` is used only if no offset is given.
+    suffix = text[19:]
+    if suffix.startswith('.'):
+        suffix = suffix[1:].lstrip('0123456789')
+
+    return _datetime(text[:19], _offset(suffix) if suffix else tz)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _syslog(prefix, year, tz):
+    # 'Mmm dd HH:MM:SS' (day may be padded by space)
+    month = MONTHS.get(prefix[0:3])
+    if (not month or prefix[3] != ' ' or prefix[9] != ':' or prefix[12] != ':'):
+        raise ValueError('Unsupported syslog datetime: "{}"'.format(prefix))
+
+    return _epoch(year, month, int(prefix[4:6]), int(prefix[7:9]),
+                  int(prefix[10:12]), int(prefix[13:15]), tz)
+
+
+def parse_syslog(text, tz=LOCAL, now=None):
+    # Syslog datetime has no year. Regard it as in the current year, or in
+    # the last year if it is ahead of now by more than a day (e.g. a log of
+    # Dec 31 processed in Jan 1).
+    now = time.time() if now is None else now
+    prefix = text[:15]
+    if prefix[5:6] == ' ':
+        prefix = text[:4] + ' ' + text[4:14]  # day not padded, 'Nov 1 06:00:24'
+    year = time.localtime(now).tm_year if tz is LOCAL else \
+        datetime.datetime.fromtimestamp(now, tz).year
+
+    ts = _syslog(prefix, year, tz)
+    if ts > now + 86400:
+        ts = _syslog(prefix, year - 1, tz)
+
+    return ts
+
@@ -83,3 +83,111 @@ def decrypt(enc):
     kms = boto3.client('kms')
     raw = kms.decrypt(CiphertextBlob=base64.b64decode(enc))['Plaintext']
     return raw.decode('utf8')
+
+
+class PrefixTrie:
+    # Values indexed by prefix of keys. matches() walks the key once,
+    # instead of testing every prefix with startswith().
+    def __init__(self, items=()):
+        self._root = {}
+        for prefix, value in items:
+            self.add(prefix, value)
+
+    def add(self, prefix, value):
+        node = self._root
+        for c in prefix:
+            node = node.setdefault(c, {})
+        # Values of a node are kept under '' that is not a character.
+        node.setdefault('', []).append(value)
+
+    def matches(self, key):
+        # Values of all prefixes of key, from the longest prefix. Values of
+        # the same prefix are in order of add().
+        found = []
+        node = self._root
+        if '' in node:
+            found.append(node[''])
+        for c in key:
+            node = node.get(c)
+            if node is None:
+                break
+            if '' in node:
+                found.append(node[''])
+        return [v for values in reversed(found) for v in values]
+
+    def longest(self, key, default=None):
+        res = self.matches(key)
+        return res[0] if res else default
+
+    def items(self):
+        stack = [('', self._root)]
+        while stack:
+            prefix, node = stack.pop()
+            for c, child in node.items():
+                if c == '':
+                    yield prefix, child
+                else:
+                    stack.append((prefix + c, child))
+
+
+def compile_mapping(bucket_mapping):
+    # bucket name -> PrefixTrie of bucket_mapping entries.
+    return {bucket: PrefixTrie((x['prefix'], x) for x in entries)
+            for bucket, entries in bucket_mapping.items()}
+
+
+def check_mapping(bucket_mapping):
+    # Return (errors, warnings) of bucket_mapping. An object is handled by
+    # the entry with the longest prefix, so the same prefix in a bucket is
+    # ambiguous. Nested prefixes are valid but reported.
+    errors, warnings = [], []
+    for bucket, trie in sorted(compile_mapping(bucket_mapping).items()):
+        for prefix, entries in sorted(trie.items()):
+            if len(entries) > 1:
+                errors.append('{} entries for the same prefix "{}" of bucket '
+                              '"{}"'.format(len(entries), prefix, bucket))
+
+            shadow = trie.matches(prefix)[len(entries):]
+            if shadow:
+                warnings.append('prefix "{}" of bucket "{}" overlaps with "{}",'
+                                ' the longer one is used'.format(
+                                    prefix, bucket, shadow[0]['prefix']))
+    return errors, warnings
+
+
+class Router:
+    # Index of routing policies. route() returns the first policy in order
+    # that matches bucket and prefix of an object, or None.
+    def __init__(self, policies):
+        self._policies = policies
+        self._any = PrefixTrie()
+        self._buckets = {}
+        for i, policy in enumerate(policies):
+            if 'bucket' in policy:
+                trie = self._buckets.setdefault(policy['bucket'], PrefixTrie())
+            else:
+                trie = self._any
+            trie.add(policy.get('prefix', ''), i)
+
+    def route(self, s3_bucket, s3_key):
+        found = self._any.matches(s3_key)
+        if s3_bucket in self._buckets:
+            found += self._buckets[s3_bucket].matches(s3_key)
+        return self._policies[min(found)] if found else None
+
+
+def check_routing(policies):
+    # Return errors of routing policies. A policy that can not be matched
+    # because an earlier one covers its bucket and prefix is an error.
+    errors = []
+    for i, policy in enumerate(policies):
+        prefix = policy.get('prefix', '')
+        for j, prev in enumerate(policies[:i]):
+            if 'bucket' in prev and prev['bucket'] != policy.get('bucket'):
+                continue
+            if prefix.startswith(prev.get('prefix', '')):
+                errors.append('routing policy #{} {} is never used because of '
+                              '#{} {}'.format(i, json.dumps(policy), j,
+                                              json.dumps(prev)))
+                break
+    return errors
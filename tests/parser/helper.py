@@ -1,5 +1,8 @@
+import hashlib
 import sys
 
+import botocore.exceptions
+
 sys.path.insert(0, './slips/')
 
 import parser
@@ -25,3 +28,84 @@ def exec_test(builder, events):
 
     return q.fetch()
         
+
+
+class FakeBody:
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self._data) - self._pos
+        chunk = self._data[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeS3:
+    def __init__(self, objects):
+        self._objects = objects
+        self.bodies = []
+        self.ranges = []
+
+    def download_file(self, Bucket, Key, Filename, Config=None):
+        with open(Filename, 'wb') as fd:
+            fd.write(self._objects[(Bucket, Key)])
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, 'rb') as fd:
+            self._objects[(Bucket, Key)] = fd.read()
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self._objects[(Bucket, Key)]),
+                'ETag': self.etag(Bucket, Key)}
+
+    def etag(self, Bucket, Key):
+        return '"{}"'.format(hashlib.md5(self._objects[(Bucket, Key)]).hexdigest())
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        if IfMatch is not None and IfMatch != self.etag(Bucket, Key):
+            raise botocore.exceptions.ClientError(
+                {'Error': {'Code': 'PreconditionFailed'},
+                 'ResponseMetadata': {'HTTPStatusCode': 412}}, 'GetObject')
+
+        data = self._objects[(Bucket, Key)]
+        if Range:
+            self.ranges.append(Range)
+            begin, end = Range[len('bytes='):].split('-')
+            data = data[int(begin):int(end) + 1]
+
+        body = FakeBody(data)
+        self.bodies.append(body)
+        return {'Body': body, 'ContentLength': len(data)}
+
+
+def exec_spout(builder, objects, s3_bucket, s3_key, monkeypatch, config=None):
+    s3 = FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+    obj = builder()
+    obj.set_config(config)
+    q = Queue()
+    obj.pipe(q)
+    obj.run(s3_bucket, s3_key)
+    return q.fetch()
+
+
+def read_stream(monkeypatch, fmt, config, lines, s3_bucket='test-bucket',
+                s3_key='a.log', objects=None, fused=True):
+    # Read lines as an object on fake S3 by Stream of fmt and config. Return
+    # the stream and a list of (meta, event).
+    objects = {} if objects is None else objects
+    objects[(s3_bucket, s3_key)] = '\n'.join(lines).encode('utf8')
+    s3 = FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    stream = parser.Stream(fmt, config, fused=fused)
+    events = []
+    stream.read(s3_bucket, s3_key, lambda meta, ev: events.append((meta, ev)))
+    return stream, events
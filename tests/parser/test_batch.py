@@ -0,0 +1,92 @@
+import json
+import sys
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+class Upper(parser.Parser):
+    # Legacy parser that only implements recv().
+    def recv(self, meta: parser.MetaData, data: dict):
+        data['name'] = data['name'].upper()
+        self.emit(meta, data)
+
+
+class BatchQueue(helper.Queue):
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+
+    def recv_batch(self, metas, records):
+        self.batches += 1
+        for meta, data in zip(metas, records):
+            self.recv(meta, data)
+
+
+def test_spout_emits_blocks(monkeypatch):
+    body = '\n'.join(json.dumps({'name': 'n{}'.format(i)})
+                     for i in range(25)).encode('utf8')
+    objects = {('test-bucket', 'a.log'): body}
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    spout = parser.S3StreamLines()
+    spout.set_config({'batch_size': 10})
+    q = BatchQueue()
+    spout.pipe(q)
+    spout.run('test-bucket', 'a.log')
+
+    assert q.batches == 3
+    assert len(q.fetch()) == 25
+
+
+def test_legacy_parser_adapter():
+    js = parser.Json()
+    upper = Upper()
+    q = helper.Queue()
+    js.pipe(upper)
+    upper.pipe(q)
+
+    records = [{'message': json.dumps({'name': 'n{}'.format(i)})}
+               for i in range(3)]
+    js.recv_batch([parser.MetaData() for _ in records], records)
+
+    assert [d['name'] for m, d in q.fetch()] == ['N0', 'N1', 'N2']
+
+
+def test_batch_matches_recv():
+    records = [
+        {'type': 'dns', '@timestamp': '2018-06-01T10:00:00.000Z',
+         'query': 'example.com', 'client_ip': '10.0.0.1'},
+        {'type': 'http', '@timestamp': '2018-06-01T10:00:01.000Z'},
+    ]
+
+    single = helper.exec_test(parser.PacketBeat, json.loads(json.dumps(records)))
+
+    obj = parser.PacketBeat()
+    q = helper.Queue()
+    obj.pipe(q)
+    obj.recv_batch([parser.MetaData() for _ in records], records)
+    batch = q.fetch()
+
+    assert [(m.tag, m.timestamp, d) for m, d in single] == \
+        [(m.tag, m.timestamp, d) for m, d in batch]
+
+
+def test_batch_drops_records():
+    records = [
+        {'terminatingRuleId': 'Default_Action', 'timestamp': 1528000000000},
+        {'terminatingRuleId': 'Block', 'timestamp': 1528000000000,
+         'action': 'BLOCK', 'httpRequest': {'clientIp': '10.0.0.1'}},
+    ]
+    obj = parser.AwsWafLog()
+    q = helper.Queue()
+    obj.pipe(q)
+    obj.recv_batch([parser.MetaData() for _ in records], records)
+
+    qdata = q.fetch()
+    assert len(qdata) == 1
+    assert qdata[0][0].tag == 'aws.waf.log'
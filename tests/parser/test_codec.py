@@ -0,0 +1,75 @@
+import bz2
+import gzip
+import lzma
+import sys
+
+import pytest
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import codec
+import parser
+
+
+DATA = b''.join(b'{"seq": %d}\n' % i for i in range(10000))
+
+
+def split(data, size=997):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('name,compress', [
+    ('gzip', gzip.compress),
+    ('bz2', bz2.compress),
+    ('xz', lzma.compress),
+])
+def test_detect_and_decompress(name, compress):
+    comp = compress(DATA[:50000]) + compress(DATA[50000:])
+    assert codec.detect(comp[:codec.MAGIC_LEN]) == name
+    assert b''.join(codec.decompress(split(comp))) == DATA
+    assert b''.join(codec.decompress(split(comp), name)) == DATA
+
+
+def test_plain_and_padding():
+    assert b''.join(codec.decompress(split(DATA))) == DATA
+
+    comp = gzip.compress(DATA) + b'\x00' * 2000
+    assert b''.join(codec.decompress(split(comp))) == DATA
+
+
+def test_truncated():
+    comp = gzip.compress(DATA)
+    with pytest.raises(codec.CodecError):
+        list(codec.decompress([comp[:len(comp) // 2]]))
+
+
+def test_unsupported():
+    with pytest.raises(codec.CodecError):
+        list(codec.decompress([DATA], 'rar'))
+
+
+@pytest.mark.skipif(codec.zstandard is None, reason='zstandard is not installed')
+def test_zstd():
+    comp = codec.zstandard.ZstdCompressor().compress(DATA)
+    assert b''.join(codec.decompress(split(comp))) == DATA
+
+
+def test_misnamed_object(monkeypatch):
+    # bzip2 object without suffix is detected by magic bytes.
+    objects = {('test-bucket', 'logs/a.log'): bz2.compress(b'a\nb\n')}
+    qdata = helper.exec_spout(parser.S3StreamLines, objects,
+                              'test-bucket', 'logs/a.log', monkeypatch)
+    assert [d['message'] for m, d in qdata] == ['a', 'b']
+
+
+def test_codec_in_format(monkeypatch):
+    objects = {('test-bucket', 'logs/a.gz'): lzma.compress(b'{"a": 1}\n')}
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    stream = parser.Stream(['s3-stream-lines:xz', 'json'])
+    qdata = []
+    stream.read('test-bucket', 'logs/a.gz', lambda m, d: qdata.append(d))
+    assert qdata == [{'a': 1}]
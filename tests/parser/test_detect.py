@@ -0,0 +1,145 @@
+import gzip
+import json
+import sys
+
+import pytest
+
+import helper
+import test_paloalto
+
+sys.path.insert(0, './slips/')
+
+import parser
+import detect
+import main
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setattr(detect, '_CACHE', {})
+    monkeypatch.setattr(detect, '_LOADED', set())
+
+    objects = {}
+    fake = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: fake)
+    return objects, fake
+
+
+def beat(seq):
+    return json.dumps({'@timestamp': '2018-06-01T10:00:00.000Z',
+                       'type': 'dns', 'seq': seq})
+
+
+def test_guess():
+    lines = '\n'.join(beat(i) for i in range(3)).encode('utf8')
+    assert detect.guess(lines, True) == [
+        's3-stream-lines', 'json', 'packetbeat']
+
+    lines = '\n'.join(test_paloalto.traffic(i) for i in range(3))
+    assert detect.guess(lines.encode('utf8'), True) == [
+        's3-stream-lines', 'paloalto']
+
+    lines = b'Jun 11 10:00:00 host sshd[123]: Accepted publickey for root\n'
+    assert detect.guess(lines * 2, True) == ['s3-stream-lines', 'syslog']
+
+    lines = b'{"key": 1}\n{"key": 2}\n'
+    assert detect.guess(lines, True) == ['s3-stream-lines', 'json']
+
+    with pytest.raises(detect.DetectError):
+        detect.guess(b'hello world\n', True)
+
+
+def test_guess_truncated():
+    # The last line of a partial sample is not used.
+    lines = (beat(0) + '\n' + beat(1)[:20]).encode('utf8')
+    assert detect.guess(lines, False) == [
+        's3-stream-lines', 'json', 'packetbeat']
+
+
+def test_detect_format_cache(s3, tmpdir):
+    objects, fake = s3
+    doc = {'Records': [{'eventTime': '2018-06-01T10:00:00Z'}]}
+    objects[('b', 'trail/1.json.gz')] = gzip.compress(
+        json.dumps(doc, indent=2).encode('utf8'))
+    objects[('b', 'trail/2.json.gz')] = b'not used'
+
+    path = str(tmpdir.join('detect.json'))
+    config = {'prefix': 'trail/', 'format': 'auto', 'detect_cache': path}
+
+    assert detect.detect_format('b', 'trail/1.json.gz', config) == [
+        's3-json-array', 'cloudtrail']
+    assert len(fake.ranges) == 1
+
+    # Decided once per prefix.
+    assert detect.detect_format('b', 'trail/2.json.gz', config) == [
+        's3-json-array', 'cloudtrail']
+    assert len(fake.ranges) == 1
+
+    with open(path) as fd:
+        assert json.load(fd) == {'b/trail/': ['s3-json-array', 'cloudtrail']}
+
+    # A cold container loads the decision saved by others.
+    detect._CACHE.clear()
+    detect._LOADED.clear()
+    assert detect.detect_format('b', 'trail/2.json.gz', config) == [
+        's3-json-array', 'cloudtrail']
+    assert len(fake.ranges) == 1
+
+    detect.forget('b')
+    detect._LOADED.clear()
+    with open(path, 'w') as fd:
+        json.dump({}, fd)
+    with pytest.raises(detect.DetectError):
+        detect.detect_format('b', 'trail/2.json.gz', config)
+
+
+COUNTER_CODE = '''
+import slips.interface
+
+
+class Counter(slips.interface.Handler):
+    def setup(self, args):
+        self._count = 0
+
+    def recv(self, meta, event):
+        self._count += 1
+
+    def result(self):
+        return self._count
+'''
+
+
+def test_forget_failed_decision(monkeypatch, tmpdir):
+    monkeypatch.setattr(main.slips.detect, '_CACHE', {})
+    monkeypatch.setattr(main.slips.detect, '_LOADED', set())
+    monkeypatch.setattr(main, '_RUNTIME', None)
+    objects = {('b', 'logs/a.log'): '\n'.join(beat(i) for i in range(3)).encode('utf8')}
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    # A wrong decision saved by another container.
+    path = str(tmpdir.join('detect.json'))
+    with open(path, 'w') as fd:
+        json.dump({'b/logs/': ['s3-stream-lines', 'paloalto'],
+                   'b/other/': ['s3-stream-lines', 'kea']}, fd)
+
+    tmpdir.join('counter_handler.py').write(COUNTER_CODE)
+    args = {
+        'HANDLER_PATH': str(tmpdir.join('counter_handler.py')),
+        'HANDLER_ARGS': '{}',
+        'BUCKET_MAPPING': json.dumps({'b': [
+            {'prefix': 'logs/', 'format': 'auto', 'detect_cache': path}]}),
+    }
+    targets = [{'bucket_name': 'b', 'object_key': 'logs/a.log'}]
+
+    with pytest.raises(main.slips.parser.ParseError):
+        main.main(args, targets)
+    with open(path) as fd:
+        assert json.load(fd) == {'b/other/': ['s3-stream-lines', 'kea']}
+
+    # Retry detects the format again.
+    res = main.main(args, targets)
+    assert [v for k, v in res.items() if k.endswith('.Counter')] == [3]
+    with open(path) as fd:
+        assert json.load(fd)['b/logs/'] == [
+            's3-stream-lines', 'json', 'packetbeat']
@@ -0,0 +1,78 @@
+import json
+import sys
+
+import pytest
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def waf_lines():
+    return [json.dumps({'terminatingRuleId': rule, 'action': action,
+                        'timestamp': 1528658867000, 'httpSourceId': 'x',
+                        'httpRequest': {'clientIp': '10.0.0.{}'.format(i),
+                                        'country': country}})
+            for i, (rule, action, country) in enumerate([
+                ('Default_Action', 'ALLOW', 'JP'),
+                ('rule1', 'BLOCK', 'JP'),
+                ('rule2', 'BLOCK', 'US'),
+                ('Default_Action', 'ALLOW', 'US'),
+                ('rule3', 'COUNT', 'JP'),
+            ])]
+
+
+def test_line_filter(monkeypatch):
+    config = {'filter': {'exclude': ['"Default_Action"'],
+                         'regex': '"action": "(BLOCK|COUNT)"'}}
+    stream, events = helper.read_stream(
+        monkeypatch, ['s3-stream-lines', 'json', 'aws-waf'], config, waf_lines())
+
+    assert [d['terminatingRuleId'] for m, d in events] == ['rule1', 'rule2', 'rule3']
+    assert stream.stats == {'filtered': 2, 'passed': 3}
+
+
+def test_field_filter(monkeypatch):
+    config = {'filter': {'include': ['BLOCK', 'COUNT'],
+                         'fields': {'httpRequest.country': 'JP',
+                                    'action': {'in': ['BLOCK', 'COUNT']}}}}
+    stream, events = helper.read_stream(
+        monkeypatch, ['s3-stream-lines', 'json', 'aws-waf'], config, waf_lines())
+
+    assert [d['terminatingRuleId'] for m, d in events] == ['rule1', 'rule3']
+    assert stream.stats == {'filtered': 3, 'passed': 2}
+
+
+def test_field_filter_decoded_spout(monkeypatch):
+    body = json.dumps({'Records': [json.loads(x) for x in waf_lines()]})
+    config = {'filter': {'fields': {'terminatingRuleId': {'ne': 'Default_Action'},
+                                    'httpSourceId': {'exists': True}}}}
+    stream, events = helper.read_stream(
+        monkeypatch, ['s3-json-array', 'aws-waf'], config, [body])
+
+    assert len(events) == 3
+    assert stream.stats == {'filtered': 2, 'passed': 3}
+
+
+def test_filter_invalid():
+    with pytest.raises(Exception):
+        parser.RecordFilter({'fields': {'a': {'like': 'x'}}})
+    with pytest.raises(Exception):
+        parser.RecordFilter({'includes': ['x']})
+
+    assert parser.Stream(['s3-stream-lines', 'json']).stats is None
+
+
+def test_line_filter_unsupported_spout():
+    config = {'filter': {'include': ['BLOCK']}}
+    for fmt in [['s3-json-array', 'aws-waf'], ['s3-text', 'json'],
+                ['s3-stream-text', 'json']]:
+        with pytest.raises(Exception, match='does not support'):
+            parser.Stream(fmt, config)
+
+    # Field predicates are checked after the records are decoded.
+    parser.Stream(['s3-json-array', 'aws-waf'],
+                  {'filter': {'fields': {'action': 'BLOCK'}}})
+    parser.Stream(['s3-lines', 'json'], config)
@@ -0,0 +1,41 @@
+import json
+import sys
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def packetbeat(seq):
+    return json.dumps({'@timestamp': '2018-06-01T10:00:00.000Z', 'type': 'dns',
+                       'client_ip': '10.0.0.{}'.format(seq),
+                       'query': 'class IN, type A, example.com'})
+
+
+def test_fuse():
+    kea, proj = parser.Kea(), parser.Projection(['a'], {})
+    js, pa = parser.Json(), parser.PaloAlto()
+    ff = parser.FieldFilter(parser.RecordFilter({'fields': {'a': 1}}))
+
+    tasks = parser.fuse([js, ff, kea, pa, proj])
+    assert tasks[0] is js
+    assert isinstance(tasks[1], parser.Fused) and tasks[1]._tasks == [ff, kea]
+    assert tasks[2] is pa
+    assert isinstance(tasks[3], parser.Fused) and tasks[3]._tasks == [proj]
+
+    assert parser.fuse([js, pa]) == [js, pa]
+
+
+def test_fused_stream(monkeypatch):
+    config = {'filter': {'fields': {'client_ip': {'ne': '10.0.0.2'}}},
+              'projection': ['client_ip', 'message']}
+    fmt = ['s3-stream-lines', 'json', 'packetbeat']
+    lines = [packetbeat(i) for i in range(5)]
+
+    _, expected = helper.read_stream(monkeypatch, fmt, config, lines, fused=False)
+    _, events = helper.read_stream(monkeypatch, fmt, config, lines)
+    assert len(expected) == 4
+    assert [(m.tag, dict(d)) for m, d in events] == \
+        [(m.tag, dict(d)) for m, d in expected]
@@ -0,0 +1,83 @@
+import gzip
+import json
+import sys
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+LINES = [json.dumps({'seq': i, 'pad': 'x' * 100}) for i in range(10000)]
+
+
+def fake_s3(monkeypatch, data):
+    s3 = helper.FakeS3({('b', 'a.log'): data})
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+    return s3
+
+
+def make_stream(config=None):
+    config = dict(config or {}, batch_size=100, download={'read_size': 4096})
+    return parser.Stream(['s3-stream-lines', 'json'], config)
+
+
+def test_iter(monkeypatch):
+    fake_s3(monkeypatch, '\n'.join(LINES).encode('utf8'))
+    stream = make_stream()
+
+    pulled = [ev['seq'] for meta, ev in stream.iter('b', 'a.log')]
+    pushed = []
+    stream.read('b', 'a.log', lambda meta, ev: pushed.append(ev['seq']))
+    assert pulled == pushed == list(range(10000))
+
+    blocks = list(stream.iter('b', 'a.log', batches=True))
+    assert [len(x) for x in blocks] == [100] * 100
+
+
+def test_iter_early_stop(monkeypatch):
+    data = gzip.compress('\n'.join(LINES).encode('utf8'))
+    s3 = fake_s3(monkeypatch, data)
+    stream = make_stream()
+
+    for meta, ev in stream.iter('b', 'a.log'):
+        if ev['seq'] == 150:
+            break
+
+    # The body is closed right after break, before it is read through.
+    body = s3.bodies[0]
+    assert body.closed
+    assert body._pos < len(data) // 2
+
+
+def test_iter_quarantine(monkeypatch):
+    lines = LINES[:300] + ['{']
+    s3 = fake_s3(monkeypatch, '\n'.join(lines).encode('utf8'))
+    stream = make_stream({'quarantine': {}})
+
+    assert len(list(stream.iter('b', 'a.log'))) == 300
+    assert stream.quarantine['bad'] == 1
+    assert ('b', 'quarantine/a.log.jsonl') in s3._objects
+
+    # Nothing is uploaded if the loop stops early.
+    del s3._objects[('b', 'quarantine/a.log.jsonl')]
+    next(stream.iter('b', 'a.log'))
+    assert ('b', 'quarantine/a.log.jsonl') not in s3._objects
+
+
+def test_iter_interleaved():
+    # Streams of the same format are read at the same time.
+    fmt = ['s3-stream-lines', 'json']
+    config = {'batch_size': 10}
+    a = parser.Stream(fmt, config).iter(
+        'b', 'a.log', ['\n'.join(LINES[:100]).encode('utf8')])
+    b = parser.Stream(fmt, config).iter(
+        'b', 'b.log', ['\n'.join(LINES[100:200]).encode('utf8')])
+
+    seq_a, seq_b = [], []
+    for (_, ev_a), (_, ev_b) in zip(a, b):
+        seq_a.append(ev_a['seq'])
+        seq_b.append(ev_b['seq'])
+    assert seq_a == list(range(100))
+    assert seq_b == list(range(100, 200))
@@ -0,0 +1,51 @@
+import json
+import sys
+
+import pytest
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+LINES = [json.dumps({'type': 'dns', 'n': i, 'f': 1.5, 'u': 'café'}).encode('utf8')
+         for i in range(5)]
+
+
+def run_batch(arg, lines):
+    obj = parser.Json()
+    obj.set_arg(arg)
+    q = helper.Queue()
+    obj.pipe(q)
+    obj.recv_batch([parser.MetaData() for _ in lines],
+                   [{'message': x} for x in lines])
+    return [d for m, d in q.fetch()]
+
+
+@pytest.mark.parametrize('backend', ['stdlib', 'orjson', 'ujson'])
+def test_json_backend(backend):
+    if not parser.Json.BACKENDS[backend]:
+        pytest.skip('{} is not installed'.format(backend))
+    assert run_batch(backend, LINES) == [json.loads(x) for x in LINES]
+
+
+def test_json_backend_fallback():
+    lines = LINES[:2] + [b'{"a": "\xff"}', b'{"a": NaN}'] + LINES[2:]
+    res = run_batch(None, lines)
+
+    # Non UTF-8 line is skipped and NaN is accepted as stdlib does.
+    assert len(res) == 6
+    assert res[2]['a'] != res[2]['a']
+
+    with pytest.raises(ValueError) as e:
+        run_batch(None, LINES[:1] + [b'{"a": 1'] + LINES[1:])
+    assert 'char 7' in str(e.value)
+
+
+def test_json_backend_invalid():
+    with pytest.raises(Exception):
+        parser.Json().set_arg('simdjson')
+
+    parser.Stream(['s3-lines', 'json:stdlib'])
@@ -0,0 +1,81 @@
+import gzip
+import json
+import sys
+
+import pytest
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def texts(doc, size):
+    return (doc[i:i + size] for i in range(0, len(doc), size))
+
+
+def test_iter_json_array():
+    doc = json.dumps({
+        'meta': {'Records': 'not this', 'list': [1, 2, {'a': '[]{}'}]},
+        'count': 12345,
+        'Records': [{'seq': i, 'text': 'x, y] }'} for i in range(50)] + [67890],
+        'trailer': 'ignored',
+    })
+
+    for size in [1, 7, 1024]:
+        recs = list(parser.iter_json_array(texts(doc, size), ['Records']))
+        assert recs == [{'seq': i, 'text': 'x, y] }'} for i in range(50)] + [67890]
+
+
+def test_iter_json_array_path():
+    doc = '[1, 2]'
+    assert list(parser.iter_json_array(texts(doc, 1), [])) == [1, 2]
+
+    doc = ' { "a" : { "b" : [ ] } } '
+    assert list(parser.iter_json_array(texts(doc, 1), ['a', 'b'])) == []
+
+    with pytest.raises(parser.ParseError):
+        list(parser.iter_json_array(texts(doc, 3), ['Records']))
+
+    with pytest.raises(parser.ParseError):
+        list(parser.iter_json_array(texts('{"Records": [{"a": 1}, {"b"', 4),
+                                    ['Records']))
+
+
+def test_iter_json_array_malformed(monkeypatch):
+    # The rest of the document is not read after a malformed element.
+    monkeypatch.setattr(parser._JsonReader, 'MAX_LOOKAHEAD', 1024)
+    doc = '{"Records": [{"a": 1}, {"a": x}, ' + ', '.join(
+        json.dumps({'seq': i}) for i in range(10000)) + ']}'
+    chunks = texts(doc, 100)
+
+    with pytest.raises(parser.ParseError):
+        list(parser.iter_json_array(chunks, ['Records']))
+    assert len(list(chunks)) > len(doc) // 100 - 20
+
+
+def test_cloudtrail_on_json_array(monkeypatch):
+    records = [{
+        'eventVersion': '1.05',
+        'eventTime': '2018-06-01T10:00:{:02d}Z'.format(i),
+        'eventType': 'AwsApiCall',
+        'eventName': 'DescribeInstances',
+        'userIdentity': {'arn': 'arn:aws:iam::123456789012:user/test'},
+        'sourceIPAddress': '10.0.0.1',
+    } for i in range(30)]
+    body = gzip.compress(json.dumps({'Records': records}).encode('utf8'))
+    objects = {('test-bucket', 'trail.json.gz'): body}
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    results = {}
+    for spout in ['s3-text', 's3-json-array']:
+        qdata = []
+        stream = parser.Stream([spout, 'cloudtrail'])
+        stream.read('test-bucket', 'trail.json.gz',
+                    lambda m, d: qdata.append((m.tag, m.timestamp, d)))
+        results[spout] = qdata
+
+    assert len(results['s3-json-array']) == 30
+    assert results['s3-json-array'] == results['s3-text']
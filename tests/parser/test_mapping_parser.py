@@ -0,0 +1,70 @@
+import json
+import sys
+
+import pytest
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def test_mapping_parser():
+    builder = parser.mapping_parser('Sample', {
+        'tag': 'sample.{kind}',
+        'timestamp': {'field': 'ts.epoch', 'format': 'epoch_ms'},
+        'message': '{user.name} {action} ({missing})',
+    })
+    qdata = helper.exec_test(builder, [
+        {'kind': 'login', 'ts': {'epoch': 1528658867123},
+         'user': {'name': 'alice'}, 'action': 'logged in'},
+        {'kind': 'logout'},
+    ])
+
+    m, d = qdata[0]
+    assert builder.__name__ == 'Sample'
+    assert m.tag == 'sample.login'
+    assert m.timestamp == 1528658867
+    assert d['message'] == 'alice logged in (None)'
+
+    m, d = qdata[1]
+    assert m.tag == 'sample.logout'
+    assert m.timestamp != 1528658867
+    assert d['message'] == 'None None (None)'
+
+
+def test_mapping_parser_timestamp():
+    utc = parser.mapping_parser('Utc', {
+        'tag': 't', 'timestamp': {'field': 'time', 'tz': 'utc'}})
+    iso = parser.mapping_parser('Iso', {
+        'tag': 't', 'timestamp': {'field': 'time', 'format': 'iso8601'}})
+
+    data = {'time': '2018-06-10T19:27:47+09:00'}
+    assert helper.exec_test(utc, [dict(data)])[0][0].timestamp == 1528658867
+    assert helper.exec_test(iso, [dict(data)])[0][0].timestamp == 1528658867 - 32400
+
+
+def test_mapping_parser_invalid():
+    with pytest.raises(Exception):
+        parser.mapping_parser('Bad', {'tag': 't', 'tags': 'x'})
+    with pytest.raises(Exception):
+        parser.mapping_parser('Bad', {'timestamp': {'field': 't',
+                                                    'format': 'unix'}})
+
+
+def test_stream_declared_parser(monkeypatch):
+    s3 = helper.FakeS3({('test-bucket', 'logs/a.log'): json.dumps(
+        {'eventTime': '2018-06-10 19:27:47', 'app': 'web'}).encode('utf8')})
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    config = {'parsers': {'my-app': {
+        'tag': 'my.{app}', 'timestamp': {'field': 'eventTime', 'tz': 'utc'}}}}
+    stream = parser.Stream(['s3-stream-lines', 'json', 'my-app'], config)
+    qdata = []
+    stream.read('test-bucket', 'logs/a.log',
+                lambda m, d: qdata.append((m.tag, m.timestamp)))
+    assert qdata == [('my.web', 1528658867)]
+
+    with pytest.raises(Exception):
+        parser.Stream(['s3-stream-lines', 'json', 'my-app'])
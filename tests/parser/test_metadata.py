@@ -0,0 +1,30 @@
+import pickle
+import sys
+import time
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def test_metadata_default():
+    meta = parser.MetaData()
+    assert meta.tag is None
+    assert meta.source == {}
+    assert meta.message is None
+    assert abs(meta.timestamp - time.time()) < 5
+    assert not hasattr(meta, '__dict__')
+
+    assert parser.MetaData(timestamp=1528658867).timestamp == 1528658867
+
+
+def test_metadata_copy():
+    meta = parser.MetaData(timestamp=1528658867)
+    meta.tag = 'test.tag'
+
+    for m in [meta.copy(), parser.MetaData(meta), pickle.loads(pickle.dumps(meta))]:
+        assert (m.tag, m.timestamp, m.source, m.message) == \
+            ('test.tag', 1528658867, {}, None)
+        m.tag = 'other.tag'
+        m.timestamp = 0
+        assert (meta.tag, meta.timestamp) == ('test.tag', 1528658867)
@@ -0,0 +1,105 @@
+import copy
+import pickle
+import sys
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def traffic(seq):
+    row = ['1', '2018/06/01 10:00:00', '001801000000', 'TRAFFIC', 'end', '1',
+           '2018/06/01 10:00:00', '10.0.0.{}'.format(seq), '192.168.0.1',
+           '0.0.0.0', '0.0.0.0', 'rule1', '', '', 'ssl', 'vsys1', 'trust',
+           'untrust', 'ethernet1/1', 'ethernet1/2', 'forward',
+           '2018/06/01 10:00:00', str(seq), '1', '50000', '443', '0', '0',
+           '0x0', 'tcp', 'allow', '1000', '400', '600', '10',
+           '2018/06/01 09:59:{:02d}'.format(seq % 60), '1', 'any', '0', '1',
+           '0x0', '10.0.0.0-10.255.255.255', 'JP', '0', '5', '5',
+           'tcp-fin', '0', '0', '0', '0', '', 'PA-1', 'from-policy']
+    assert len(row) == len(parser.PaloAlto.TRAFFIC_COLUMN)
+    return ','.join(row)
+
+
+def threat(seq):
+    row = ['1', '2018/06/01 10:00:00', '001801000000', 'THREAT', 'url', '1',
+           '2018/06/01 10:00:00', '10.0.0.{}'.format(seq), '192.168.0.1',
+           '0.0.0.0', '0.0.0.0', 'rule1', '', '', 'web-browsing', 'vsys1',
+           'trust', 'untrust', 'ethernet1/1', 'ethernet1/2', 'forward',
+           '2018/06/01 10:00:00', str(seq), '1', '50000', '80', '0', '0',
+           '0x0', 'tcp', 'alert', '"example.com/a,b"', 'Eicar(1)', 'any',
+           'informational', 'client-to-server', '1', '0x0', 'JP', 'US', '0',
+           'text/html', '0', '', '', '1', 'curl', '', '', '', '', '', '', '0',
+           '0', '0', '0', '0', '', 'PA-1', '']
+    assert len(row) == len(parser.PaloAlto.THREAT_COLUMN)
+    return ','.join('"{}"'.format(x.replace('"', '""')) if ',' in x else x
+                    for x in row)
+
+
+def run_batch(obj, lines):
+    q = helper.Queue()
+    obj.pipe(q)
+    obj.recv_batch([parser.MetaData() for _ in lines],
+                   [{'message': x} for x in lines])
+    return q.fetch()
+
+
+def test_paloalto_batch():
+    lines = [traffic(i) for i in range(5)] + [threat(i) for i in range(5)]
+    single = helper.exec_test(parser.PaloAlto, [{'message': x} for x in lines])
+    batch = run_batch(parser.PaloAlto(), lines)
+
+    assert [(m.tag, m.timestamp, d) for m, d in single] == \
+        [(m.tag, m.timestamp, d) for m, d in batch]
+
+    m, d = batch[0]
+    assert m.tag == 'paloalto.traffic'
+    assert d['message'] == '10.0.0.0:50000 => 192.168.0.1:443 (tcp), ' \
+                           'Sent 400 byte, Recv 600 byte'
+    assert d['raw_message'] == lines[0]
+
+    m, d = batch[5]
+    assert m.tag == 'paloalto.threat'
+    assert d['URL'] == 'example.com/a,b'
+    assert d['message'] == '10.0.0.0:50000 => 192.168.0.1:80 (tcp), ' \
+                           'Sent None byte, Recv None byte Eicar(1)'
+
+
+def test_paloalto_batch_fallback():
+    # Unterminated quote runs over lines in a single reader.
+    lines = [traffic(1), traffic(2)[:-len('from-policy')] + '"from-policy',
+             traffic(3)]
+    single = helper.exec_test(parser.PaloAlto, [{'message': x} for x in lines])
+    batch = run_batch(parser.PaloAlto(), lines)
+
+    assert [d['Session ID'] for m, d in batch] == ['1', '2', '3']
+    assert [d for m, d in batch] == [d for m, d in single]
+
+
+def test_paloalto_compact():
+    obj = parser.PaloAlto()
+    obj.set_arg('compact')
+    lines = [traffic(1), threat(2)]
+    batch = run_batch(obj, lines)
+    expected = run_batch(parser.PaloAlto(), lines)
+
+    for (m, d), (em, ed) in zip(batch, expected):
+        assert isinstance(d, parser.PaloAltoRow)
+        assert m.tag == em.tag
+        assert d['Source address'] == ed['Source address']
+        assert d.get('message') == ed['message']
+        assert d.get('no such key') is None
+        assert dict(d) == ed
+
+        clone = copy.deepcopy(d)
+        assert clone._layout is d._layout
+        d['extra'] = 1
+        assert d.to_dict()['extra'] == 1
+        assert 'extra' not in clone
+        assert dict(clone) == ed
+
+        loaded = pickle.loads(pickle.dumps(d))
+        assert loaded._layout is d._layout
+        assert dict(loaded) == dict(ed, extra=1)
@@ -0,0 +1,129 @@
+import json
+import multiprocessing
+import os
+import signal
+import sys
+
+import pytest
+
+import helper
+import test_paloalto
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def packetbeat(seq):
+    return json.dumps({'@timestamp': '2018-06-01T10:00:00.000Z', 'type': 'dns',
+                       'seq': seq, 'client_ip': '10.0.0.{}'.format(seq % 256)})
+
+
+def read(monkeypatch, fmt, config, lines, objects=None):
+    stream, events = helper.read_stream(
+        monkeypatch, fmt, dict(config, batch_size=50), lines, objects=objects)
+    return stream, [(meta.line, dict(ev)) for meta, ev in events]
+
+
+def test_parallel_ordered(monkeypatch):
+    fmt = ['s3-stream-lines', 'json', 'packetbeat']
+    lines = [packetbeat(i) for i in range(1000)]
+    config = {'projection': ['seq', 'client_ip']}
+
+    _, expected = read(monkeypatch, fmt, config, lines)
+    parallel = {'workers': 3, 'min_lines': 0}
+    _, events = read(monkeypatch, fmt, dict(config, parallel=parallel), lines)
+    assert events == expected
+    assert not multiprocessing.active_children()
+
+
+def test_parallel_relaxed(monkeypatch):
+    fmt = ['s3-stream-lines', 'paloalto']
+    lines = [test_paloalto.traffic(i) for i in range(500)]
+
+    _, expected = read(monkeypatch, fmt, {}, lines)
+    parallel = {'workers': 2, 'order': 'relaxed', 'min_lines': 0}
+    _, events = read(monkeypatch, fmt, {'parallel': parallel}, lines)
+    assert sorted(events, key=lambda x: x[0]) == expected
+
+
+def test_parallel_small_object(monkeypatch):
+    # Not worth starting workers.
+    monkeypatch.setattr(parser.Parallel, '_dispatch', None)
+    fmt = ['s3-stream-lines', 'json', 'packetbeat']
+    lines = [packetbeat(i) for i in range(120)]
+
+    _, expected = read(monkeypatch, fmt, {}, lines)
+    _, events = read(monkeypatch, fmt, {'parallel': {'min_lines': 121}}, lines)
+    assert events == expected
+
+
+def test_parallel_filter_and_quarantine(monkeypatch):
+    objects = {}
+    fmt = ['s3-stream-lines', 'json', 'packetbeat']
+    lines = [packetbeat(i) if i % 10 else '{"seq": ' for i in range(300)]
+    config = {'filter': {'exclude': ['"seq": 1,'],
+                         'fields': {'client_ip': {'ne': '10.0.0.2'}}},
+              'quarantine': {'max_ratio': 0.2, 'bucket': 'q'},
+              'parallel': {'workers': 2, 'min_lines': 0}}
+
+    serial = {k: v for k, v in config.items() if k != 'parallel'}
+    stream, expected = read(monkeypatch, fmt, serial, lines, objects)
+    assert stream.stats == {'filtered': 3, 'passed': 267}
+
+    stream, events = read(monkeypatch, fmt, config, lines, objects)
+    assert events == expected
+    assert stream.stats == {'filtered': 3, 'passed': 267}
+    assert stream.quarantine['total'] == 300
+    assert stream.quarantine['bad'] == 30
+
+    bad = [json.loads(x) for x in
+           objects[('q', 'quarantine/a.log.jsonl')].decode('utf8').splitlines()]
+    assert [x['line'] for x in bad] == list(range(1, 301, 10))
+
+
+def test_parallel_error(monkeypatch):
+    fmt = ['s3-stream-lines', 'paloalto']
+    lines = [test_paloalto.traffic(i) for i in range(100)] + ['1,2,3,X,5']
+
+    with pytest.raises(parser.ParseError):
+        read(monkeypatch, fmt, {'parallel': {'workers': 2, 'min_lines': 0}}, lines)
+    assert not multiprocessing.active_children()
+
+
+def test_parallel_worker_killed():
+    assert parser.Parallel.context().get_start_method() != 'fork'
+    stream = parser.Stream(['s3-stream-lines', 'json'],
+                           {'batch_size': 10, 'parallel': {'workers': 2,
+                                                           'min_lines': 0}})
+    lines = [json.dumps({'seq': i}) for i in range(1000)]
+
+    def kill(meta, ev):
+        for proc in multiprocessing.active_children():
+            try:
+                os.kill(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    with pytest.raises(Exception, match='exited unexpectedly'):
+        stream.read('b', 'a.log', kill, ['\n'.join(lines).encode('utf8')])
+    assert not multiprocessing.active_children()
+
+
+def test_parallel_early_stop():
+    stream = parser.Stream(['s3-stream-lines', 'json'],
+                           {'batch_size': 10, 'parallel': {'min_lines': 0}})
+    lines = [json.dumps({'seq': i}) for i in range(1000)]
+
+    for meta, ev in stream.iter('b', 'a.log', ['\n'.join(lines).encode('utf8')]):
+        if ev['seq'] == 15:
+            break
+    assert not multiprocessing.active_children()
+
+
+def test_parallel_config():
+    fmt = ['s3-stream-lines', 'json']
+    with pytest.raises(Exception, match='Unknown keys in parallel'):
+        parser.Stream(fmt, {'parallel': {'worker': 2}})
+    with pytest.raises(Exception, match='Invalid order'):
+        parser.Stream(fmt, {'parallel': {'order': 'any'}})
@@ -0,0 +1,90 @@
+import copy
+import json
+import pickle
+import sys
+
+import helper
+import test_paloalto
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def test_projection_paloalto(monkeypatch):
+    lines = [test_paloalto.traffic(1), test_paloalto.threat(2)]
+    fmt = ['s3-stream-lines', 'paloalto']
+    _, full = helper.read_stream(monkeypatch, fmt, {}, lines)
+    config = {'projection': ['Source address', 'URL', 'message', 'Nothing']}
+    _, qdata = helper.read_stream(monkeypatch, fmt, config, lines)
+
+    for (m, d), (em, ed) in zip(qdata, full):
+        assert isinstance(d, parser.LazyRecord)
+        assert (m.tag, m.timestamp) == (em.tag, em.timestamp)
+        assert dict.get(d, 'message') is None
+        assert 'message' in d
+        assert 'Nothing' not in d
+        assert d['message'] == ed['message']
+        assert d['Source address'] == ed['Source address']
+
+    assert 'URL' not in qdata[0][1]
+    assert qdata[1][1]['URL'] == 'example.com/a,b'
+
+
+def test_projection_materialize(monkeypatch):
+    lines = [json.dumps({'type': 'dns', 'query': 'example.com',
+                         'client_ip': '10.0.0.1', 'bytes_in': 29})]
+    config = {'projection': ['type', 'client_ip', 'message']}
+    fmt = ['s3-stream-lines', 'json', 'packetbeat']
+    _, [(m, d)] = helper.read_stream(monkeypatch, fmt, config, lines)
+    expected = {'type': 'dns', 'client_ip': '10.0.0.1',
+                'message': 'example.com from 10.0.0.1'}
+    assert m.tag == 'packetbeat.dns'
+    assert len(d) == 3
+    assert d == expected
+    assert json.loads(json.dumps(d)) == expected
+    assert dict(d) == expected
+    assert pickle.loads(pickle.dumps(d)) == expected
+
+    _, [(m, d)] = helper.read_stream(monkeypatch, fmt, config, lines)
+    clone = copy.deepcopy(d)
+    assert isinstance(clone, parser.LazyRecord)
+    clone['type'] = 'x'
+    assert clone['message'] == 'example.com from 10.0.0.1'
+    assert d == expected
+
+
+def test_projection_derived_only(monkeypatch):
+    lines = [json.dumps({'type': 'dns', 'query': 'example.com',
+                         'client_ip': '10.0.0.1'})]
+    config = {'projection': ['message']}
+    _, [(m, d)] = helper.read_stream(
+        monkeypatch, ['s3-stream-lines', 'json', 'packetbeat'], config, lines)
+    assert json.loads(json.dumps(d)) == {'message': 'example.com from 10.0.0.1'}
+
+
+def test_projection_setdefault(monkeypatch):
+    lines = [json.dumps({'type': 'dns', 'query': 'example.com',
+                         'client_ip': '10.0.0.1'})]
+    config = {'projection': ['client_ip', 'message']}
+    _, [(m, d)] = helper.read_stream(
+        monkeypatch, ['s3-stream-lines', 'json', 'packetbeat'], config, lines)
+    assert d.setdefault('message', 'x') == 'example.com from 10.0.0.1'
+    assert d.setdefault('other', 'x') == 'x'
+    assert d['other'] == 'x'
+
+
+def test_projection_waf(monkeypatch):
+    lines = [json.dumps({'terminatingRuleId': 'rule1', 'action': 'BLOCK',
+                         'timestamp': 1528658867000, 'httpSourceId': 'cf',
+                         'httpRequest': {'clientIp': '10.0.0.1', 'uri': '/a',
+                                         'headers': [{'name': 'Host',
+                                                      'value': 'example.com'}]}})]
+    fmt = ['s3-stream-lines', 'json', 'aws-waf']
+    _, full = helper.read_stream(monkeypatch, fmt, {}, lines)
+    _, [(m, d)] = helper.read_stream(
+        monkeypatch, fmt, {'projection': ['action', 'message', 'httpRequest']},
+        lines)
+    assert d.get('message') == full[0][1]['message']
+    assert d['httpRequest']['header'] == {'Host': 'example.com'}
+    assert d.get('terminatingRuleId') is None
@@ -0,0 +1,115 @@
+import json
+import sys
+
+import pytest
+
+import helper
+import test_paloalto
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def read(monkeypatch, fmt, config, lines):
+    # Bad records uploaded to the bucket of the object, or None.
+    objects = {}
+    stream, events = helper.read_stream(monkeypatch, fmt, config, lines,
+                                        'b', 'logs/a.log', objects)
+    bad = objects.get(('b', 'quarantine/logs/a.log.jsonl'))
+    bad = [json.loads(x) for x in bad.decode('utf8').splitlines()] if bad else None
+    return stream, events, bad
+
+
+def test_quarantine_paloalto(monkeypatch):
+    lines = [test_paloalto.traffic(1), '1,2,3,UNKNOWN,5',
+             test_paloalto.traffic(3), 'x']
+    stream, events, bad = read(monkeypatch, ['s3-stream-lines', 'paloalto'],
+                               {'quarantine': {'max_ratio': 0.5}}, lines)
+
+    assert [meta.line for meta, ev in events] == [1, 3]
+    assert [(x['line'], x['record']) for x in bad] == [
+        (2, '1,2,3,UNKNOWN,5'), (4, 'x')]
+    assert bad[0]['reason'].startswith('ParseError: Unsupported log type')
+    assert stream.quarantine == {
+        'total': 4, 'bad': 2, 'path': 's3://b/quarantine/logs/a.log.jsonl'}
+
+
+def test_quarantine_json(monkeypatch):
+    lines = ['{"a": 1}', '{"a": ', '{"a": 3}']
+    stream, events, bad = read(monkeypatch, ['s3-stream-lines', 'json'],
+                               {'quarantine': {'max_ratio': 0.5}}, lines * 100)
+
+    assert len(events) == 200
+    assert len(bad) == 100
+    assert bad[0]['line'] == 2
+    assert bad[0]['record'] == '{"a":'
+    assert bad[0]['reason'].startswith('JSONDecodeError')
+
+
+def test_quarantine_budget(monkeypatch):
+    lines = [test_paloalto.traffic(1), 'x', 'y']
+    objects = {('b', 'a.log'): '\n'.join(lines).encode('utf8')}
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    # Bad records are kept even if the object fails.
+    stream = parser.Stream(['s3-stream-lines', 'paloalto'], {'quarantine': {}})
+    with pytest.raises(parser.QuarantineError):
+        stream.read('b', 'a.log', lambda meta, ev: None)
+    assert len(objects[('b', 'quarantine/a.log.jsonl')].splitlines()) == 2
+
+    # Without quarantine, the first bad record fails the object.
+    stream = parser.Stream(['s3-stream-lines', 'paloalto'], {})
+    with pytest.raises(parser.ParseError):
+        stream.read('b', 'a.log', lambda meta, ev: None)
+
+    with pytest.raises(Exception):
+        parser.Stream(['s3-stream-lines', 'paloalto'],
+                      {'quarantine': {'max_ratio': 2}})
+
+
+def test_quarantine_falcon_timestamp(monkeypatch):
+    lines = [json.dumps({'name': 'DnsRequest', 'aip': '203.0.113.1',
+                         'timestamp': ts})
+             for ts in ['1527814800000', None, 1527814800000,
+                        '2018-06-01T01:00:00Z']]
+    stream, events, bad = read(monkeypatch, ['s3-stream-lines', 'json', 'falcon'],
+                               {'quarantine': {'max_ratio': 0.5}}, lines)
+
+    assert [ev['timestamp'] for meta, ev in events] == [
+        '1527814800000', '2018-06-01T01:00:00Z']
+    assert events[0][0].timestamp == 1527814800
+    assert [(x['line'], x['reason']) for x in bad] == [
+        (2, 'ParseError: Invalid "timestamp": None'),
+        (3, 'ParseError: Invalid "timestamp": 1527814800000')]
+
+
+def test_quarantine_loop():
+    mapping = {
+        'b': [{'prefix': '', 'quarantine': {}}],
+        'c': [{'prefix': 'logs/', 'quarantine': {'bucket': 'b'}},
+              {'prefix': 'kea/', 'quarantine': {}},
+              {'prefix': 'quarantine/kea/x/'}],
+        'd': [{'prefix': 'logs/', 'quarantine': {'prefix': 'bad/'}}],
+    }
+    assert parser.Quarantine.check_mapping(mapping) == [
+        'quarantine of prefix "" of bucket "b" is uploaded to '
+        's3://b/quarantine/, which is read by prefix ""',
+        'quarantine of prefix "logs/" of bucket "c" is uploaded to '
+        's3://b/quarantine/logs/, which is read by prefix ""',
+        'quarantine of prefix "kea/" of bucket "c" is uploaded to '
+        's3://c/quarantine/kea/, which is read by prefix "quarantine/kea/x/"',
+    ]
+
+
+def test_quarantine_decoded_record(monkeypatch):
+    # The whole record is kept if it fails after decoding.
+    rec = {'message': 'hello', '@timestamp': '2018-06-01T10:00:00.000Z'}
+    lines = [json.dumps(dict(rec, type='dns')), json.dumps(rec)]
+    stream, events, bad = read(monkeypatch, ['s3-stream-lines', 'json', 'packetbeat'],
+                               {'quarantine': {'max_ratio': 0.5}}, lines)
+
+    assert len(events) == 1
+    assert [(x['line'], json.loads(x['record'])) for x in bad] == [(2, rec)]
+    assert bad[0]['reason'] == "KeyError: 'type'"
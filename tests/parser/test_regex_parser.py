@@ -0,0 +1,80 @@
+import sys
+
+import pytest
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def kea(event, msg):
+    return ('2018-06-01 10:00:00.123 INFO  [kea-dhcp4.leases/1234] {} '
+            '[hwtype=1 00:11:22:33:44:55], cid=[no info], tid=0x1: {}'
+            ''.format(event, msg))
+
+
+def test_kea():
+    lines = [kea('DHCP4_LEASE_ALLOC', 'lease 10.0.0.5 has been allocated'),
+             kea('DHCP4_INIT_REBOOT', 'client requests address 10.0.0.6'),
+             kea('DHCP4_LEASE_ADVERT', 'lease 10.0.0.7 will be advertised'),
+             kea('DHCP4_OTHER', 'lease 10.0.0.8 has been allocated'),
+             'not kea format']
+    res = helper.exec_test(parser.Kea, [{'message': x} for x in lines])
+
+    assert [d['ipaddr'] for m, d in res] == ['10.0.0.5', '10.0.0.6', '10.0.0.7']
+    m, d = res[1]
+    assert m.tag == 'kea.log'
+    assert d['event'] == 'DHCP4_INIT_REBOOT'
+    assert d['hwaddr'] == '00:11:22:33:44:55'
+    assert d['client_id'] == 'no info'
+    assert d['msg'] == 'client requests address 10.0.0.6'
+    assert d['message'] == lines[1]
+
+
+def test_kea_sub_event_mismatch():
+    with pytest.raises(parser.ParseError):
+        helper.exec_test(parser.Kea, [
+            {'message': kea('DHCP4_LEASE_ALLOC', 'lease is not allocated')}])
+
+
+def test_syslog():
+    res = helper.exec_test(parser.Syslog, [
+        {'message': 'Nov 21 06:00:24 ip-172-31-7-118 sshd[23511]: Accepted'}])
+    m, d = res[0]
+    assert d == {'datetime': 'Nov 21 06:00:24', 'hostname': 'ip-172-31-7-118',
+                 'proc_name': 'sshd', 'proc_id': '23511',
+                 'message': 'Accepted'}
+
+    with pytest.raises(parser.ParseError):
+        parser.Syslog.parse('Nov 21 06:00:24 host sshd: no pid')
+
+
+def test_syslog_single_digit_day():
+    res = helper.exec_test(parser.Syslog, [
+        {'message': 'Nov 1 06:00:24 host sshd[1]: unpadded'},
+        {'message': 'Nov  1 06:00:24 host sshd[2]: padded'}])
+    assert [d['datetime'] for m, d in res] == ['Nov 1 06:00:24', 'Nov  1 06:00:24']
+    assert res[0][0].timestamp == res[1][0].timestamp
+
+
+def test_regex_parser_events():
+    class Custom(parser.RegexParser):
+        PATTERN = r'(?P<event>{events}) (?P<body>{sub_events})'
+        EVENTS = {
+            'open':  r'(?P<path>\S+) by (?P<user>\w+)',
+            'close': r'(?P<path>\S+)',
+        }
+
+    assert Custom.match('open /tmp/a by root') == {
+        'event': 'open', 'body': '/tmp/a by root', 'path': '/tmp/a',
+        'user': 'root'}
+    assert Custom.match('close /tmp/a') == {
+        'event': 'close', 'body': '/tmp/a', 'path': '/tmp/a'}
+    assert Custom.match('rename /tmp/a /tmp/b') == {
+        'event': 'rename', 'body': '/tmp/a /tmp/b'}
+    assert Custom.match('open') is None
+
+    with pytest.raises(parser.ParseError):
+        Custom.match('close /tmp/a /tmp/b')
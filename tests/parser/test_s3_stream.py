@@ -0,0 +1,133 @@
+import gzip
+import sys
+
+import pytest
+
+import helper
+
+sys.path.insert(0, './slips/')
+
+import parser
+
+
+def test_stream_lines(monkeypatch):
+    body = b'line1\nline2\r\n\nline4'
+    objects = {('test-bucket', 'logs/a.log'): body}
+    qdata = helper.exec_spout(parser.S3StreamLines, objects,
+                              'test-bucket', 'logs/a.log', monkeypatch)
+
+    assert [d['message'] for m, d in qdata] == ['line1', 'line2', '', 'line4']
+
+
+def test_stream_lines_gzip(monkeypatch):
+    lines = ['{{"seq": {}}}'.format(i) for i in range(100000)]
+    body = gzip.compress('\n'.join(lines[:50000]).encode('utf8') + b'\n')
+    body += gzip.compress('\n'.join(lines[50000:]).encode('utf8') + b'\n')
+    objects = {('test-bucket', 'logs/a.log.gz'): body}
+    qdata = helper.exec_spout(parser.S3StreamLines, objects,
+                              'test-bucket', 'logs/a.log.gz', monkeypatch)
+
+    assert [d['message'] for m, d in qdata] == lines
+
+
+def test_split_lines_across_chunks():
+    chunks = [b'ab', b'c\nde', b'f\n', b'\ngh']
+    assert list(parser.split_lines(chunks)) == [b'abc', b'def', b'', b'gh']
+
+
+def test_stream_text(monkeypatch):
+    body = gzip.compress(b'{"Records": []}')
+    objects = {('test-bucket', 'trail.json.gz'): body}
+    qdata = helper.exec_spout(parser.S3StreamText, objects,
+                              'test-bucket', 'trail.json.gz', monkeypatch)
+
+    assert len(qdata) == 1
+    assert qdata[0][1]['message'] == '{"Records": []}'
+
+
+def test_ranged_fetch(monkeypatch):
+    lines = ['{{"seq": {}}}'.format(i) for i in range(20000)]
+    body = gzip.compress('\n'.join(lines).encode('utf8'))
+    objects = {('test-bucket', 'logs/big.log.gz'): body}
+    config = {
+        'download': {'threshold': 1024, 'chunk_size': 4096, 'parallelism': 4},
+    }
+
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+    obj = parser.S3StreamLines()
+    obj.set_config(config)
+    q = helper.Queue()
+    obj.pipe(q)
+    obj.run('test-bucket', 'logs/big.log.gz')
+
+    assert [d['message'] for m, d in q.fetch()] == lines
+    assert len(s3.ranges) == (len(body) + 4095) // 4096
+    assert s3.ranges[0] == 'bytes=0-4095'
+
+
+def test_ranged_fetch_overwritten(monkeypatch):
+    lines = ['{{"seq": {}}}'.format(i) for i in range(20000)]
+    objects = {('test-bucket', 'logs/big.log'): '\n'.join(lines).encode('utf8')}
+    config = {
+        'download': {'threshold': 1024, 'chunk_size': 4096, 'parallelism': 2},
+    }
+
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+    stream = parser.Stream(['s3-stream-lines', 'json'], config)
+    events = stream.iter('test-bucket', 'logs/big.log')
+    next(events)
+
+    objects[('test-bucket', 'logs/big.log')] = b'{"seq": -1}\n' * 20000
+    with pytest.raises(parser.slips.fetcher.ObjectChangedError):
+        list(events)
+
+
+def test_ranged_fetch_below_threshold(monkeypatch):
+    objects = {('test-bucket', 'logs/small.log'): b'a\nb\n'}
+    config = {
+        'download': {'threshold': 1024, 'chunk_size': 2, 'parallelism': 4},
+    }
+    qdata = helper.exec_spout(parser.S3StreamLines, objects, 'test-bucket',
+                              'logs/small.log', monkeypatch, config)
+
+    assert [d['message'] for m, d in qdata] == ['a', 'b']
+
+
+def test_staged_lines_mmap(monkeypatch, tmpdir):
+    fpath = tmpdir.join('lines.log')
+    fpath.write_binary(b'a \nb\n\nc')
+    assert list(parser.mmap_lines(str(fpath))) == [b'a ', b'b', b'', b'c']
+    assert list(parser.mmap_lines(str(fpath), 2)) == [b'a ', b'b', b'', b'c']
+
+    fpath.write_binary(b'')
+    assert list(parser.mmap_lines(str(fpath))) == []
+
+    objects = {('test-bucket', 'logs/a.log'): b'line1\nline2\n'}
+    qdata = helper.exec_spout(parser.S3Lines, objects,
+                              'test-bucket', 'logs/a.log', monkeypatch)
+    assert [d['message'] for m, d in qdata] == ['line1', 'line2']
+
+
+def test_lines_to_json_as_bytes(monkeypatch):
+    body = b'{"a": 1}\n{"a": "\xff"}\n{"a": 3}\n'
+    objects = {('test-bucket', 'logs/a.log'): body}
+    s3 = helper.FakeS3(objects)
+    monkeypatch.setattr(parser.slips.fetcher, 's3_client', lambda: s3)
+
+    raw = []
+
+    class Probe(parser.Json):
+        def recv_batch(self, metas, records):
+            raw.extend(d['message'] for d in records)
+            super().recv_batch(metas, records)
+
+    monkeypatch.setitem(parser.Stream.FUCTORY_MAP, 'probe-json', Probe)
+    for spout in ['s3-lines', 's3-stream-lines']:
+        stream = parser.Stream([spout, 'probe-json'])
+        qdata = []
+        stream.read('test-bucket', 'logs/a.log', lambda m, d: qdata.append(d))
+        assert all(isinstance(x, bytes) for x in raw)
+        # Undecodable line is skipped as before.
+        assert qdata == [{'a': 1}, {'a': 3}]
@@ -0,0 +1,57 @@
+import datetime
+import sys
+
+import pytest
+
+sys.path.insert(0, './slips/')
+
+import timestamp
+
+
+def local(text, fmt):
+    return datetime.datetime.strptime(text, fmt).timestamp()
+
+
+def test_parse():
+    assert timestamp.parse('2018-06-10T19:27:47.0443285Z') == \
+        local('2018-06-10T19:27:47', '%Y-%m-%dT%H:%M:%S')
+    assert timestamp.parse('2018-06-10 19:27:47.123') == \
+        local('2018-06-10 19:27:47', '%Y-%m-%d %H:%M:%S')
+    assert timestamp.parse('2018/06/10 19:27:47') == \
+        local('2018/06/10 19:27:47', '%Y/%m/%d %H:%M:%S')
+    assert timestamp.parse('2018-06-10T19:27:47Z', timestamp.UTC) == 1528658867
+
+    # Cached value is returned for the same second.
+    assert timestamp.parse('2018-06-10T19:27:47.999Z', timestamp.UTC) == 1528658867
+
+    for text in ['2018-06-10', '2018.06.10T19:27:47', '2018-06-10T19-27-47',
+                 'xxxx-06-10T19:27:47']:
+        with pytest.raises(ValueError):
+            timestamp.parse(text)
+
+
+def test_parse_iso8601():
+    assert timestamp.parse_iso8601('2018-06-10T19:27:47Z') == 1528658867
+    assert timestamp.parse_iso8601('2018-06-11T04:27:47.123+09:00') == 1528658867
+    assert timestamp.parse_iso8601('2018-06-10T18:27:47-0100') == 1528658867
+    assert timestamp.parse_iso8601('2018-06-10T19:27:47', timestamp.UTC) == 1528658867
+
+    with pytest.raises(ValueError):
+        timestamp.parse_iso8601('2018-06-10T19:27:47 JST')
+
+
+def test_parse_syslog():
+    now = timestamp.parse('2018-06-10T19:27:47', timestamp.UTC)
+    assert timestamp.parse_syslog('Jun 10 19:27:47', timestamp.UTC, now) == now
+    assert timestamp.parse_syslog('Jun  1 00:00:00', timestamp.UTC, now) == \
+        timestamp.parse('2018-06-01T00:00:00', timestamp.UTC)
+    assert timestamp.parse_syslog('Jun 1 00:00:00', timestamp.UTC, now) == \
+        timestamp.parse('2018-06-01T00:00:00', timestamp.UTC)
+
+    # Log of last December processed in January.
+    now = timestamp.parse('2018-01-01T00:00:10', timestamp.UTC)
+    assert timestamp.parse_syslog('Dec 31 23:59:59', timestamp.UTC, now) == \
+        timestamp.parse('2017-12-31T23:59:59', timestamp.UTC)
+
+    with pytest.raises(ValueError):
+        timestamp.parse_syslog('Foo 10 19:27:47')
@@ -0,0 +1,186 @@
+import asyncio
+import http.server
+import json
+import sys
+import threading
+import time
+sys.path.append('./slips/')
+
+import pytest
+
+import main
+from tests import test_main
+
+
+class Server(http.server.ThreadingHTTPServer):
+    # Stand-in of a remote API that takes DELAY seconds per request.
+    DELAY = 0.05
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.lock = threading.Lock()
+        self.paths = []
+        self.inflight = 0
+        self.max_inflight = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        srv = self.server
+        with srv.lock:
+            srv.paths.append(self.path)
+            srv.inflight += 1
+            srv.max_inflight = max(srv.max_inflight, srv.inflight)
+        time.sleep(Server.DELAY)
+        with srv.lock:
+            srv.inflight -= 1
+
+        self.send_response(500 if 'fail' in self.path else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = Server()
+    th = threading.Thread(target=srv.serve_forever, daemon=True)
+    th.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+HANDLER_CODE = '''
+import asyncio
+import urllib.parse
+
+import slips.interface
+
+
+async def get(url):
+    u = urllib.parse.urlparse(url)
+    reader, writer = await asyncio.open_connection(u.hostname, u.port)
+    writer.write('GET {} HTTP/1.0\\r\\n\\r\\n'.format(u.path).encode())
+    line = await asyncio.wait_for(reader.readline(), 5)
+    status = line.split()[1]
+    writer.close()
+    await writer.wait_closed()
+    if status != b'200':
+        raise Exception('HTTP error ' + status.decode())
+
+
+class Forwarder(slips.interface.AsyncHandler):
+    def setup(self, args):
+        self._url = args['url']
+        self._done = 0
+
+    def begin(self):
+        self._done = 0
+
+    async def recv(self, meta, event):
+        await get('{}/{}'.format(self._url, event['seq']))
+        self._done += 1
+
+    def key(self, meta, event):
+        return event.get('key')
+
+    def result(self):
+        return self._done
+'''
+
+
+def load(tmpdir, url):
+    tmpdir.join('async_handler.py').write(HANDLER_CODE)
+    cls = main.load_handler_classes(str(tmpdir.join('async_handler.py')))[0]
+    hdlr = cls()
+    hdlr.setup({'url': url})
+    return hdlr
+
+
+def test_async_concurrency(tmpdir, server):
+    hdlr = load(tmpdir, server.url)
+    runner = main.AsyncRunner(hdlr, {'concurrency': 8})
+    try:
+        for i in range(40):
+            runner.recv(None, {'seq': i})
+        runner.flush()
+    finally:
+        runner.close()
+
+    # Requests overlap up to the limit.
+    assert hdlr.result() == 40
+    assert 1 < server.max_inflight <= 8
+
+
+def test_async_order_by_key(tmpdir, server):
+    hdlr = load(tmpdir, server.url)
+    runner = main.AsyncRunner(hdlr, {'concurrency': 8})
+    try:
+        for i in range(30):
+            runner.recv(None, {'seq': i, 'key': i % 3})
+        runner.flush()
+    finally:
+        runner.close()
+
+    # Events of a key are sent one by one in order, and keys in parallel.
+    seqs = [int(x[1:]) for x in server.paths]
+    for key in range(3):
+        assert [x for x in seqs if x % 3 == key] == list(range(key, 30, 3))
+    assert 1 < server.max_inflight <= 3
+
+
+def test_async_backpressure(tmpdir):
+    class Slow(main.slips.interface.AsyncHandler):
+        QUEUE_SIZE = 4
+
+        def setup(self, args):
+            self.done = 0
+
+        async def recv(self, meta, event):
+            await asyncio.sleep(0.01)
+            self.done += 1
+
+        def result(self):
+            return self.done
+
+    hdlr = Slow()
+    hdlr.setup({})
+    runner = main.AsyncRunner(hdlr)
+    try:
+        for i in range(20):
+            runner.recv(None, {})
+            # recv() returns after the event is accepted, before it is done.
+            assert i + 1 - hdlr.done <= Slow.QUEUE_SIZE + 1
+        runner.flush()
+    finally:
+        runner.close()
+    assert hdlr.done == 20
+
+
+def test_async_main(tmpdir, monkeypatch, server):
+    monkeypatch.setattr(main, 'create_parser', lambda *args: test_main.FakeStream())
+    tmpdir.join('async_handler.py').write(
+        HANDLER_CODE + test_main.HANDLER_CODE.split('class Broken')[0]
+        .replace('import slips.interface', ''))
+    args = test_main.make_args(tmpdir)
+    args['HANDLER_PATH'] = str(tmpdir.join('async_handler.py'))
+    args['HANDLER_ARGS'] = json.dumps({'url': server.url})
+    args['HANDLER_ASYNC'] = json.dumps({'concurrency': 2})
+    targets = [{'bucket_name': 'test-bucket', 'object_key': 'a.log'}]
+
+    res = main.main(args, targets)
+    assert sorted(v for k, v in res.items()) == [5, 5]
+
+    # An error of the handler is isolated from others.
+    args['HANDLER_ARGS'] = json.dumps({'url': server.url + '/fail'})
+    with pytest.raises(main.HandlerError) as e:
+        main.main(args, targets)
+    assert 'Forwarder' in str(e.value)
+    assert 'Counter' not in str(e.value)
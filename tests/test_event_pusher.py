@@ -8,3 +8,20 @@ import event_pusher
 def test_event_pusher():
     assert event_pusher.main is not None
     
+
+
+def test_routing():
+    policy = json.dumps([{'bucket': 'b1', 'prefix': 'slow/', 'dest': 'slow'},
+                         {'prefix': 'drop/', 'dest': 'drop'},
+                         {'dest': 'fast'}])
+    routes = {'fast': 'stream-fast', 'slow': 'stream-slow', 'drop': None}
+    router = event_pusher.get_router(policy)
+    assert event_pusher.get_router(policy) is router
+
+    def route(s3_bucket, s3_key):
+        ev = {'bucket_name': s3_bucket, 'object_key': s3_key}
+        return event_pusher.routing(ev, router, routes)
+
+    assert route('b1', 'slow/a.log') == 'stream-slow'
+    assert route('b2', 'slow/a.log') == 'stream-fast'
+    assert route('b2', 'drop/a.log') is None
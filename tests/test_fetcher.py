@@ -0,0 +1,54 @@
+import sys
+import threading
+sys.path.append('./slips/')
+
+import pytest
+
+import fetcher
+
+
+def test_prefetcher_order():
+    def job(n):
+        return lambda: (bytes([n]) * 3 for _ in range(n))
+
+    pf = fetcher.Prefetcher(2, queue_size=2)
+    results = [list(src) for src in pf.run([job(n) for n in range(1, 6)])]
+    assert results == [[bytes([n]) * 3] * n for n in range(1, 6)]
+
+
+def test_prefetcher_overlap():
+    started = threading.Event()
+
+    def first():
+        # Next object must be opened while the first one is still consumed.
+        assert started.wait(5)
+        yield b'first'
+
+    def second():
+        started.set()
+        yield b'second'
+
+    pf = fetcher.Prefetcher(1)
+    results = [b''.join(src) for src in pf.run([first, second])]
+    assert results == [b'first', b'second']
+
+
+def test_prefetcher_not_prefetchable_and_error():
+    def broken():
+        yield b'ok'
+        raise ValueError('broken')
+
+    pf = fetcher.Prefetcher(1)
+    sources = pf.run([lambda: None, broken])
+    assert next(sources) is None
+
+    src = next(sources)
+    assert next(src) == b'ok'
+    with pytest.raises(ValueError):
+        next(src)
+    sources.close()
+
+
+def test_prefetcher_disabled():
+    pf = fetcher.Prefetcher(0)
+    assert [list(src) for src in pf.run([lambda: iter([b'a', b'b'])])] == [[b'a', b'b']]
@@ -0,0 +1,372 @@
+import json
+import sys
+import time
+sys.path.append('./slips/')
+
+import pytest
+
+import main
+
+
+HANDLER_CODE = '''
+import slips.interface
+
+
+class Counter(slips.interface.Handler):
+    def setup(self, args):
+        self._count = 0
+
+    def recv(self, meta, event):
+        self._count += 1
+
+    def result(self):
+        return self._count
+
+
+class Broken(slips.interface.Handler):
+    def setup(self, args):
+        pass
+
+    def recv(self, meta, event):
+        if event['seq'] == 2:
+            raise Exception('broken')
+
+    def result(self):
+        return 'ok'
+'''
+
+
+class FakeStream:
+    reads = []
+
+    def open(self, s3_bucket, s3_key):
+        return None
+
+    def read(self, s3_bucket, s3_key, callback, source=None):
+        FakeStream.reads.append((s3_bucket, s3_key))
+        for i in range(5):
+            callback(None, {'seq': i})
+
+
+def make_args(tmpdir):
+    fpath = tmpdir.join('fanout_handlers.py')
+    fpath.write(HANDLER_CODE)
+    return {
+        'HANDLER_PATH': str(fpath),
+        'HANDLER_ARGS': json.dumps({}),
+        'BUCKET_MAPPING': json.dumps({}),
+    }
+
+
+def test_fanout_single_pass(tmpdir, monkeypatch):
+    FakeStream.reads = []
+    monkeypatch.setattr(main, 'create_parser', lambda *args: FakeStream())
+    events = [
+        {'bucket_name': 'test-bucket', 'object_key': 'a.log'},
+        {'bucket_name': 'test-bucket', 'object_key': 'b.log'},
+    ]
+
+    with pytest.raises(main.HandlerError):
+        main.main(make_args(tmpdir), events)
+
+    # Each object is read once even if there are multiple handlers.
+    assert FakeStream.reads == [('test-bucket', 'a.log'),
+                                ('test-bucket', 'b.log')]
+
+
+def test_fanout_isolation():
+    class Counter:
+        def __init__(self):
+            self.count = 0
+
+        def recv(self, meta, event):
+            self.count += 1
+
+    class Broken:
+        def recv(self, meta, event):
+            raise Exception('broken')
+
+    counter, broken = Counter(), Broken()
+    fanout = main.FanOut([broken, counter])
+    for i in range(3):
+        fanout.recv(None, {'seq': i})
+
+    assert counter.count == 3
+    assert list(fanout.errors.keys()) == [main.handler_name(broken)]
+
+
+def test_fanout_copies():
+    class Modifier:
+        def __init__(self):
+            self.events = []
+
+        def recv(self, meta, event):
+            self.events.append((meta, event))
+            meta.tag = 'modified'
+            event['seq'] = -1
+
+    class Reader(Modifier):
+        READ_ONLY = True
+
+        def recv(self, meta, event):
+            self.events.append((meta, event))
+
+    # Handlers that may modify events get their own copies.
+    handlers = [Modifier(), Modifier()]
+    main.FanOut(handlers).recv(main.slips.parser.MetaData(), {'seq': 1})
+    assert [e for h in handlers for m, e in h.events] == [{'seq': -1}] * 2
+    assert handlers[0].events[0][1] is not handlers[1].events[0][1]
+
+    meta = main.slips.parser.MetaData()
+    meta.tag = 'orig'
+    event = {'seq': 1}
+    readers = [Reader(), Reader()]
+    modifier = Modifier()
+    main.FanOut([readers[0], modifier, readers[1]]).recv(meta, event)
+    assert readers[0].events == readers[1].events == [(meta, event)]
+    assert readers[0].events[0][1] is event
+    assert (meta.tag, event) == ('orig', {'seq': 1})
+    assert modifier.events[0][1] == {'seq': -1}
+
+
+def test_fanout_copies_projected():
+    class Modifier:
+        def __init__(self):
+            self.events = []
+
+        def recv(self, meta, event):
+            self.events.append(event['httpRequest']['clientIp'])
+            event['httpRequest']['clientIp'] = 'modified'
+
+    # Derived fields of projected records are not shared between copies.
+    stream = main.slips.parser.Stream(
+        ['s3-stream-lines', 'json', 'aws-waf'],
+        {'projection': ['action', 'httpRequest']})
+    line = json.dumps({'action': 'BLOCK', 'timestamp': 1528658867000,
+                       'httpRequest': {'clientIp': '10.0.0.1', 'uri': '/a',
+                                       'headers': []}})
+    handlers = [Modifier(), Modifier()]
+    fanout = main.FanOut(handlers)
+    stream.read('b', 'a.log', fanout.recv, [line.encode('utf8')])
+
+    assert [h.events for h in handlers] == [['10.0.0.1'], ['10.0.0.1']]
+
+
+def test_filter_stats(tmpdir, monkeypatch):
+    class FilteredStream(FakeStream):
+        stats = {'filtered': 3, 'passed': 5}
+
+    monkeypatch.setattr(main, 'create_parser', lambda *args: FilteredStream())
+    args = make_args(tmpdir)
+    args['HANDLER_PATH'] = str(tmpdir.join('counter_handler.py'))
+    tmpdir.join('counter_handler.py').write(HANDLER_CODE.split('class Broken')[0])
+
+    res = main.main(args, [{'bucket_name': 'test-bucket', 'object_key': 'a.log'}])
+    assert res['filter'] == {'test-bucket/a.log': {'filtered': 3, 'passed': 5}}
+    assert [v for k, v in res.items() if k.endswith('.Counter')] == [5]
+
+
+PERSISTENT_CODE = '''
+import slips.interface
+
+SETUP = []
+
+
+class Persistent(slips.interface.Handler):
+    def setup(self, args):
+        SETUP.append(self)
+
+    def begin(self):
+        self._count = 0
+
+    def recv(self, meta, event):
+        self._count += 1
+        if event.get('fail'):
+            raise Exception('broken')
+
+    def result(self):
+        return self._count
+
+
+class Legacy(slips.interface.Handler):
+    def setup(self, args):
+        SETUP.append(self)
+        self._count = 0
+
+    def recv(self, meta, event):
+        self._count += 1
+
+    def result(self):
+        return self._count
+'''
+
+
+def test_runtime_cache(tmpdir, monkeypatch):
+    events = []
+
+    class Stream(FakeStream):
+        def read(self, s3_bucket, s3_key, callback, source=None):
+            for ev in events:
+                callback(None, ev)
+
+    monkeypatch.setattr(main, 'create_parser', lambda *args: Stream())
+    monkeypatch.setattr(main, '_RUNTIME', None)
+    tmpdir.join('persistent_handler.py').write(PERSISTENT_CODE)
+    args = make_args(tmpdir)
+    args['HANDLER_PATH'] = str(tmpdir.join('persistent_handler.py'))
+    targets = [{'bucket_name': 'test-bucket', 'object_key': 'a.log'}]
+
+    def invoke():
+        res = main.main(dict(args), targets)
+        return sorted((k.split('.')[-1], v) for k, v in res.items())
+
+    events[:] = [{}, {}]
+    assert invoke() == [('Legacy', 2), ('Persistent', 2)]
+    runtime = main._RUNTIME
+    mod = sys.modules[runtime._classes[0].__module__]
+    assert invoke() == [('Legacy', 2), ('Persistent', 2)]
+
+    # Persistent handler is set up once, and the other for each invocation.
+    assert main._RUNTIME is runtime
+    assert [type(x).__name__ for x in mod.SETUP] == [
+        'Legacy', 'Persistent', 'Legacy']
+
+    # A handler that raised is set up again.
+    events[:] = [{'fail': True}]
+    with pytest.raises(main.HandlerError):
+        invoke()
+    events[:] = [{}]
+    assert invoke() == [('Legacy', 1), ('Persistent', 1)]
+    assert [type(x).__name__ for x in mod.SETUP].count('Persistent') == 2
+
+    # Changed environment builds a new runtime.
+    args['HANDLER_ARGS'] = json.dumps({'a': 1})
+    invoke()
+    assert main._RUNTIME is not runtime
+
+
+def test_create_parser():
+    mapping = main.slips.utils.compile_mapping({'b': [
+        {'prefix': 'logs/', 'format': ['s3-stream-lines', 'json']},
+        {'prefix': 'logs/kea/', 'format': ['s3-stream-lines', 'kea']},
+    ]})
+    stream = main.create_parser(mapping, 'b', 'logs/kea/a.log')
+    assert isinstance(stream._root._dst, main.slips.parser.Fused)
+
+    with pytest.raises(main.FormatError):
+        main.create_parser(mapping, 'b', 'other/a.log')
+    with pytest.raises(main.FormatError):
+        main.create_parser(mapping, 'x', 'logs/a.log')
+
+
+BATCH_CODE = '''
+import slips.interface
+
+
+class Buffered(slips.interface.BatchHandler):
+    BATCH_SIZE = 2
+
+    def setup(self, args):
+        self._batches = []
+
+    def recv_batch(self, records):
+        self._batches.append([ev['seq'] for meta, ev in records])
+
+    def result(self):
+        return self._batches
+
+
+class BrokenBatch(slips.interface.BatchHandler):
+    def setup(self, args):
+        pass
+
+    def recv_batch(self, records):
+        raise Exception('broken')
+
+    def result(self):
+        return 'ok'
+'''
+
+
+def test_batch_handler(tmpdir, monkeypatch):
+    monkeypatch.setattr(main, 'create_parser', lambda *args: FakeStream())
+    tmpdir.join('batch_handler.py').write(BATCH_CODE)
+    args = make_args(tmpdir)
+    args['HANDLER_PATH'] = str(tmpdir.join('batch_handler.py'))
+    targets = [{'bucket_name': 'test-bucket', 'object_key': 'a.log'}]
+
+    # The last batch is flushed before result(), and an error of flush is
+    # isolated as recv().
+    with pytest.raises(main.HandlerError) as e:
+        main.main(args, targets)
+    assert 'BrokenBatch' in str(e.value)
+    runtime = main._RUNTIME
+
+    handlers = runtime.handlers()
+    fanout = main.FanOut(handlers, {'size': 3})
+    for i in range(5):
+        fanout.recv(None, {'seq': i})
+    fanout.flush()
+    assert handlers[1].result() == [[0, 1, 2], [3, 4]]
+    assert list(fanout.errors) == [main.handler_name(handlers[0])]
+
+
+def test_batch_limits():
+    class Sink(main.slips.interface.BatchHandler):
+        def setup(self, args):
+            self.batches = []
+
+        def recv_batch(self, records):
+            self.batches.append(len(records))
+
+        def result(self):
+            return None
+
+        def size(self, meta, event):
+            return 10
+
+    hdlr = Sink()
+    hdlr.setup({})
+    batch = main.Batch(hdlr, {'bytes': 25})
+    for i in range(7):
+        batch.recv(None, {})
+    batch.flush()
+    assert hdlr.batches == [3, 3, 1]
+
+    hdlr.setup({})
+    batch = main.Batch(hdlr, {'latency': 0.05})
+    batch.recv(None, {})
+    time.sleep(0.1)
+    batch.recv(None, {})
+    assert hdlr.batches == [2]
+
+
+FROM_IMPORT_CODE = '''
+from slips.interface import Handler, BatchHandler, AsyncHandler
+
+
+class Counter(BatchHandler):
+    def setup(self, args):
+        self.records = 0
+
+    def recv_batch(self, records):
+        self.records += len(records)
+
+    def result(self):
+        return self.records
+'''
+
+
+def test_load_handler_classes_from_import(tmpdir):
+    fpath = tmpdir.join('from_import_handler.py')
+    fpath.write(FROM_IMPORT_CODE)
+    classes = main.load_handler_classes(str(fpath))
+    assert [cls.__name__ for cls in classes] == ['Counter']
+
+
+def test_runtime_quarantine_loop(tmpdir):
+    args = make_args(tmpdir)
+    args['BUCKET_MAPPING'] = json.dumps({'b': [
+        {'prefix': '', 'format': ['s3-lines', 'json'], 'quarantine': {}}]})
+    with pytest.raises(Exception, match='quarantine of prefix'):
+        main.Runtime(args)
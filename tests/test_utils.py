@@ -0,0 +1,77 @@
+import random
+import sys
+sys.path.append('./slips/')
+
+import utils
+
+
+def test_prefix_trie():
+    trie = utils.PrefixTrie([('logs/', 1), ('', 0), ('logs/a/', 2),
+                             ('logs/a/', 3), ('other/', 4)])
+    assert trie.matches('logs/a/b.log') == [2, 3, 1, 0]
+    assert trie.matches('logs/b.log') == [1, 0]
+    assert trie.longest('x') == 0
+    assert utils.PrefixTrie([('a', 1)]).longest('b') is None
+    assert sorted(trie.items()) == [('', [0]), ('logs/', [1]),
+                                    ('logs/a/', [2, 3]), ('other/', [4])]
+
+
+def test_check_mapping():
+    mapping = {
+        'b1': [{'prefix': 'logs/'}, {'prefix': 'logs/a/'}, {'prefix': 'x/'}],
+        'b2': [{'prefix': 'logs/'}, {'prefix': 'logs/'}],
+    }
+    errors, warnings = utils.check_mapping(mapping)
+    assert errors == ['2 entries for the same prefix "logs/" of bucket "b2"']
+    assert warnings == ['prefix "logs/a/" of bucket "b1" overlaps with '
+                        '"logs/", the longer one is used']
+
+    assert utils.compile_mapping(mapping)['b1'].longest('logs/a/1.log') == \
+        {'prefix': 'logs/a/'}
+
+
+def linear_route(policies, s3_bucket, s3_key):
+    for policy in policies:
+        if 'bucket' in policy and policy['bucket'] != s3_bucket:
+            continue
+        if 'prefix' in policy and not s3_key.startswith(policy['prefix']):
+            continue
+        return policy
+    return None
+
+
+def test_router():
+    rand = random.Random(1)
+    prefixes = ['', 'a/', 'a/b/', 'a/c/', 'b/', 'b/a/']
+    buckets = ['b1', 'b2', 'b3']
+
+    for _ in range(50):
+        policies = []
+        for i in range(rand.randint(1, 8)):
+            policy = {'dest': str(i)}
+            if rand.random() < 0.7:
+                policy['bucket'] = rand.choice(buckets)
+            if rand.random() < 0.8:
+                policy['prefix'] = rand.choice(prefixes)
+            policies.append(policy)
+
+        router = utils.Router(policies)
+        for s3_bucket in buckets:
+            for prefix in prefixes:
+                key = prefix + 'x.log'
+                assert router.route(s3_bucket, key) is \
+                    linear_route(policies, s3_bucket, key)
+
+
+def test_check_routing():
+    policies = [
+        {'bucket': 'b1', 'prefix': 'a/', 'dest': 'fast'},
+        {'bucket': 'b1', 'prefix': 'a/b/', 'dest': 'slow'},
+        {'prefix': 'a/', 'dest': 'slow'},
+        {'dest': 'drop'},
+        {'bucket': 'b2', 'dest': 'fast'},
+    ]
+    errors = utils.check_routing(policies)
+    assert len(errors) == 2
+    assert errors[0].startswith('routing policy #1 ')
+    assert errors[1].startswith('routing policy #4 ')